@@ -0,0 +1,29 @@
+"""
+Description:
+  Mixins for views of users.
+
+Table Of Contents:
+  - UserLookupMixin: get the user of a view by case-insensitive username
+"""
+
+from blabbit.apps.account.utils import get_user_or_404
+
+
+class UserLookupMixin(object):
+    """
+    Mixin for views of a single user, that gets the user named by the view's
+    lookup URL keyword argument with `get_user_or_404` rather than filtering
+    the queryset. So the lookup is shared with permission checks and
+    serializer selection in the same request.
+    """
+    
+    def get_object(self, queryset=None):
+        """
+        Get the user named in the URL, checking the requester's permissions on
+        it.
+        """
+        user = get_user_or_404(self.kwargs[self.lookup_url_kwarg],
+                               self.request)
+        # May raise a permission denied
+        self.check_object_permissions(self.request, user)
+        return user
@@ -1,10 +1,18 @@
-from django.db import models
+from django.db import models, transaction
+from django.db.models import F
 from django.contrib.auth.models import AbstractUser
 from django.core.urlresolvers import reverse
+from django.conf import settings
 
 from imagekit.models import ImageSpecField
 from imagekit.processors import SmartResize, Adjust
-from blabbit.utils import get_upload_path
+from blabbit.apps.media.blobs import get_content_path, acquire_image, \
+    release_image
+from blabbit.apps.media.backends import forget_state, regenerate_cachefile
+from blabbit.apps.media.urlcache import get_thumbnail_url, discard_urls
+from blabbit.apps.media.renditions import get_rendition_urls, \
+    schedule_renditions, delete_renditions
+from blabbit.apps.conversation.trending import remove_trending_events
 
 import binascii
 import os
@@ -13,7 +21,7 @@ import os
 
 # HELPER FUNCTIONS
 def get_avatar_path(instance, filename):
-    return get_upload_path(instance, filename, 'img/u/')
+    return get_content_path(instance.avatar, 'img/u/')
 
 
 class User(AbstractUser):
@@ -56,7 +64,14 @@ class User(AbstractUser):
         get url of avatar's thumbnail. If there isn't an avatar_thumbnail then
         return an empty string
         """
-        return self.avatar_thumbnail.url if self.avatar_thumbnail else ''
+        return get_thumbnail_url(self, 'avatar_thumbnail', self.avatar)
+    
+    def get_avatar_renditions(self):
+        """
+        get urls of avatar's renditions. If there isn't an avatar or its
+        renditions haven't been generated yet then return an empty dictionary
+        """
+        return get_rendition_urls(self.avatar)
         
     def get_full_name(self):
         """
@@ -92,7 +107,8 @@ class User(AbstractUser):
     
     def delete_avatar_files(self, instance):
         """
-        Delete a user's avatar files in storage
+        Delete a user's avatar files in storage. Identical avatars share files,
+        so this only happens when the last user with this avatar lets go of it.
         - First delete the user's ImageCacheFiles on storage. The reason this 
           must happen first is that deleting source file deletes the associated 
           ImageCacheFile references but not the actual ImageCacheFiles in 
@@ -108,10 +124,20 @@ class User(AbstractUser):
         Author:      
           Nnoduka Eruchalu
         """
-        # get avatar_thumbnail location and delete it
-        instance.avatar_thumbnail.storage.delete(instance.avatar_thumbnail.name)
-        # delete avatar
-        instance.avatar.delete()
+        with release_image(instance.avatar) as last_reference:
+            if last_reference:
+                # get avatar_thumbnail location and delete it along with the
+                # avatar renditions, in one batch
+                delete_renditions(instance.avatar,
+                                  [instance.avatar_thumbnail.name])
+                # forget the thumbnail's state, so it isn't taken to exist if
+                # the avatar is stored again
+                forget_state(instance.avatar_thumbnail)
+                # discard the URLs once the files are gone, so they can't be
+                # cached again in the meantime
+                discard_urls(instance.avatar.name)
+                # delete avatar
+                instance.avatar.delete()
     
     
     def __init__(self, *args, **kwargs):
@@ -121,8 +147,8 @@ class User(AbstractUser):
     
     def save(self, *args, **kwargs):
         """
-        On instance save ensure old image files are deleted if images are 
-        updated.
+        On instance save store new images by their content, and ensure old
+        image files are deleted if images are updated.
                             
         Arguments:   
           - args: all positional arguments
@@ -133,13 +159,38 @@ class User(AbstractUser):
         Author:
           Nnoduka Eruchalu
         """
-        if self.__original_avatar and self.avatar != self.__original_avatar:
-            # avatar has changed and this isn't the first avatar upload, so
-            # delete old files.
-            orig = User.objects.get(pk=self.pk)
-            self.delete_avatar_files(orig)
-                    
-        super(User, self).save(*args, **kwargs)
+        avatar_uploaded = self.avatar and not self.avatar._committed
+        avatar_stored = False
+        # the new avatar's reference, the old avatar's release and the user's
+        # row are saved together, so a failed save doesn't leak a reference
+        with transaction.atomic():
+            if avatar_uploaded:
+                # store the new avatar (first, so that re-uploading the old
+                # avatar doesn't delete its files)
+                avatar_stored = acquire_image(self.avatar)
+            if avatar_stored:
+                # generate the thumbnail whatever state an earlier copy of the
+                # avatar left. It's marked as being generated so imagekit
+                # doesn't queue it again when the avatar is saved
+                regenerate_cachefile(self.avatar_thumbnail)
+            
+            orig = None
+            if self.__original_avatar and (
+                avatar_uploaded or self.avatar != self.__original_avatar):
+                # avatar has changed and this isn't the first avatar upload,
+                # so old files will be deleted.
+                orig = User.objects.get(pk=self.pk)
+                
+            super(User, self).save(*args, **kwargs)
+            if orig is not None:
+                # release the old avatar once the user is saved without it, so
+                # its files are never deleted by a save that fails
+                self.delete_avatar_files(orig)
+        
+        if avatar_stored:
+            # generate renditions of the new avatar in the background. Avatars
+            # that were already stored already have renditions
+            schedule_renditions(self.avatar)
         # update the image file tracking properties
         self.__original_avatar = self.avatar
                 
@@ -163,13 +214,24 @@ class User(AbstractUser):
             self.delete_avatar_files(self)
             
         
-        # get liked rooms for cleanup after delete
-        liked_rooms = self.likes.all()
-        super(User, self).delete(*args, **kwargs)
-        
-        # updated likes_count of all liked rooms by forcing saves
-        for room in liked_rooms:
-            room.save()
+        with transaction.atomic():
+            # take this user's likes and memberships out of the likes_count
+            # and members_count of all their rooms, with one query each rather
+            # than re-counting each room's likes
+            self.likes.update(likes_count=F('likes_count') - 1)
+            self.rooms.update(members_count=F('members_count') - 1)
+            # and out of the rooms' trending scores, taking out exactly what
+            # liking and joining added
+            events = [
+                (room_id, settings.TRENDING_LIKE_WEIGHT, created_at)
+                for (room_id, created_at) in
+                self.room_likes.values_list('room_id', 'created_at')]
+            events += [
+                (room_id, settings.TRENDING_MEMBER_WEIGHT, created_at)
+                for (room_id, created_at) in
+                self.room_memberships.values_list('room_id', 'created_at')]
+            remove_trending_events(events)
+            super(User, self).delete(*args, **kwargs)
 
 class AuthToken(models.Model):
     """
@@ -3,7 +3,7 @@ Object level permissions
 """
 
 from rest_framework import permissions
-from blabbit.apps.account.models import User
+from blabbit.apps.account.utils import get_user_by_username
 
 class IsOwnerOrReadOnly(permissions.BasePermission):
     """
@@ -26,25 +26,19 @@ class IsDetailOwner(permissions.BasePermission):
     Custom permission to allow views only to be visible to the actual user
     who owns the data at that detail view.
     
-    Expects to be used on a detail view or a view with a lookup_field
+    Expects to be used on a view whose lookup_url_kwarg names the username in
+    the URL. The user is looked up case-insensitively with get_user_by_username.
     """
     
     def has_permission(self, request, view):
         user_owns_detail_view = False
         
-        try:
-            lookup_url_kwarg = view.lookup_url_kwarg or view.lookup_field
-            lookup = view.kwargs.get(lookup_url_kwarg, None)
-            
-            if lookup is not None:
-                filter_kwargs = {view.lookup_field: lookup}
-                user_object = User.objects.get(**filter_kwargs)
-                
-                if request.user == user_object:
-                    user_owns_detail_view = True
+        lookup = view.kwargs.get(view.lookup_url_kwarg, None)
         
-        except User.DoesNotExist:
-            pass # user_owns_detail_view already set
+        if lookup is not None:
+            user_object = get_user_by_username(lookup, request)
+            if user_object is not None and request.user == user_object:
+                user_owns_detail_view = True
         
         # permissions are only allowed to owner of the detail.
         return user_owns_detail_view
@@ -5,7 +5,11 @@ instances into representations such as json.
 
 from rest_framework import serializers
 from blabbit.apps.account.models import User
+from blabbit.apps.account.utils import get_user_by_username
 from blabbit.apps.relationship.utils import get_contacts
+from blabbit.apps.media.ingest import ingest_image
+from blabbit.apps.rest.fields import HyperlinkedIdentityField
+from blabbit.apps.rest.serializers import CompiledSerializer, format_datetime
 from blabbit.utils import human_readable_size
 
 from django.contrib.auth import authenticate
@@ -22,15 +26,15 @@ class UserSerializer(serializers.HyperlinkedModelSerializer):
     - 'email'
     """
     # url field should lookup by 'username' not the 'pk'
-    url = serializers.HyperlinkedIdentityField(
-        view_name='user-detail',
-        lookup_field='username')
+    url = HyperlinkedIdentityField(view_name='user-detail',
+                                   lookup_field='username')
     
     # an untyped Field class, in contrast to the other typed fields such as
     # CharField, is always read-only. 
     # it will be used for serialized representations, but will not be used for
     # updating model instances when they are deserialized
     avatar_thumbnail = serializers.Field(source='get_avatar_thumbnail_url')
+    avatar_renditions = serializers.Field(source='get_avatar_renditions')
     
     # uncomment this to specify if this user is in requester's contact list
     # is_contact = serializers.SerializerMethodField('get_is_contact')
@@ -47,20 +51,20 @@ class UserSerializer(serializers.HyperlinkedModelSerializer):
     # rooms = serializers.RelatedField(many=True, read_only=True)
     
     # show a link to the collection of a user's rooms
-    rooms_url = serializers.HyperlinkedIdentityField(view_name='user-room-list',
-                                                     lookup_field='username')
+    rooms_url = HyperlinkedIdentityField(view_name='user-room-list',
+                                         lookup_field='username')
     
     # add max length check to email checks but keep it optional
     email = serializers.EmailField(max_length=254, required=False)
     
     # show a link to the collection of a user's contacts
-    contacts_url = serializers.HyperlinkedIdentityField(
-        view_name='user-contact-list', lookup_field='username')
+    contacts_url = HyperlinkedIdentityField(view_name='user-contact-list',
+                                            lookup_field='username')
     
     class Meta:
         model = User
         fields = ('url', 'id', 'username', 'first_name', 'avatar_thumbnail',
-                  'avatar', 'last_modified', 
+                  'avatar_renditions', 'avatar', 'last_modified', 
                   'email', 'rooms_url', 'contacts_url')
         read_only_fields = ('id','username', 'last_modified')
         write_only_fields = ('avatar',)
@@ -69,7 +73,8 @@ class UserSerializer(serializers.HyperlinkedModelSerializer):
         
     def validate_avatar(self, attrs, source):
         """
-        Check that the uploaded file size is within allowed limits
+        Check that the uploaded file size is within allowed limits, then
+        prepare the image for storage
         """
         imgfile = attrs.get(source, False)
         if imgfile and imgfile.size > settings.MAX_IMAGE_SIZE:
@@ -78,6 +83,10 @@ class UserSerializer(serializers.HyperlinkedModelSerializer):
                 % (human_readable_size(settings.MAX_IMAGE_SIZE), 
                    human_readable_size(imgfile.size)))
         
+        if imgfile:
+            # scale down, make upright and strip metadata before storage
+            attrs[source] = ingest_image(imgfile)
+        
         return attrs
     
     def get_is_contact(self, obj):
@@ -106,10 +115,31 @@ class UserPublicOnlySerializer(UserSerializer):
     class Meta:
         model = User
         fields = ('url', 'id', 'username', 'first_name', 'avatar_thumbnail', 
-                  'last_modified',)
+                  'avatar_renditions', 'last_modified',)
         read_only_fields = ('id', 'username', 'first_name', 'last_modified')
 
 
+class CompiledUserPublicOnlySerializer(CompiledSerializer):
+    """
+    Precompiled serializer for views listing users, with the same output as
+    UserPublicOnlySerializer.
+    """
+    model = User
+    columns = ('id', 'username', 'first_name', 'avatar', 'last_modified')
+    fields = UserPublicOnlySerializer.Meta.fields
+    view_name = 'user-detail'
+    lookup_field = 'username'
+    
+    def get_avatar_thumbnail(self, row):
+        return self.get_image_thumbnail_url(row, 'avatar', 'avatar_thumbnail')
+    
+    def get_avatar_renditions(self, row):
+        return self.get_image_renditions(row, 'avatar')
+    
+    def get_last_modified(self, row):
+        return format_datetime(row['last_modified'])
+
+
 class UserCreationSerializer(UserSerializer):
     """
     Serializer to be used for creating users.
@@ -147,12 +177,8 @@ class UserCreationSerializer(UserSerializer):
         attrs[source] = attrs[source].lower()
         value = attrs[source]
         
-        try:
-            user = User.objects.get(username__iexact=value)
-            if user:
-                raise serializers.ValidationError("User with this Username already exists.")
-        except User.DoesNotExist:
-            pass
+        if get_user_by_username(value) is not None:
+            raise serializers.ValidationError("User with this Username already exists.")
         return attrs
 
 class PasswordResetSerializer(UserSerializer):
@@ -0,0 +1,23 @@
+/*
+ * Custom SQL that is executed just after the CREATE TABLE statements when you
+ * run syncdb.
+ * Will use this to add the indexes used for searching and looking up users.
+ */
+
+-- case-insensitive username lookups, as done by
+-- `blabbit.apps.account.utils.get_user_by_username`
+CREATE INDEX i_account_user_lower_username ON account_user 
+  USING btree (lower(username));
+
+-- full-text and trigram indexes used by the `search` app's `postgres` backend.
+-- The text search expression must match the one built by
+-- `blabbit.apps.search.postgres.get_search_vector` for it to be used.
+CREATE EXTENSION IF NOT EXISTS pg_trgm;
+CREATE INDEX i_account_user_name_tsv ON account_user 
+  USING gin (to_tsvector('simple', 
+                         coalesce(username, '') || ' ' || 
+                         coalesce(first_name, '')));
+CREATE INDEX i_account_user_username_trgm ON account_user 
+  USING gin (username gin_trgm_ops);
+CREATE INDEX i_account_user_first_name_trgm ON account_user 
+  USING gin (first_name gin_trgm_ops);
@@ -1,3 +1,82 @@
+from django.contrib.auth.models import AnonymousUser
 from django.test import TestCase
+from django.test.client import RequestFactory
+
+from rest_framework.renderers import JSONRenderer
+
+from blabbit.apps.account.models import User
+from blabbit.apps.account.serializers import UserPublicOnlySerializer, \
+    CompiledUserPublicOnlySerializer
+from blabbit.apps.conversation.models import Room
+from blabbit.apps.media.urlcache import cache_urls, discard_urls, \
+    THUMBNAIL, RENDITIONS
 
 # Create your tests here.
+
+class CompiledUserPublicOnlySerializerTest(TestCase):
+    """
+    Check that CompiledUserPublicOnlySerializer gives the same JSON as
+    UserPublicOnlySerializer, for rows from `QuerySet.values()` (as room member
+    lists list them) and for model instances (as search results list them).
+    """
+
+    avatar = 'img/u/9c/41d2e3f4a5b6c7d8e9f0a1b2c3d4e5f6a7b8c9d0.png'
+
+    def setUp(self):
+        User.objects.create_user('plain', password='password')
+        user = User.objects.create_user('named', password='password')
+        user.first_name = 'Named'
+        user.avatar = self.avatar
+        user.save()
+
+        # the avatar's files aren't in storage, so give both serializers the
+        # same cached URLs
+        cache_urls(THUMBNAIL, self.avatar, '/media/cache/img/u/9c/41d2.jpg')
+        cache_urls(RENDITIONS, self.avatar,
+                   {'thumbnail_1x': {'jpeg': '/media/cache/1x.jpg'}})
+
+    def tearDown(self):
+        discard_urls(self.avatar)
+
+    def render(self, data):
+        return JSONRenderer().render(data)
+
+    def test_same_json(self):
+        request = RequestFactory().get('/api/v1/users/')
+        request.user = AnonymousUser()
+        users = User.objects.order_by('pk')
+
+        expected = self.render(UserPublicOnlySerializer(
+                list(users), many=True, context={'request': request}).data)
+        for objects in (
+            users.values(*CompiledUserPublicOnlySerializer.columns),
+            list(users)):
+            serializer = CompiledUserPublicOnlySerializer({'request': request,
+                                                           'format': None})
+            self.assertEqual(self.render(serializer.serialize(objects)),
+                             expected)
+
+
+class UserDeleteTest(TestCase):
+    """
+    Check that deleting a user takes their likes and memberships out of their
+    rooms' counts and trending scores.
+    """
+
+    def setUp(self):
+        self.room = Room.objects.create(name='room',
+                                        host='conference.blabb.it', opts='')
+        self.user = User.objects.create_user('liker', password='password')
+
+    def test_delete_liking_member(self):
+        score = Room.objects.get(pk=self.room.pk).trending_score
+        self.room.add_like(self.user)
+        self.room.add_member(self.user)
+        self.assertGreater(Room.objects.get(pk=self.room.pk).trending_score,
+                           score)
+
+        self.user.delete()
+        room = Room.objects.get(pk=self.room.pk)
+        self.assertEqual(room.likes_count, 0)
+        self.assertEqual(room.members_count, 0)
+        self.assertAlmostEqual(room.trending_score, score, places=6)
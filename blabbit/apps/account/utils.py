@@ -0,0 +1,106 @@
+"""
+Description:
+  Utility functions that come in handy for the account app
+
+Table Of Contents:
+  - get_user_by_username: get a user by case-insensitive username
+  - get_user_or_404:      get a user by case-insensitive username or raise 404
+
+A single request can resolve the same username a few times, e.g. in a
+permission check, to pick a serializer and then to get the view's object. So
+usernames are resolved:
+  - to the requesting user without a query when it's their own username,
+  - from a memo kept on the request, so each request resolves a username at
+    most once,
+  - from Django's cache of username to user id, kept for
+    ACCOUNT_USERNAME_CACHE_SECONDS, so repeat lookups are primary key lookups,
+  - and otherwise by the lowercased username, which uses the username's unique
+    index as usernames are saved lowercase. Users with uppercase characters in
+    their username (e.g. created with `createsuperuser`) are found with the
+    `lower(username)` expression index.
+"""
+
+from blabbit.apps.account.models import User
+
+from django.conf import settings
+from django.core.cache import cache
+from django.http import Http404
+
+
+def get_user_by_username(username, request=None):
+    """
+    Get a user by their username, ignoring case.
+
+    Arguments:
+      - username: username of user
+      - request:  optional Request object representing current request, used to
+                  memoize lookups for the request
+    Return:
+      User object, or None if there's no user with the username
+    """
+    username = username.lower()
+
+    if request is not None:
+        user = request.user
+        if user.is_authenticated() and user.username.lower() == username:
+            return user
+
+        # keep the memo on the underlying HttpRequest so it's shared by the
+        # rest_framework Request objects wrapping it
+        http_request = getattr(request, '_request', request)
+        memo = http_request.__dict__.setdefault('_users_by_username', {})
+        if username not in memo:
+            memo[username] = _get_user_by_username(username)
+        return memo[username]
+
+    return _get_user_by_username(username)
+
+
+def _get_user_by_username(username):
+    """
+    Get a user by their lowercased username, through the cache of user ids.
+
+    Arguments:
+      - username: lowercased username of user
+    Return:
+      User object, or None if there's no user with the username
+    """
+    key = u'user-id:%s' % username
+    user_id = cache.get(key)
+    if user_id is not None:
+        try:
+            user = User.objects.get(pk=user_id)
+        except User.DoesNotExist:
+            # user was deleted, maybe to be replaced by a user of the same name
+            user = None
+        if user is not None and user.username.lower() == username:
+            return user
+        cache.delete(key)
+
+    users = list(User.objects.filter(username=username)[:1]) or \
+        list(User.objects.extra(where=['lower(username) = %s'],
+                                params=[username])[:1])
+    if not users:
+        return None
+
+    cache.set(key, users[0].pk, settings.ACCOUNT_USERNAME_CACHE_SECONDS)
+    return users[0]
+
+
+def get_user_or_404(username, request=None):
+    """
+    Get a user by their username, ignoring case.
+
+    Arguments:
+      - username: username of user
+      - request:  optional Request object representing current request, used to
+                  memoize lookups for the request
+    Return:
+      User object
+    Raises:
+      Http404 if there's no user with the username
+    """
+    user = get_user_by_username(username, request)
+    if user is None:
+        raise Http404('No user named %s' % username)
+    return user
@@ -3,10 +3,16 @@ from blabbit.apps.account.serializers import UserSerializer, \
     UserPublicOnlySerializer, UserCreationSerializer, PasswordResetSerializer, \
     PasswordChangeSerializer, AuthTokenSerializer
 from blabbit.apps.account.permissions import IsOwnerOrReadOnly, IsDetailOwner
+from blabbit.apps.account.mixins import UserLookupMixin
+from blabbit.apps.account.utils import get_user_by_username, get_user_or_404
 
-from blabbit.apps.conversation.serializers import RoomSerializer
+from blabbit.apps.conversation.serializers import RoomSerializer, \
+    CompiledRoomSerializer
 from blabbit.apps.conversation.models import Room
+from blabbit.apps.conversation.mixins import RoomUserStateMixin
 from blabbit.apps.relationship.utils import get_contacts
+from blabbit.apps.media.parsers import ImageMultiPartParser
+from blabbit.apps.rest.parsers import MessagePackParser
 
 from django.contrib.auth.forms import PasswordResetForm, PasswordChangeForm
 from django.shortcuts import get_object_or_404
@@ -19,6 +25,7 @@ from rest_framework.authtoken.views import ObtainAuthToken
 from rest_framework.response import Response
 
 from blabbit.apps.rest import generics as custom_generics
+from blabbit.apps.rest.mixins import CompiledListMixin
 
 # Create your views here.
 
@@ -41,6 +48,7 @@ class UserList(generics.CreateAPIView):
     `username`         | username of user object              | _string_
     `first_name`       | first name of user object            | _string_
     `avatar_thumbnail` | URL of user's thumbnail-sized avatar | _string_
+    `avatar_renditions` | URLs of user's scaled avatars, by rendition (`thumbnail_1x`, `thumbnail_2x`, `thumbnail_3x`, `preview`) then format (`jpeg`, `webp`) | _object_
     `last_modified`    | last modified date of user object    | _date/time_
      
     
@@ -103,7 +111,7 @@ class UserList(generics.CreateAPIView):
 # USER'S DETAILS AND ASSOCIATED LISTS
 # -----------------------------------------------------------------------------
 
-class UserDetail(custom_generics.RetrieveUpdateAPIView):
+class UserDetail(UserLookupMixin, custom_generics.RetrieveUpdateAPIView):
     """
     Retrieve or update a user instance
     
@@ -125,6 +133,7 @@ class UserDetail(custom_generics.RetrieveUpdateAPIView):
     `username`         | username of user object              | _string_
     `first_name`       | first name of user object            | _string_
     `avatar_thumbnail` | URL of user's thumbnail-sized avatar | _string_
+    `avatar_renditions` | URLs of user's scaled avatars, by rendition (`thumbnail_1x`, `thumbnail_2x`, `thumbnail_3x`, `preview`) then format (`jpeg`, `webp`) | _object_
     `last_modified`    | last modified date of user object    | _date/time_
     `email`            | email of user object. **_private_**. | _string_
     `rooms_url` | URL of user's rooms sub-collection. **_private_**.  | _string_
@@ -154,7 +163,7 @@ class UserDetail(custom_generics.RetrieveUpdateAPIView):
     ------------ | ------------------------------ | ----------
     `first_name` | new first name for the  user   | _string_
     `email`      | new email for the user         | _string_
-    `avatar`     | new avatar image for the user. This will be scaled to generate `avatar_thumbnail` | _string_
+    `avatar`     | new avatar image for the user. This will be scaled to generate `avatar_thumbnail` and `avatar_renditions` in the background, which are empty until then | _string_
     
     ### Response
     If update is successful, a user object containing public and private data, 
@@ -170,13 +179,14 @@ class UserDetail(custom_generics.RetrieveUpdateAPIView):
     ##
     """
     
-    parser_classes = (parsers.JSONParser, parsers.MultiPartParser,)
+    parser_classes = (parsers.JSONParser, MessagePackParser, 
+                      ImageMultiPartParser,)
     permission_classes = (permissions.IsAuthenticatedOrReadOnly,
                           IsOwnerOrReadOnly,)
     queryset = User.objects.all()
     
-    # lookup by 'username' not the 'pk' but allow for case-insensitive lookups
-    lookup_field = 'username__iexact'
+    # lookup by 'username' not the 'pk', case-insensitively, with
+    # get_user_by_username (see UserLookupMixin)
     lookup_url_kwarg = 'username'
 
     def get_serializer_class(self):
@@ -187,38 +197,16 @@ class UserDetail(custom_generics.RetrieveUpdateAPIView):
         # I purposely dont call self.get_object() here so as not to raise
         # permission exceptions.
         serializer_class = UserPublicOnlySerializer
-        try:
-            lookup_url_kwarg = self.lookup_url_kwarg or self.lookup_field
-            filter = {self.lookup_field: self.kwargs[lookup_url_kwarg]}
-            user_object = User.objects.get(**filter)
-            if self.request.user == user_object:
-                serializer_class = UserSerializer
-        except User.DoesNotExist:
-            pass # serializer_class already setup
+        user_object = get_user_by_username(
+            self.kwargs[self.lookup_url_kwarg], self.request)
+        if user_object is not None and self.request.user == user_object:
+            serializer_class = UserSerializer
         
         return serializer_class
-            
-    
-    # unused function
-    def blabbit_get_object(self):
-        """
-        try getting an object by username, and if that fails try getting an
-        object by pk.
-        """
-        from django.shortcuts import get_object_or_404
-        queryset = self.get_queryset()
-        try:
-            obj = User.objects.get(username__iexact=self.kwargs['username'])
-        except User.DoesNotExist:
-            obj = get_object_or_404(queryset, pk=self.kwargs['username'])
-        
-        # May raise a permission denied
-        self.check_object_permissions(self.request, obj)
-
-        return obj
                 
 
-class UserRoomList(generics.ListAPIView):
+class UserRoomList(CompiledListMixin, RoomUserStateMixin, 
+                   generics.ListAPIView):
     """
     List all rooms a user participates in.
     
@@ -247,9 +235,9 @@ class UserRoomList(generics.ListAPIView):
     
     permission_classes = (permissions.IsAuthenticated, IsDetailOwner,)
     serializer_class = RoomSerializer
-    # IsDetailOwner permission expects to use the lookup field and url kwarg 
-    # to get the object
-    lookup_field = 'username__iexact'
+    compiled_serializer_class = CompiledRoomSerializer
+    # IsDetailOwner permission gets the user named by this url kwarg, 
+    # case-insensitively, with get_user_by_username
     lookup_url_kwarg = 'username'
     
     def get_queryset(self):
@@ -259,12 +247,10 @@ class UserRoomList(generics.ListAPIView):
         Be sure to exclude expired rooms.
         """
         
-        lookup_url_kwarg = self.lookup_url_kwarg or self.lookup_field
-        lookup = self.kwargs.get(lookup_url_kwarg, None)
+        lookup = self.kwargs.get(self.lookup_url_kwarg, None)
                         
         if lookup is not None:
-            filter_kwargs = {self.lookup_field: lookup}
-            user = get_object_or_404(User, **filter_kwargs)
+            user = get_user_or_404(lookup, self.request)
             earliest_date = timezone.now() - timedelta(
                 seconds=settings.ROOM_EXPIRY_TIME_SECONDS)
             return user.rooms.all().filter(created_at__gte=earliest_date) 
@@ -311,8 +297,8 @@ class UserContactList(generics.ListAPIView):
     
     permission_classes = (permissions.IsAuthenticated, IsDetailOwner,)
     serializer_class = UserPublicOnlySerializer
-    # IsDetailOwner permission expects to use the lookup field and url kwarg 
-    lookup_field = 'username__iexact'
+    # IsDetailOwner permission gets the user named by this url kwarg, 
+    # case-insensitively, with get_user_by_username
     lookup_url_kwarg = 'username'
     
     def get_queryset(self):
@@ -321,12 +307,10 @@ class UserContactList(generics.ListAPIView):
         by the lookup parameters of the view.
         """
         
-        lookup_url_kwarg = self.lookup_url_kwarg or self.lookup_field
-        lookup = self.kwargs.get(lookup_url_kwarg, None)
+        lookup = self.kwargs.get(self.lookup_url_kwarg, None)
                         
         if lookup is not None:
-            filter_kwargs = {self.lookup_field: lookup}
-            user = get_object_or_404(User, **filter_kwargs)
+            user = get_user_or_404(lookup, self.request)
             return get_contacts(user)
         
         return User.objects.none()
@@ -365,6 +349,7 @@ class AuthenticatedUserDetail(custom_generics.RetrieveUpdateAPIView):
     `username`         | username of user object              | _string_
     `first_name`       | first name of user object            | _string_
     `avatar_thumbnail` | URL of user's thumbnail-sized avatar | _string_
+    `avatar_renditions` | URLs of user's scaled avatars, by rendition (`thumbnail_1x`, `thumbnail_2x`, `thumbnail_3x`, `preview`) then format (`jpeg`, `webp`) | _object_
     `email`            | email of user object. **_private_**. | _string_
     `rooms_url` | URL of user's rooms sub-collection. **_private_**.  | _string_
     `contacts_url` | URL of user's contacts sub-collection. **_private_**. | _string_
@@ -392,7 +377,7 @@ class AuthenticatedUserDetail(custom_generics.RetrieveUpdateAPIView):
     ------------ | ------------------------------ | ----------
     `first_name` | new first name for the  user   | _string_
     `email`      | new email for the user         | _string_
-    `avatar`     | new avatar image for the user. This will be scaled to generate `avatar_thumbnail` | _string_
+    `avatar`     | new avatar image for the user. This will be scaled to generate `avatar_thumbnail` and `avatar_renditions` in the background, which are empty until then | _string_
     
     ### Response
     If update is successful, a user object containing public and private data, 
@@ -408,7 +393,8 @@ class AuthenticatedUserDetail(custom_generics.RetrieveUpdateAPIView):
     ##
     """
     
-    parser_classes = (parsers.JSONParser, parsers.MultiPartParser,)
+    parser_classes = (parsers.JSONParser, MessagePackParser, 
+                      ImageMultiPartParser,)
     permission_classes = (permissions.IsAuthenticated,)
     serializer_class = UserSerializer
     queryset = User.objects.all()
@@ -421,7 +407,8 @@ class AuthenticatedUserDetail(custom_generics.RetrieveUpdateAPIView):
         return self.request.user
 
 
-class AuthenticatedUserRoomList(generics.ListAPIView):
+class AuthenticatedUserRoomList(RoomUserStateMixin, 
+                                generics.ListAPIView):
     """
     List all rooms authenticated user participates in.
     
@@ -1,5 +1,5 @@
 from django.contrib.gis import admin
-from blabbit.apps.conversation.models import Room, RoomFlag
+from blabbit.apps.conversation.models import Room, RoomFlag, RoomMembership
 
 # Register your models here.
 
@@ -34,14 +34,38 @@ class RoomAdmin(admin.OSMGeoAdmin):
     actions = [delete_selected_r]
     
     list_display = ('name', 'subject', 'owner', 'created_at')
-    fields = ('name', 'subject', 'photo', 'owner', 'members', 'likes', 
-              'likes_count',
+    fields = ('name', 'subject', 'photo', 'owner', 'members_summary', 
+              'likes', 'likes_count', 'members_count', 'trending_score',
               'location', 'host', 'created_at', 'last_modified', 'opts')
     #filter_horizontal = ('members',)
-    readonly_fields = ('name', 'members', 'likes','host', 'opts', 'created_at', 
-                       'last_modified')
+    readonly_fields = ('name', 'members_summary', 'likes','host', 'opts', 
+                       'created_at', 'last_modified', 'members_count', 
+                       'trending_score')
     search_fields = ('name', 'owner__username', 'owner__first_name')
             
+    # number of members listed by members_summary
+    members_summary_size = 20
+    
+    def members_summary(self, obj):
+        """
+        Summarize a room's members as their count and the first few members,
+        rather than rendering every member. The full list is available from the
+        API's paginated `rooms/<name>/members/` endpoint.
+        
+        Arguments:   
+          - obj: Room object being displayed
+        Return:      
+          (str) summary of members
+        """
+        count = obj.members_count
+        memberships = RoomMembership.objects.filter(room=obj)\
+            .select_related('user').order_by('id')[:self.members_summary_size]
+        usernames = [membership.user.username for membership in memberships]
+        if count > len(usernames):
+            usernames.append('...')
+        return u'%d: %s' % (count, u', '.join(usernames))
+    members_summary.short_description = 'members'
+    
     def has_add_permission(self, request): 
         """
         Don't want users adding Rooms through admin 
@@ -11,6 +11,8 @@ from django.utils.translation import ugettext_lazy as _
 
 from rest_framework.fields import WritableField, ImageField
 
+from blabbit.apps.rest.reverse import build_absolute_uri
+
 import json
 
 class GeometryField(WritableField):
@@ -59,11 +61,12 @@ class GeometryField(WritableField):
 class ImageField(ImageField):
     """
     Customized version of Django rest framework's ImageField that returns the
-    absolute url property as opposed to the relative path to the media root
+    absolute url property as opposed to the relative path to the media root.
+    The request's URI prefix is only built once per request.
     """
     def to_native(self, value):
         if value:
             request = self.context.get('request', None)
-            return request.build_absolute_uri(value.url)
+            return build_absolute_uri(request, value.url)
         else:
             return super(ImageField, self).to_native(value)
@@ -0,0 +1,91 @@
+"""
+Description:
+  Management command module for comparing the payload size and encode time
+  of pages of rooms and users rendered as JSON and as MessagePack.
+
+  Each MessagePack payload is also parsed back and checked against the JSON
+  payload, with its timestamps formatted the way the API formats them.
+"""
+
+from django.core.management.base import BaseCommand, CommandError
+
+from rest_framework.renderers import JSONRenderer
+
+from blabbit.apps.account.models import User
+from blabbit.apps.account.serializers import CompiledUserPublicOnlySerializer
+from blabbit.apps.conversation.models import Room
+from blabbit.apps.conversation.serializers import CompiledRoomSerializer
+from blabbit.apps.rest.benchmark import benchmark_options, \
+    get_benchmark_request, time_calls, format_times
+from blabbit.apps.rest.parsers import MessagePackParser
+from blabbit.apps.rest.renderers import MessagePackRenderer
+from blabbit.apps.rest.serializers import format_datetime
+
+from io import BytesIO
+import datetime
+import json
+
+
+class Command(BaseCommand):
+    help = ('Compare the size and encode time of JSON and MessagePack pages '
+            'of rooms and users')
+    option_list = BaseCommand.option_list + benchmark_options(100, 50)
+
+    def handle(self, *args, **options):
+        """
+        Render a page of rooms and a page of users in each format, and report
+        the size of each and the time to render it.
+
+        Arguments:   *args, **options
+        Return:      None
+        """
+        rows, repeat = options['rows'], options['repeat']
+
+        context = {'request': get_benchmark_request(), 'format': None}
+
+        pages = (
+            ('rooms', CompiledRoomSerializer(context).serialize(
+                    Room.objects.all()[:rows])),
+            ('users', CompiledUserPublicOnlySerializer(context).serialize(
+                    User.objects.all()[:rows])),
+            )
+        if not any(data for (label, data) in pages):
+            raise CommandError('There are no rooms or users to render')
+
+        json_renderer = JSONRenderer()
+        msgpack_renderer = MessagePackRenderer()
+        for (label, data) in pages:
+            if not data:
+                continue
+
+            results = []
+            for renderer in (json_renderer, msgpack_renderer):
+                content = renderer.render(data)
+                times = time_calls(lambda: renderer.render(data), repeat)
+                results.append((renderer.format, len(content), content))
+                self.stdout.write('%s %-8s %d/page: %d bytes, %s' %
+                                  (label, renderer.format, len(data),
+                                   len(content), format_times(times)))
+
+            json_size, msgpack_size = results[0][1], results[1][1]
+            self.stdout.write('%s msgpack size: %.0f%% of json' %
+                              (label, 100.0 * msgpack_size / json_size))
+
+            parsed = MessagePackParser().parse(BytesIO(results[1][2]))
+            if self.normalize(parsed) != json.loads(
+                results[0][2].decode('utf-8')):
+                raise CommandError('%s: MessagePack payload differs from '
+                                   'JSON payload' % label)
+
+    def normalize(self, data):
+        """
+        Format the timestamps of parsed MessagePack data the way the API
+        formats them in JSON.
+        """
+        if isinstance(data, dict):
+            return dict((k, self.normalize(v)) for (k, v) in data.items())
+        elif isinstance(data, list):
+            return [self.normalize(item) for item in data]
+        elif isinstance(data, datetime.datetime):
+            return format_datetime(data)
+        return data
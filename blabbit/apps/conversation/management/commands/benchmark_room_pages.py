@@ -0,0 +1,68 @@
+"""
+Description:
+  Management command module for benchmarking the serialization of pages of
+  rooms, with and without the cache of thumbnail and rendition URLs.
+
+  Without the cache each room's thumbnail URL is looked up through imagekit
+  (spec hashing, a state check in the cache or storage, and storage URL
+  construction) and its renditions' state is checked in the cache. With it,
+  after the first page, no row does any of that.
+"""
+
+from django.core.management.base import BaseCommand, CommandError
+
+from blabbit.apps.conversation.models import Room
+from blabbit.apps.conversation.serializers import RoomSerializer
+from blabbit.apps.conversation.utils import get_room_states
+from blabbit.apps.media.urlcache import discard_urls
+from blabbit.apps.rest.benchmark import benchmark_options, \
+    get_benchmark_request, time_calls, format_times, format_speedup
+
+
+class Command(BaseCommand):
+    help = ('Time serializing pages of rooms with and without cached '
+            'thumbnail URLs')
+    option_list = BaseCommand.option_list + benchmark_options(100, 20,
+                                                              'rooms')
+
+    def handle(self, *args, **options):
+        """
+        Serialize a page of rooms (rooms with photos first) repeatedly, first
+        clearing the URL cache before each page then keeping it, and report
+        the time per page.
+
+        Arguments:   *args, **options
+        Return:      None
+        """
+        rows, repeat = options['rows'], options['repeat']
+        rooms = list(Room.objects.select_related('owner').exclude(
+                photo='')[:rows])
+        if len(rooms) < rows:
+            rooms += list(Room.objects.select_related('owner').filter(
+                    photo='')[:rows - len(rooms)])
+        if not rooms:
+            raise CommandError('There are no rooms to serialize')
+
+        request = get_benchmark_request()
+        room_states = get_room_states(request.user,
+                                      [room.pk for room in rooms])
+
+        def serialize_page():
+            context = {'request': request, 'room_states': room_states}
+            return RoomSerializer(rooms, many=True, context=context).data
+
+        # serialize a page first so both runs start with the same files
+        # generated and the same connections open
+        serialize_page()
+
+        def discard_page_urls():
+            for room in rooms:
+                if room.photo:
+                    discard_urls(room.photo.name)
+
+        uncached = time_calls(serialize_page, repeat, discard_page_urls)
+        cached = time_calls(serialize_page, repeat)
+        for (label, times) in (('uncached', uncached), ('cached', cached)):
+            self.stdout.write('%-8s %d rooms/page: %s' %
+                              (label, len(rooms), format_times(times)))
+        self.stdout.write(format_speedup(uncached, cached))
@@ -0,0 +1,106 @@
+"""
+Description:
+  Management command module for comparing the throughput of the precompiled
+  serializers of list views with that of their rest_framework serializers.
+
+  The throughput of each is the time to fetch, serialize and render a page the
+  way its views do. That both give the same JSON is checked by the tests of
+  the conversation and account apps.
+"""
+
+from django.core.management.base import BaseCommand, CommandError
+
+from rest_framework.renderers import JSONRenderer
+
+from blabbit.apps.account.models import User
+from blabbit.apps.account.serializers import UserPublicOnlySerializer, \
+    CompiledUserPublicOnlySerializer
+from blabbit.apps.account.utils import get_user_by_username
+from blabbit.apps.conversation.models import Room
+from blabbit.apps.conversation.serializers import RoomSerializer, \
+    CompiledRoomSerializer
+from blabbit.apps.conversation.utils import get_room_states
+from blabbit.apps.rest.benchmark import benchmark_options, \
+    get_benchmark_request, time_calls, format_times, format_speedup
+
+from optparse import make_option
+
+
+class Command(BaseCommand):
+    help = ('Time precompiled list serializers against their rest_framework '
+            'serializers')
+    option_list = BaseCommand.option_list + benchmark_options(100, 20) + (
+        make_option('--username', dest='username', default=None,
+                    help='Serialize as this user rather than anonymously, '
+                    'so room ownership, memberships and likes are covered'),
+        )
+
+    def handle(self, *args, **options):
+        """
+        Time the precompiled serializers of rooms and users.
+
+        Arguments:   *args, **options
+        Return:      None
+        """
+        rows, repeat = options['rows'], options['repeat']
+
+        user = None
+        if options['username']:
+            user = get_user_by_username(options['username'])
+            if user is None:
+                raise CommandError('User "%s" does not exist' %
+                                   options['username'])
+        request = get_benchmark_request(user)
+
+        room_ids = list(Room.objects.values_list('id', flat=True)[:rows])
+        user_ids = list(User.objects.values_list('id', flat=True)[:rows])
+        if not room_ids and not user_ids:
+            raise CommandError('There are no rooms or users to serialize')
+
+        def serialize_rooms():
+            rooms = list(Room.objects.filter(pk__in=room_ids))
+            context = {'request': request, 'format': None,
+                       'room_states': get_room_states(
+                    request.user, [room.pk for room in rooms])}
+            return RoomSerializer(rooms, many=True, context=context).data
+
+        def serialize_compiled_rooms():
+            rooms = Room.objects.filter(pk__in=room_ids).values(
+                *CompiledRoomSerializer.columns)
+            context = {'request': request, 'format': None}
+            return CompiledRoomSerializer(context).serialize(rooms)
+
+        def serialize_users():
+            users = User.objects.filter(pk__in=user_ids)
+            context = {'request': request, 'format': None}
+            return UserPublicOnlySerializer(users, many=True,
+                                            context=context).data
+
+        def serialize_compiled_users():
+            users = User.objects.filter(pk__in=user_ids).values(
+                *CompiledUserPublicOnlySerializer.columns)
+            context = {'request': request, 'format': None}
+            return CompiledUserPublicOnlySerializer(context).serialize(users)
+
+        for (label, ids, serialize, serialize_compiled) in (
+            ('rooms', room_ids, serialize_rooms, serialize_compiled_rooms),
+            ('users', user_ids, serialize_users, serialize_compiled_users)):
+            if not ids:
+                continue
+
+            # serialize once first so thumbnails and renditions are looked up
+            # (and their URLs cached) the same for both serializers
+            self.render(serialize())
+
+            timings = []
+            for (name, func) in (('rest_framework', serialize),
+                                 ('precompiled', serialize_compiled)):
+                times = time_calls(lambda: self.render(func()), repeat)
+                timings.append(times)
+                self.stdout.write('%s %-14s %d/page: %s' %
+                                  (label, name, len(ids), format_times(times)))
+            self.stdout.write('%s %s' %
+                              (label, format_speedup(*timings)))
+
+    def render(self, data):
+        return JSONRenderer().render(data)
@@ -0,0 +1,79 @@
+"""
+Description:
+  Management command module for recomputing the trending scores of all rooms.
+
+  Trending scores are maintained incrementally as rooms are liked and joined,
+  so this is only needed once `upgrade_room_schema` has added the
+  `trending_score` column to an existing database, or after changing the
+  TRENDING_* settings.
+"""
+
+from django.core.management.base import BaseCommand, CommandError
+from django.db import connection, transaction
+
+from blabbit.apps.conversation.models import Room, RoomLike, \
+    RoomMembership
+from blabbit.apps.conversation.trending import get_decay_constant, \
+    get_trending_default_sql, MAX_SCORE_DIFFERENCE
+from blabbit.utils import get_table_columns
+
+from django.conf import settings
+
+
+class Command(BaseCommand):
+    help = 'Recompute the trending scores of all rooms'
+
+    def handle(self, *args, **options):
+        """
+        Reset the `trending_score` column's default to match the current
+        settings, then recompute every room's score.
+
+        Likes and memberships are scored at the time they happened.
+
+        Arguments:   *args, **options
+        Return:      None
+        """
+        table = Room._meta.db_table
+        likes_table = RoomLike._meta.db_table
+        members_table = RoomMembership._meta.db_table
+
+        with transaction.atomic():
+            cursor = connection.cursor()
+            if 'trending_score' not in get_table_columns(table):
+                raise CommandError('%s has no trending_score column, run '
+                                   'upgrade_room_schema first' % table)
+
+            cursor.execute(
+                "ALTER TABLE ONLY %s ALTER COLUMN trending_score "
+                "SET DEFAULT %s" % (table, get_trending_default_sql()))
+
+            # each like's and membership's weight is decayed relative to the
+            # room's creation, which keeps the sum of exponentials within range
+            event_sql = """
+                COALESCE((
+                    SELECT SUM(EXP(GREATEST(LEAST(
+                        EXTRACT(EPOCH FROM %(events)s.created_at -
+                                %(table)s.created_at) / %%(tau)s,
+                        %(max_difference)d), -%(max_difference)d)))
+                    FROM %(events)s
+                    WHERE %(events)s.room_id = %(table)s.id), 0)"""
+            cursor.execute("""
+                UPDATE %(table)s SET trending_score = LN(
+                    %%(room_weight)s +
+                    %%(like_weight)s * %(likes)s +
+                    %%(member_weight)s * %(members)s
+                    ) + EXTRACT(EPOCH FROM created_at) / %%(tau)s
+                """ % {'table': table,
+                       'likes': event_sql % {
+                        'table': table, 'events': likes_table,
+                        'max_difference': MAX_SCORE_DIFFERENCE},
+                       'members': event_sql % {
+                        'table': table, 'events': members_table,
+                        'max_difference': MAX_SCORE_DIFFERENCE}}, {
+                    'room_weight': settings.TRENDING_ROOM_WEIGHT,
+                    'like_weight': settings.TRENDING_LIKE_WEIGHT,
+                    'member_weight': settings.TRENDING_MEMBER_WEIGHT,
+                    'tau': get_decay_constant()})
+
+            self.stdout.write('Recomputed trending scores of %d rooms' %
+                              cursor.rowcount)
@@ -0,0 +1,60 @@
+"""
+Description:
+  Management command module for recomputing the denormalized members and likes
+  counts of all rooms.
+
+  These counts are maintained with atomic deltas so they should never drift,
+  but this fixes them after bulk edits done outside of Django, and counts the
+  members of existing rooms once `upgrade_room_schema` has added the
+  `members_count` column.
+"""
+
+from django.core.management.base import BaseCommand, CommandError
+from django.db import connection, transaction
+
+from blabbit.apps.conversation.models import Room, RoomLike, \
+    RoomMembership
+from blabbit.utils import get_table_columns
+
+
+class Command(BaseCommand):
+    help = 'Recompute the members and likes counts of all rooms'
+
+    def handle(self, *args, **options):
+        """
+        Recompute every room's members_count and likes_count with one UPDATE,
+        only writing rooms whose counts are off.
+
+        Arguments:   *args, **options
+        Return:      None
+        """
+        table = Room._meta.db_table
+        members_table = RoomMembership._meta.db_table
+        likes_table = RoomLike._meta.db_table
+
+        with transaction.atomic():
+            cursor = connection.cursor()
+            if 'members_count' not in get_table_columns(table):
+                raise CommandError('%s has no members_count column, run '
+                                   'upgrade_room_schema first' % table)
+
+            cursor.execute("""
+                UPDATE %(table)s
+                SET members_count = counts.members_count,
+                    likes_count = counts.likes_count
+                FROM (
+                    SELECT %(table)s.id,
+                           (SELECT COUNT(*) FROM %(members_table)s
+                            WHERE %(members_table)s.room_id = %(table)s.id
+                            ) AS members_count,
+                           (SELECT COUNT(*) FROM %(likes_table)s
+                            WHERE %(likes_table)s.room_id = %(table)s.id
+                            ) AS likes_count
+                    FROM %(table)s) AS counts
+                WHERE %(table)s.id = counts.id AND (
+                    %(table)s.members_count <> counts.members_count OR
+                    %(table)s.likes_count <> counts.likes_count)
+                """ % {'table': table, 'members_table': members_table,
+                       'likes_table': likes_table})
+
+            self.stdout.write('Fixed the counts of %d rooms' % cursor.rowcount)
@@ -0,0 +1,119 @@
+"""
+Description:
+  Management command module for bringing the room tables of a database created
+  by an older version of Blabbit up to date with the models.
+
+  syncdb creates the columns and indexes of new databases (along with the
+  defaults and indexes in `sql/room.sql`) but never alters existing tables, so
+  this is where all schema changes of the room tables are made. Each upgrade
+  checks whether it's already been applied, so the command is safe to run more
+  than once.
+"""
+
+from django.core.management.base import BaseCommand
+from django.db import connection, transaction
+
+from blabbit.apps.conversation.models import Room, RoomLike, RoomMembership
+from blabbit.apps.conversation.trending import get_trending_default_sql
+from blabbit.utils import get_table_columns
+
+
+class Command(BaseCommand):
+    help = 'Add the columns and indexes missing from the room tables'
+
+    def handle(self, *args, **options):
+        """
+        Apply every upgrade of the room tables that's missing, in one
+        transaction.
+
+        Arguments:   *args, **options
+        Return:      None
+        """
+        with transaction.atomic():
+            cursor = connection.cursor()
+            self.add_trending_score(cursor)
+            self.add_members_count(cursor)
+            self.add_like_timestamps(cursor)
+            self.add_membership_timestamps(cursor)
+
+    def add_trending_score(self, cursor):
+        """
+        Add the indexed `trending_score` column of rooms, with the default of
+        the current TRENDING_* settings. Run `rebuild_trending_scores` after
+        this to compute the scores of existing rooms.
+        """
+        table = Room._meta.db_table
+        if 'trending_score' in get_table_columns(table):
+            return
+
+        cursor.execute(
+            "ALTER TABLE %s ADD COLUMN trending_score double precision "
+            "NOT NULL DEFAULT %s" % (table, get_trending_default_sql()))
+        cursor.execute("CREATE INDEX %s_trending_score ON %s (trending_score)" %
+                       (table, table))
+        self.stdout.write('Added trending_score to %s' % table)
+
+    def add_members_count(self, cursor):
+        """
+        Add the `members_count` column of rooms. Run `reconcile_room_counts`
+        after this to count the members of existing rooms.
+        """
+        table = Room._meta.db_table
+        if 'members_count' in get_table_columns(table):
+            return
+
+        cursor.execute("ALTER TABLE %s ADD COLUMN members_count integer "
+                       "NOT NULL DEFAULT 0" % table)
+        self.stdout.write('Added members_count to %s' % table)
+
+    def add_like_timestamps(self, cursor):
+        """
+        Add the `created_at` column of room likes, backfilling it with each
+        liked room's creation time as the actual time of old likes isn't
+        known. Then add the indexes of `RoomLike.Meta.index_together`.
+        """
+        table = RoomLike._meta.db_table
+        room_table = Room._meta.db_table
+        if 'created_at' in get_table_columns(table):
+            return
+
+        cursor.execute("ALTER TABLE %s ADD COLUMN created_at "
+                       "timestamp with time zone" % table)
+        cursor.execute("""
+            UPDATE %(table)s SET created_at = %(room_table)s.created_at
+            FROM %(room_table)s WHERE %(room_table)s.id = %(table)s.room_id
+            """ % {'table': table, 'room_table': room_table})
+        backfilled = cursor.rowcount
+        cursor.execute("ALTER TABLE %s ALTER COLUMN created_at SET NOT NULL" %
+                       table)
+
+        for fields in RoomLike._meta.index_together:
+            columns = [RoomLike._meta.get_field(field).column
+                       for field in fields]
+            cursor.execute("CREATE INDEX %s_%s ON %s (%s)" % (
+                    table, '_'.join(columns), table, ', '.join(columns)))
+
+        self.stdout.write('Timestamped %d room likes' % backfilled)
+
+    def add_membership_timestamps(self, cursor):
+        """
+        Add the `created_at` column of room memberships, backfilling it with
+        each room's creation time as the time old members joined isn't known.
+        Run `rebuild_trending_scores` after this so the trending scores of
+        rooms match the backfilled times.
+        """
+        table = RoomMembership._meta.db_table
+        room_table = Room._meta.db_table
+        if 'created_at' in get_table_columns(table):
+            return
+
+        cursor.execute("ALTER TABLE %s ADD COLUMN created_at "
+                       "timestamp with time zone" % table)
+        cursor.execute("""
+            UPDATE %(table)s SET created_at = %(room_table)s.created_at
+            FROM %(room_table)s WHERE %(room_table)s.id = %(table)s.room_id
+            """ % {'table': table, 'room_table': room_table})
+        backfilled = cursor.rowcount
+        cursor.execute("ALTER TABLE %s ALTER COLUMN created_at SET NOT NULL" %
+                       table)
+        self.stdout.write('Timestamped %d room memberships' % backfilled)
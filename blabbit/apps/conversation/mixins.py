@@ -0,0 +1,82 @@
+"""
+Description:
+  Mixins for views of rooms.
+
+Table Of Contents:
+  - RoomLookupMixin:    get the room of a view by case-insensitive name
+  - RoomUserStateMixin: add the requester's state in each listed room to the
+                        serializer context
+"""
+
+from blabbit.apps.conversation.utils import get_room_states, get_room_or_404
+
+
+class RoomLookupMixin(object):
+    """
+    Mixin for views of a single room, that gets the room named by the `name`
+    URL keyword argument with `get_room_or_404` rather than filtering the 
+    queryset.
+    """
+    
+    def get_object(self, queryset=None):
+        """
+        Get the room named in the URL, checking the requester's permissions on
+        it.
+        """
+        room = get_room_or_404(self.kwargs['name'])
+        # May raise a permission denied
+        self.check_object_permissions(self.request, room)
+        return room
+
+
+class RoomUserStateMixin(object):
+    """
+    Mixin for views listing rooms, that gets the requesting user's membership
+    and like of every room being serialized with a single query, and hands
+    them to the serializer as the `room_states` context.
+    
+    This covers the page of rooms of a paginated list, or all rooms when
+    serializing a list without pagination.
+    """
+    room_states = None
+    
+    def set_room_states(self, rooms):
+        """
+        Get the requesting user's state in some rooms.
+        
+        Arguments:
+          - rooms: iterable of Room objects, or of rows of room values (as 
+                   listed by CompiledListMixin)
+        Return:
+          None
+        """
+        room_ids = [room['id'] if isinstance(room, dict) else room.pk 
+                    for room in rooms]
+        self.room_states = get_room_states(self.request.user, room_ids)
+    
+    def paginate_queryset(self, queryset, page_size=None):
+        """
+        Get the user's state in the page's rooms along with the page.
+        """
+        page = super(RoomUserStateMixin, self).paginate_queryset(
+            queryset, page_size)
+        if page is not None:
+            self.set_room_states(page.object_list)
+        return page
+    
+    def get_serializer(self, instance=None, *args, **kwargs):
+        """
+        Get the user's state in the rooms of a list being serialized without
+        pagination.
+        """
+        if kwargs.get('many') and instance is not None and \
+                self.room_states is None:
+            self.set_room_states(instance)
+        return super(RoomUserStateMixin, self).get_serializer(
+            instance, *args, **kwargs)
+    
+    def get_serializer_context(self):
+        context = super(RoomUserStateMixin, self).get_serializer_context()
+        if self.room_states is not None:
+            context['room_states'] = self.room_states
+        return context
@@ -1,9 +1,20 @@
 from django.contrib.gis.db import models
+from django.db import transaction
+from django.db.models import F
 from blabbit.apps.account.models import User
 
 from imagekit.models import ImageSpecField
 from imagekit.processors import SmartResize, Adjust
-from blabbit.utils import get_upload_path
+from blabbit.apps.media.blobs import get_content_path, acquire_image, \
+    release_image
+from blabbit.apps.media.backends import forget_state, regenerate_cachefile
+from blabbit.apps.media.urlcache import get_thumbnail_url, discard_urls
+from blabbit.apps.media.renditions import get_rendition_urls, \
+    schedule_renditions, delete_renditions
+from blabbit.apps.conversation.trending import get_new_room_score, \
+    add_trending_event, remove_trending_event
+
+from django.conf import settings
 
 from django.utils import timezone
 
@@ -11,7 +22,7 @@ from django.utils import timezone
 
 # HELPER FUNCTIONS
 def get_room_photo_path(instance, filename):
-    return get_upload_path(instance, filename, 'img/r/')
+    return get_content_path(instance.photo, 'img/r/')
 
 class Room(models.Model):
     """
@@ -47,18 +58,30 @@ class Room(models.Model):
     owner = models.ForeignKey(User, related_name="owned_rooms", null=True, 
                               blank=True)
     
-    # members of the chat room.
+    # members of the chat room, with the time each joined.
     members = models.ManyToManyField(User, related_name="rooms", null=True,
-                                     blank=True)
+                                     blank=True, through='RoomMembership')
     
-    # chat room likes.
+    # chat room likes, with the time of each like.
     likes = models.ManyToManyField(User, related_name="likes", null=True,
-                                     blank=True)
+                                   blank=True, through='RoomLike')
     # keep this stat so we wont have to run a count() query each time we want
     # to get the number of likes on a room. We need this value to always be
     # valid so it cannot be set to NULL but will instead have a default of 0
     likes_count = models.IntegerField(default=0, blank=True)
     
+    # time-decayed score of the room's activity (see `trending.py`). This is
+    # only ever updated atomically in the database, so it's never written by
+    # save() on existing rooms.
+    trending_score = models.FloatField(default=get_new_room_score, 
+                                       db_index=True, editable=False)
+    
+    # keep this stat so we wont have to run a count() query each time we want
+    # to get the number of members of a room. This is only ever updated with
+    # atomic deltas in the database so it's never written by save() on existing
+    # rooms.
+    members_count = models.IntegerField(default=0, blank=True, editable=False)
+    
     # room subject
     subject = models.CharField(max_length=200, blank=True)
     
@@ -89,6 +112,9 @@ class Room(models.Model):
     location = models.PointField(geography=True, null=True, blank=True)
     objects = models.GeoManager() 
     
+    # fields only ever updated atomically in the database
+    ATOMIC_FIELDS = ('members_count', 'trending_score',)
+    
     class Meta:
         db_table = 'muc_room'
         ordering = ['-created_at'] 
@@ -106,11 +132,19 @@ class Room(models.Model):
         get url of photo's thumbnail. If there isn't a photo_thumbnail then
         return an empty string
         """
-        return self.photo_thumbnail.url if self.photo_thumbnail else ''
+        return get_thumbnail_url(self, 'photo_thumbnail', self.photo)
+    
+    def get_photo_renditions(self):
+        """
+        get urls of photo's renditions. If there isn't a photo or its renditions
+        haven't been generated yet then return an empty dictionary
+        """
+        return get_rendition_urls(self.photo)
         
     def delete_photo_files(self, instance):
         """
-        Delete an room's photo files in storage
+        Delete an room's photo files in storage. Identical photos share files,
+        so this only happens when the last room with this photo lets go of it.
         - First delete the room's ImageCacheFiles on storage. The reason this 
           must happen first is that deleting source file deletes the associated 
           ImageCacheFile references but not the actual ImageCacheFiles in 
@@ -123,15 +157,25 @@ class Room(models.Model):
         Return:
           None 
         """
-        # get photo_thumbnail location and delete it
-        instance.photo_thumbnail.storage.delete(instance.photo_thumbnail.name)
-        # delete photo
-        instance.photo.delete()
+        with release_image(instance.photo) as last_reference:
+            if last_reference:
+                # get photo_thumbnail location and delete it along with the
+                # photo renditions, in one batch
+                delete_renditions(instance.photo,
+                                  [instance.photo_thumbnail.name])
+                # forget the thumbnail's state, so it isn't taken to exist if
+                # the photo is stored again
+                forget_state(instance.photo_thumbnail)
+                # discard the URLs once the files are gone, so they can't be
+                # cached again in the meantime
+                discard_urls(instance.photo.name)
+                # delete photo
+                instance.photo.delete()
         
     def save(self, *args, **kwargs):
         """
-        On instance save ensure old image files are deleted if images are 
-        updated.
+        On instance save store new images by their content, and ensure old
+        image files are deleted if images are updated.
                             
         Arguments:   
           - args: all positional arguments
@@ -139,22 +183,146 @@ class Room(models.Model):
         Return:
           None 
         """
-        if self.__original_photo and self.photo != self.__original_photo:
-            # photo has changed and this isn't the first photo upload, so delete
-            # old files
-            orig = Room.objects.get(pk=self.pk)
-            self.delete_photo_files(orig)
+        photo_uploaded = self.photo and not self.photo._committed
+        photo_stored = False
+        # the new photo's reference, the old photo's release and the room's
+        # row are saved together, so a failed save doesn't leak a reference
+        with transaction.atomic():
+            if photo_uploaded:
+                # store the new photo (first, so that re-uploading the old
+                # photo doesn't delete its files)
+                photo_stored = acquire_image(self.photo)
+            if photo_stored:
+                # generate the thumbnail whatever state an earlier copy of the
+                # photo left. It's marked as being generated so imagekit
+                # doesn't queue it again when the photo is saved
+                regenerate_cachefile(self.photo_thumbnail)
             
-        # update likes count
-        try:
-            self.likes_count = self.likes.count()
-        except:
-            pass
+            orig = None
+            if self.__original_photo and (photo_uploaded or 
+                                          self.photo != self.__original_photo):
+                # photo has changed and this isn't the first photo upload, so
+                # old files will be deleted
+                orig = Room.objects.get(pk=self.pk)
+                
+            # update likes count
+            try:
+                self.likes_count = self.likes.count()
+            except:
+                pass
+            
+            # don't overwrite atomic updates of the trending score
+            if (self.pk is not None and not kwargs.get('force_insert') and
+                kwargs.get('update_fields') is None):
+                kwargs['update_fields'] = [
+                    field.name for field in self._meta.local_fields 
+                    if not field.primary_key and 
+                    field.name not in self.ATOMIC_FIELDS]
+            
+            super(Room, self).save(*args, **kwargs)
+            if orig is not None:
+                # release the old photo once the room is saved without it, so
+                # its files are never deleted by a save that fails
+                self.delete_photo_files(orig)
         
-        super(Room, self).save(*args, **kwargs)
+        if photo_stored:
+            # generate renditions of the new photo in the background. Photos
+            # that were already stored already have renditions
+            schedule_renditions(self.photo)
         self.__original_photo = self.photo
             
     
+    def add_like(self, user):
+        """
+        Add a user's like of the room, counting it towards the room's trending
+        score.
+        
+        Arguments:
+          - user: User liking the room
+        Return:
+          (Boolean) True if the like was added, False if it already existed
+        """
+        like, created = RoomLike.objects.get_or_create(room=self, user=user)
+        if not created:
+            return False
+        
+        self.save() # force an update of likes_count room attribute
+        add_trending_event(self.pk, settings.TRENDING_LIKE_WEIGHT, 
+                           like.created_at)
+        return True
+    
+    def remove_like(self, user):
+        """
+        Remove a user's like of the room, taking it out of the room's trending
+        score.
+        
+        Arguments:
+          - user: User unliking the room
+        Return:
+          (Boolean) True if the like was removed, False if it didn't exist
+        """
+        try:
+            like = RoomLike.objects.get(room=self, user=user)
+        except RoomLike.DoesNotExist:
+            return False
+        
+        like.delete()
+        self.save() # force an update of likes_count room attribute
+        remove_trending_event(self.pk, settings.TRENDING_LIKE_WEIGHT, 
+                              like.created_at)
+        return True
+    
+    def add_member(self, user):
+        """
+        Add a user as a member of the room, counting it towards the room's
+        members_count and trending score.
+        
+        Arguments:
+          - user: User joining the room
+        Return:
+          (Boolean) True if the member was added, False if already a member
+        """
+        with transaction.atomic():
+            membership, created = RoomMembership.objects.get_or_create(
+                room=self, user=user)
+            if not created:
+                return False
+            
+            Room.objects.filter(pk=self.pk).update(
+                members_count=F('members_count') + 1)
+            add_trending_event(self.pk, settings.TRENDING_MEMBER_WEIGHT,
+                               membership.created_at)
+        
+        self.members_count += 1
+        return True
+    
+    def remove_member(self, user):
+        """
+        Remove a user from the room's members, taking it out of the room's
+        members_count and trending score.
+        
+        Arguments:
+          - user: User leaving the room
+        Return:
+          (Boolean) True if the member was removed, False if not a member
+        """
+        with transaction.atomic():
+            # lock the membership so concurrent removals only count it once
+            memberships = list(RoomMembership.objects.select_for_update()
+                               .filter(room=self, user=user))
+            if not memberships:
+                return False
+            
+            memberships[0].delete()
+            Room.objects.filter(pk=self.pk).update(
+                members_count=F('members_count') - 1)
+            # take out exactly what joining added
+            remove_trending_event(self.pk, settings.TRENDING_MEMBER_WEIGHT,
+                                  memberships[0].created_at)
+        
+        self.members_count -= 1
+        return True
+    
     def delete(self, *args, **kwargs):
         """
         Default model delete doesn't delete files on storage, so force that to 
@@ -172,6 +340,60 @@ class Room(models.Model):
         super(Room, self).delete(*args, **kwargs)
 
 
+class RoomLike(models.Model):
+    """
+    A user's like of a room, and when it happened.
+    
+    This is the through model of `Room.likes` and uses the table Django 
+    created for the M2M field before likes were timestamped. The 
+    `upgrade_room_schema` management command brings databases created back 
+    then up to date.
+    
+    Likes are read by room and time (e.g. a room's likes in the last hour) or 
+    by user, so both are indexed along with `created_at`. These indexes cover
+    the foreign key indexes Django would otherwise create.
+    """
+    room = models.ForeignKey(Room, related_name="room_likes", db_index=False)
+    user = models.ForeignKey(User, related_name="room_likes", db_index=False)
+    created_at = models.DateTimeField(default=timezone.now)
+    
+    class Meta:
+        db_table = 'muc_room_likes'
+        unique_together = [('room', 'user')]
+        index_together = [('room', 'created_at'), ('user', 'created_at')]
+        verbose_name = 'room like'
+        verbose_name_plural = 'room likes'
+        
+    def __unicode__(self):
+        return u'%s likes %s' % (self.user, self.room)
+
+
+class RoomMembership(models.Model):
+    """
+    A user's membership of a room, and when they joined.
+    
+    This is the through model of `Room.members` and uses the table Django 
+    created for the M2M field before memberships were timestamped. The 
+    `upgrade_room_schema` management command brings databases created back 
+    then up to date.
+    
+    Members are listed in order of membership id, using the 
+    `(room_id, id)` index in `sql/room.sql`.
+    """
+    room = models.ForeignKey(Room, related_name="memberships")
+    user = models.ForeignKey(User, related_name="room_memberships")
+    created_at = models.DateTimeField(default=timezone.now)
+    
+    class Meta:
+        db_table = 'muc_room_members'
+        unique_together = [('room', 'user')]
+        verbose_name = 'room membership'
+        verbose_name_plural = 'room memberships'
+        
+    def __unicode__(self):
+        return u'%s is a member of %s' % (self.user, self.room)
+
+
 class RoomFlag(models.Model):
     """
     Records a flag on a room.
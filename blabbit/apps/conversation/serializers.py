@@ -6,8 +6,15 @@ instances into representations such as json.
 from rest_framework import serializers
 from blabbit.apps.conversation.models import Room, RoomFlag
 from blabbit.apps.conversation.fields import GeometryField, ImageField
+from blabbit.apps.conversation.utils import get_room_states
+from blabbit.apps.media.ingest import ingest_image
+from blabbit.apps.rest.fields import HyperlinkedIdentityField
+from blabbit.apps.rest.serializers import CompiledSerializer, format_datetime
 from blabbit.utils import human_readable_size
 from django.conf import settings
+from django.contrib.gis.geos import GEOSGeometry
+
+import json
 
 class RoomSerializer(serializers.HyperlinkedModelSerializer):
     """
@@ -15,33 +22,36 @@ class RoomSerializer(serializers.HyperlinkedModelSerializer):
     """
     
     # url field should lookup by 'name' not the 'pk'
-    url = serializers.HyperlinkedIdentityField(view_name='room-detail',
-                                               lookup_field='name')
+    url = HyperlinkedIdentityField(view_name='room-detail', lookup_field='name')
     
     is_owner = serializers.SerializerMethodField('get_is_owner')
+    is_member = serializers.SerializerMethodField('get_is_member')
+    liked = serializers.SerializerMethodField('get_liked')
     
     # an untyped Field class, in contrast to the other typed fields such as
     # CharField, is always read-only. 
     # it will be used for serialized representations, but will not be used for
     # updating model instances when they are deserialized
     photo_thumbnail = serializers.Field(source='get_photo_thumbnail_url')   
+    photo_renditions = serializers.Field(source='get_photo_renditions')
     photo = ImageField(required=False)
     
     location = GeometryField(required=False)
     
     class Meta:
         model = Room
-        fields = ('url', 'id', 'name', 'subject', 'is_owner', 
-                  'photo_thumbnail', 'photo', 'location', 'likes_count', 
-                  'created_at', 'last_modified')
-        read_only_fields = ('id','name', 'likes_count', 'created_at', 
-                            'last_modified')
+        fields = ('url', 'id', 'name', 'subject', 'is_owner', 'is_member',
+                  'liked', 'photo_thumbnail', 'photo_renditions', 'photo', 
+                  'location', 'likes_count', 'members_count', 'created_at', 'last_modified')
+        read_only_fields = ('id','name', 'likes_count', 'members_count', 
+                            'created_at', 'last_modified')
         # lookup by 'name' not the 'pk'
         lookup_field = 'name'
         
     def validate_photo(self, attrs, source):
         """
-        Check that the uploaded file size is within allowed limits
+        Check that the uploaded file size is within allowed limits, then
+        prepare the image for storage
         """
         imgfile = attrs.get(source, False)
         if imgfile and imgfile.size > settings.MAX_IMAGE_SIZE:
@@ -50,6 +60,10 @@ class RoomSerializer(serializers.HyperlinkedModelSerializer):
                 % (human_readable_size(settings.MAX_IMAGE_SIZE), 
                    human_readable_size(imgfile.size)))
         
+        if imgfile:
+            # scale down, make upright and strip metadata before storage
+            attrs[source] = ingest_image(imgfile)
+        
         return attrs
     
     def get_is_owner(self, obj):
@@ -58,6 +72,98 @@ class RoomSerializer(serializers.HyperlinkedModelSerializer):
         """
         return self.context['request'].user == obj.owner
     
+    def get_room_state(self, obj):
+        """
+        get current requester's state in the room. Views listing rooms provide
+        the states of all listed rooms in the `room_states` context, otherwise
+        it's looked up for this room.
+        """
+        room_states = self.context.setdefault('room_states', {})
+        if obj.pk not in room_states:
+            room_states.update(
+                get_room_states(self.context['request'].user, [obj.pk]))
+        return room_states[obj.pk]
+    
+    def get_is_member(self, obj):
+        """
+        get if current requester is a room member
+        """
+        return self.get_room_state(obj)['is_member']
+    
+    def get_liked(self, obj):
+        """
+        get if current requester likes the room
+        """
+        return self.get_room_state(obj)['liked']
+    
+
+class CompiledRoomSerializer(CompiledSerializer):
+    """
+    Precompiled serializer for views listing rooms, with the same output as 
+    RoomSerializer.
+    
+    The requester's state in the rooms is taken from the `room_states` context
+    like RoomSerializer does, and the states of any other rooms are looked up
+    together. Room owners aren't loaded.
+    """
+    model = Room
+    columns = ('id', 'name', 'subject', 'owner', 'photo', 'location', 
+               'likes_count', 'members_count', 'created_at', 'last_modified')
+    fields = RoomSerializer.Meta.fields
+    view_name = 'room-detail'
+    lookup_field = 'name'
+    
+    def __init__(self, context):
+        super(CompiledRoomSerializer, self).__init__(context)
+        user = self.request.user
+        self.user_id = user.pk if user.is_authenticated() else None
+        self.room_states = context.setdefault('room_states', {})
+    
+    def prepare(self, rows):
+        """
+        get current requester's state in all rooms it isn't known for yet
+        """
+        room_ids = [row['id'] for row in rows 
+                    if row['id'] not in self.room_states]
+        if room_ids:
+            self.room_states.update(
+                get_room_states(self.request.user, room_ids))
+    
+    def get_is_owner(self, row):
+        return self.user_id is not None and row['owner'] == self.user_id
+    
+    def get_is_member(self, row):
+        return self.room_states[row['id']]['is_member']
+    
+    def get_liked(self, row):
+        return self.room_states[row['id']]['liked']
+    
+    def get_photo_thumbnail(self, row):
+        return self.get_image_thumbnail_url(row, 'photo', 'photo_thumbnail')
+    
+    def get_photo_renditions(self, row):
+        return self.get_image_renditions(row, 'photo')
+    
+    def get_photo(self, row):
+        return self.get_image_url(row, 'photo')
+    
+    def get_location(self, row):
+        """
+        get location as GeometryField outputs it
+        """
+        location = row['location']
+        if location is None:
+            return None
+        if not isinstance(location, GEOSGeometry):
+            location = GEOSGeometry(location)
+        return json.loads(location.geojson)
+    
+    def get_created_at(self, row):
+        return format_datetime(row['created_at'])
+    
+    def get_last_modified(self, row):
+        return format_datetime(row['last_modified'])
+    
 
 class RoomFlagSerializer(serializers.ModelSerializer):
     """
@@ -16,6 +16,15 @@ ALTER TABLE ONLY muc_room ALTER COLUMN photo   SET DEFAULT '';
 
 ALTER TABLE ONLY muc_room ALTER COLUMN last_modified SET DEFAULT now();
 ALTER TABLE ONLY muc_room ALTER COLUMN likes_count SET DEFAULT 0;
+ALTER TABLE ONLY muc_room ALTER COLUMN members_count SET DEFAULT 0;
+
+-- trending score of a room created now. This is the SQL returned by
+--   `blabbit.apps.conversation.trending.get_trending_default_sql` for the
+--   default TRENDING_ROOM_WEIGHT (1) and TRENDING_HALF_LIFE_SECONDS (6 hours).
+--   The `rebuild_trending_scores` management command resets it to match the
+--   current settings.
+ALTER TABLE ONLY muc_room ALTER COLUMN trending_score
+  SET DEFAULT 0.0 + EXTRACT(EPOCH FROM now()) / 31162.21288320161;
 
 -- ejabberd's `muc_room` table schema has this default
 ALTER TABLE ONLY muc_room ALTER COLUMN created_at SET DEFAULT now();
@@ -23,3 +32,20 @@ ALTER TABLE ONLY muc_room ALTER COLUMN created_at SET DEFAULT now();
 -- this constraint comes right out of ejabberd's pg.sql
 -- https://github.com/processone/ejabberd/blob/master/sql/pg.sql
 CREATE UNIQUE INDEX i_muc_room_name_host ON muc_room USING btree (name, host);
+
+-- case-insensitive room name lookups, as done by
+-- `blabbit.apps.conversation.utils.get_room_or_404`
+CREATE INDEX i_muc_room_lower_name ON muc_room USING btree (lower(name));
+
+-- room members are listed in order of membership id, a page at a time
+CREATE INDEX i_muc_room_members_room_id_id ON muc_room_members 
+  USING btree (room_id, id);
+
+-- full-text and trigram indexes used by the `search` app's `postgres` backend.
+-- The text search expression must match the one built by
+-- `blabbit.apps.search.postgres.get_search_vector` for it to be used.
+CREATE EXTENSION IF NOT EXISTS pg_trgm;
+CREATE INDEX i_muc_room_subject_tsv ON muc_room 
+  USING gin (to_tsvector('simple', coalesce(subject, '')));
+CREATE INDEX i_muc_room_subject_trgm ON muc_room 
+  USING gin (subject gin_trgm_ops);
@@ -1,3 +1,83 @@
+from django.contrib.auth.models import AnonymousUser
+from django.contrib.gis.geos import Point
 from django.test import TestCase
+from django.test.client import RequestFactory
+
+from rest_framework.renderers import JSONRenderer
+
+from blabbit.apps.account.models import User
+from blabbit.apps.conversation.models import Room
+from blabbit.apps.conversation.serializers import RoomSerializer, \
+    CompiledRoomSerializer
+from blabbit.apps.media.urlcache import cache_urls, discard_urls, \
+    THUMBNAIL, RENDITIONS
 
 # Create your tests here.
+
+class CompiledRoomSerializerTest(TestCase):
+    """
+    Check that CompiledRoomSerializer gives the same JSON as RoomSerializer,
+    for rows from `QuerySet.values()` (as RoomList lists them) and for model
+    instances (as the popular rooms leaderboard and search results list them).
+    """
+
+    photo = 'img/r/3f/7868b1e2d4c5a6f708192a3b4c5d6e7f8a9b0c1d.jpg'
+
+    def setUp(self):
+        self.owner = User.objects.create_user('owner', password='password')
+        self.member = User.objects.create_user('member', password='password')
+
+        rooms = [
+            Room.objects.create(name='plain', host='conference.blabb.it',
+                                opts=''),
+            Room.objects.create(name='owned', host='conference.blabb.it',
+                                opts='', owner=self.owner,
+                                subject='Owned room',
+                                location=Point(-118.44, 34.07, srid=4326)),
+            Room.objects.create(name='photo', host='conference.blabb.it',
+                                opts='', owner=self.owner,
+                                subject='Room with a photo', photo=self.photo),
+            ]
+        rooms[1].add_member(self.member)
+        rooms[2].add_member(self.member)
+        rooms[2].add_like(self.member)
+        self.room_ids = [room.pk for room in rooms]
+
+        # the photo's files aren't in storage, so give both serializers the
+        # same cached URLs
+        cache_urls(THUMBNAIL, self.photo, '/media/cache/img/r/3f/7868.jpg')
+        cache_urls(RENDITIONS, self.photo,
+                   {'thumbnail_1x': {'jpeg': '/media/cache/1x.jpg'}})
+
+    def tearDown(self):
+        discard_urls(self.photo)
+
+    def render(self, data):
+        return JSONRenderer().render(data)
+
+    def assertSameJSON(self, user):
+        """
+        Assert that both serializers give the same JSON for rooms listed by a
+        user, given as rows and as model instances.
+        """
+        request = RequestFactory().get('/api/v1/rooms/')
+        request.user = user
+        rooms = Room.objects.filter(pk__in=self.room_ids).order_by('pk')
+
+        expected = self.render(RoomSerializer(
+                list(rooms), many=True, context={'request': request}).data)
+        for objects in (rooms.values(*CompiledRoomSerializer.columns),
+                        list(rooms)):
+            serializer = CompiledRoomSerializer({'request': request,
+                                                 'format': None})
+            self.assertEqual(self.render(serializer.serialize(objects)),
+                             expected)
+
+    def test_anonymous(self):
+        self.assertSameJSON(AnonymousUser())
+
+    def test_owner(self):
+        self.assertSameJSON(self.owner)
+
+    def test_member(self):
+        self.assertSameJSON(self.member)
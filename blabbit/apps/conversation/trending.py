@@ -0,0 +1,195 @@
+"""
+Description:
+  Time-decayed trending scores of rooms.
+
+  A room's trending score is the sum of its activity events (its creation,
+  likes and new members), each weighted and decayed exponentially with age:
+
+      score(now) = sum(weight * exp(-(now - event_time) / tau))
+
+  where tau is TRENDING_HALF_LIFE_SECONDS / ln(2). As every room's score decays
+  by the same factor, rooms can be ranked without knowing `now` by storing
+
+      trending_score = ln(sum(weight * exp(event_time / tau)))
+
+  This never needs to be recomputed as time passes: each event is folded into
+  the stored score with a single atomic UPDATE, and the `trending_score`
+  column's index gives the ranking for free.
+
+Table Of Contents:
+  - get_decay_constant:       get the time constant of trending score decay
+  - get_trending_time:        get the decay-scaled time of a date/time
+  - get_event_score:          get the log-space score of a single event
+  - get_new_room_score:       get the trending score of a room just created
+  - add_trending_event:       fold an event into a room's trending score
+  - remove_trending_event:    take an event out of a room's trending score
+  - remove_trending_events:   take many events out of rooms' trending scores
+  - get_trending_default_sql: SQL for the trending_score column's default
+"""
+
+from django.conf import settings
+from django.db import connection
+from django.utils import timezone
+from datetime import datetime
+
+import math
+
+EPOCH = datetime(1970, 1, 1, tzinfo=timezone.utc)
+
+# differences in log-space scores are capped so EXP() can't underflow, which
+# PostgreSQL reports as an error. exp(-700) is well within a double's range.
+MAX_SCORE_DIFFERENCE = 700
+
+# fold an event score into a room's trending score:
+# log(exp(a) + exp(b)) = max(a, b) + log(1 + exp(-|a - b|))
+ADD_EVENT_SQL = """
+    UPDATE muc_room SET trending_score =
+        GREATEST(trending_score, %%(event)s) + LN(1 + EXP(
+            -LEAST(ABS(trending_score - %%(event)s), %(max_difference)d)))
+    WHERE id = %%(room)s
+""" % {'max_difference': MAX_SCORE_DIFFERENCE}
+
+# take an event score out of a room's trending score:
+# log(exp(a) - exp(b)) = a + log(1 - exp(b - a)), for b < a
+# The score never drops below that of the room's creation.
+REMOVE_EVENT_SQL = """
+    UPDATE muc_room SET trending_score = GREATEST(
+        LN(%%(room_weight)s) + EXTRACT(EPOCH FROM created_at) / %%(tau)s,
+        CASE WHEN trending_score > %%(event)s + 0.000001
+             THEN trending_score + LN(1 - EXP(
+                 GREATEST(%%(event)s - trending_score, -%(max_difference)d)))
+             ELSE NULL END)
+    WHERE id = %%(room)s
+""" % {'max_difference': MAX_SCORE_DIFFERENCE}
+
+
+def get_decay_constant():
+    """
+    Get the time constant, tau, of trending score decay.
+
+    Return:
+      (float) tau in seconds
+    """
+    return settings.TRENDING_HALF_LIFE_SECONDS / math.log(2)
+
+
+def get_trending_time(when):
+    """
+    Get the decay-scaled time of a date/time.
+
+    Arguments:
+      - when: timezone-aware datetime
+    Return:
+      (float) seconds since the epoch divided by tau
+    """
+    return (when - EPOCH).total_seconds() / get_decay_constant()
+
+
+def get_event_score(weight, when=None):
+    """
+    Get the log-space trending score of a single event.
+
+    Arguments:
+      - weight: weight of the event, such as TRENDING_LIKE_WEIGHT
+      - when:   date/time of event. Defaults to now.
+    Return:
+      (float) log-space score
+    """
+    if when is None:
+        when = timezone.now()
+    return math.log(weight) + get_trending_time(when)
+
+
+def get_new_room_score():
+    """
+    Get the trending score of a room just created. This is the default of the
+    `Room.trending_score` field.
+
+    Return:
+      (float) log-space score
+    """
+    return get_event_score(settings.TRENDING_ROOM_WEIGHT)
+
+
+def add_trending_event(room_id, weight, when=None):
+    """
+    Fold an event into a room's trending score. This is a single atomic UPDATE
+    so concurrent events don't overwrite each other.
+
+    Arguments:
+      - room_id: id of Room the event happened in
+      - weight:  weight of the event, such as TRENDING_LIKE_WEIGHT
+      - when:    date/time of event. Defaults to now.
+    Return:
+      None
+    """
+    cursor = connection.cursor()
+    cursor.execute(ADD_EVENT_SQL, {'event': get_event_score(weight, when),
+                                   'room': room_id})
+
+
+def remove_trending_event(room_id, weight, when):
+    """
+    Take an event (such as a like) out of a room's trending score, when it's
+    undone. This takes out exactly what `add_trending_event` added for the
+    event, so it needs the event's date/time.
+
+    Arguments:
+      - room_id: id of Room the event happened in
+      - weight:  weight of the event, such as TRENDING_LIKE_WEIGHT
+      - when:    date/time of event
+    Return:
+      None
+    """
+    cursor = connection.cursor()
+    cursor.execute(REMOVE_EVENT_SQL, {
+            'event': get_event_score(weight, when),
+            'room_weight': settings.TRENDING_ROOM_WEIGHT,
+            'tau': get_decay_constant(),
+            'room': room_id})
+
+
+def remove_trending_events(events):
+    """
+    Take many events out of rooms' trending scores at once, such as all the
+    likes and memberships of a user being deleted. The events of each room are
+    combined into a single log-space score, so each room is updated once and
+    with the same statement as `remove_trending_event`.
+
+    Arguments:
+      - events: iterable of (room id, weight, date/time) tuples of events
+    Return:
+      None
+    """
+    room_scores = {}
+    for (room_id, weight, when) in events:
+        room_scores.setdefault(room_id, []).append(
+            get_event_score(weight, when))
+
+    params = []
+    for (room_id, scores) in room_scores.items():
+        # log(sum(exp(score))), computed around the largest score so it
+        # doesn't overflow
+        largest = max(scores)
+        event = largest + math.log(sum(math.exp(score - largest)
+                                       for score in scores))
+        params.append({'event': event,
+                       'room_weight': settings.TRENDING_ROOM_WEIGHT,
+                       'tau': get_decay_constant(),
+                       'room': room_id})
+
+    if params:
+        cursor = connection.cursor()
+        cursor.executemany(REMOVE_EVENT_SQL, params)
+
+
+def get_trending_default_sql():
+    """
+    Get the SQL expression of the `trending_score` column's default, for rooms
+    created by ejabberd.
+
+    Return:
+      (str) SQL expression
+    """
+    return "%r + EXTRACT(EPOCH FROM now()) / %r" % (
+        math.log(settings.TRENDING_ROOM_WEIGHT), get_decay_constant())
@@ -7,10 +7,19 @@ urlpatterns = patterns('',
                        url(r'^rooms/$', 
                            views.RoomList.as_view(), name='room-list'),
                        
+                       # live rooms in a map viewport
+                       url(r'^rooms/map/$', 
+                           views.RoomMap.as_view(), name='room-map'),
+                       
                        # room details
                        url(r'^rooms/(?P<name>[\w.+-]+)/$', 
                            views.RoomDetail.as_view(), name='room-detail'),
                        
+                       # room members
+                       url(r'^rooms/(?P<name>[\w.+-]+)/members/$', 
+                           views.RoomMemberList.as_view(), 
+                           name='room-member-list'),
+                       
                        # room membership management
                        url(r'^rooms/(?P<name>[\w.+-]+)/members/(?P<username>[\w.+-]+)/$', 
                            views.RoomMemberDetail.as_view(), 
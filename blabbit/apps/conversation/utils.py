@@ -0,0 +1,282 @@
+"""
+Description:
+  Utility functions that come in handy for the app
+
+Table Of Contents:
+  - get_map_tiles:      get the map tiles covering a bounding box
+  - get_tile_bbox:      get the bounding box of a map tile
+  - get_tile_condition: get the SQL condition of a live room being in a tile
+  - get_tile_clusters:  get clusters of live rooms in a map tile
+  - get_tile_room_ids:  get ids of live rooms in a map tile
+  - get_room_states:    get a user's membership and like of some rooms
+  - get_room_or_404:    get a room by its case-insensitive name
+
+Map tiles are a grid of square (in degrees) tiles over longitude/latitude. At
+zoom level `z` there are 2^z tiles around the world. Tile coordinates (x, y)
+count from the tile at longitude -180 and latitude -90.
+"""
+
+from blabbit.apps.conversation.models import Room, RoomLike, RoomMembership
+
+from django.conf import settings
+from django.core.cache import cache
+from django.db import connection
+from django.http import Http404
+from django.utils import timezone
+from datetime import timedelta
+
+import math
+
+# SQL condition of a room being live and its location being in a map tile. The
+# coordinate checks ensure each room is in exactly one tile, as tiles share
+# edges.
+ROOM_IN_TILE_SQL = """
+    created_at >= %s
+    AND ST_X(location::geometry) >= %s AND ST_X(location::geometry) < %s
+    AND ST_Y(location::geometry) >= %s AND ST_Y(location::geometry) < %s
+"""
+
+# SQL condition that prefilters rooms with the GiST spatial index of the
+# location geography column. The edges of a geography envelope are great circle
+# arcs rather than lines of latitude so the envelope is padded by
+# INDEXED_TILE_MARGIN (fraction of the tile size) on each side. This is only
+# used for tiles smaller than MAX_INDEXED_TILE_SIZE degrees, larger tiles cover
+# most rooms anyway.
+ROOM_IN_TILE_INDEX_SQL = """
+    location && ST_MakeEnvelope(%s, %s, %s, %s, 4326)::geography AND
+"""
+INDEXED_TILE_MARGIN = 0.1
+MAX_INDEXED_TILE_SIZE = 45.0
+
+
+def get_tile_size(zoom):
+    """
+    Get the width (and height) of map tiles at a zoom level.
+
+    Arguments:
+      - zoom: map zoom level
+    Return:
+      (float) tile size in degrees
+    """
+    return 360.0 / (2 ** zoom)
+
+
+def get_map_tiles(min_lng, min_lat, max_lng, max_lat, zoom):
+    """
+    Get the map tiles covering a bounding box.
+
+    Arguments:
+      - min_lng, min_lat, max_lng, max_lat: bounding box
+      - zoom:                               map zoom level
+    Return:
+      List of (x, y) tile coordinates
+    """
+    size = get_tile_size(zoom)
+    # the last tiles are clamped so the edges of the world are covered
+    max_x = int(math.ceil(360.0 / size)) - 1
+    max_y = int(math.ceil(180.0 / size)) - 1
+
+    def tile_range(low, high, offset, max_index):
+        first = min(int(math.floor((low + offset) / size)), max_index)
+        last = min(int(math.floor((high + offset) / size)), max_index)
+        return range(max(first, 0), max(last, 0) + 1)
+
+    return [(x, y)
+            for x in tile_range(min_lng, max_lng, 180.0, max_x)
+            for y in tile_range(min_lat, max_lat, 90.0, max_y)]
+
+
+def get_tile_bbox(x, y, zoom):
+    """
+    Get the bounding box of a map tile.
+
+    Arguments:
+      - x, y: tile coordinates
+      - zoom: map zoom level
+    Return:
+      (min_lng, min_lat, max_lng, max_lat) tuple
+    """
+    size = get_tile_size(zoom)
+    min_lng = x * size - 180.0
+    min_lat = y * size - 90.0
+    return (min_lng, min_lat, min(min_lng + size, 180.0),
+            min(min_lat + size, 90.0))
+
+
+def get_tile_condition(x, y, zoom):
+    """
+    Get the SQL condition of a room being live and in a map tile. The tiles on
+    the east and north edges of the world include their edge.
+
+    Arguments:
+      - x, y: tile coordinates
+      - zoom: map zoom level
+    Return:
+      (sql, params) tuple of SQL condition and its parameters
+    """
+    min_lng, min_lat, max_lng, max_lat = get_tile_bbox(x, y, zoom)
+    upper_lng = max_lng if max_lng < 180.0 else 180.1
+    upper_lat = max_lat if max_lat < 90.0 else 90.1
+    earliest_date = timezone.now() - timedelta(
+        seconds=settings.ROOM_EXPIRY_TIME_SECONDS)
+
+    sql = ROOM_IN_TILE_SQL
+    params = [earliest_date, min_lng, upper_lng, min_lat, upper_lat]
+    size = get_tile_size(zoom)
+    if size < MAX_INDEXED_TILE_SIZE:
+        margin = size * INDEXED_TILE_MARGIN
+        sql = ROOM_IN_TILE_INDEX_SQL + sql
+        params = [max(min_lng - margin, -180.0), max(min_lat - margin, -90.0),
+                  min(max_lng + margin, 180.0), min(max_lat + margin, 90.0)
+                  ] + params
+    return sql, params
+
+
+def get_tile_clusters(x, y, zoom):
+    """
+    Get clusters of the live rooms in a map tile. Rooms are clustered by
+    snapping them to a grid of ROOM_MAP_CLUSTER_GRID x ROOM_MAP_CLUSTER_GRID
+    cells in the tile. Each cluster is represented by the count and centroid
+    of its rooms.
+
+    Results are cached for ROOM_MAP_CACHE_SECONDS.
+
+    Arguments:
+      - x, y: tile coordinates
+      - zoom: map zoom level
+    Return:
+      List of cluster dictionaries with keys:
+      - count:    number of rooms in cluster
+      - location: GeoJSON point of cluster's centroid
+    """
+    key = 'room-map:clusters:%d:%d:%d' % (zoom, x, y)
+    clusters = cache.get(key)
+    if clusters is not None:
+        return clusters
+
+    cell_size = get_tile_size(zoom) / settings.ROOM_MAP_CLUSTER_GRID
+    condition, params = get_tile_condition(x, y, zoom)
+    cursor = connection.cursor()
+    cursor.execute("""
+        SELECT COUNT(*),
+               ST_X(ST_Centroid(ST_Collect(location::geometry))),
+               ST_Y(ST_Centroid(ST_Collect(location::geometry)))
+        FROM muc_room
+        WHERE """ + condition + """
+        GROUP BY ST_SnapToGrid(location::geometry, %s)
+        """, params + [cell_size])
+
+    clusters = [{'count': count,
+                 'location': {'type': 'Point', 'coordinates': [lng, lat]}}
+                for count, lng, lat in cursor.fetchall()]
+    cache.set(key, clusters, settings.ROOM_MAP_CACHE_SECONDS)
+    return clusters
+
+
+def get_tile_room_ids(x, y, zoom):
+    """
+    Get the ids of the newest live rooms in a map tile, up to
+    ROOM_MAP_MAX_ROOMS of them.
+
+    Results are cached for ROOM_MAP_CACHE_SECONDS.
+
+    Arguments:
+      - x, y: tile coordinates
+      - zoom: map zoom level
+    Return:
+      List of room ids
+    """
+    key = 'room-map:rooms:%d:%d:%d' % (zoom, x, y)
+    room_ids = cache.get(key)
+    if room_ids is not None:
+        return room_ids
+
+    condition, params = get_tile_condition(x, y, zoom)
+    cursor = connection.cursor()
+    cursor.execute("""
+        SELECT id FROM muc_room
+        WHERE """ + condition + """
+        ORDER BY created_at DESC
+        LIMIT %s
+        """, params + [settings.ROOM_MAP_MAX_ROOMS])
+
+    room_ids = [row[0] for row in cursor.fetchall()]
+    cache.set(key, room_ids, settings.ROOM_MAP_CACHE_SECONDS)
+    return room_ids
+
+
+def get_room_states(user, room_ids):
+    """
+    Get a user's membership and like of some rooms, with a single query over
+    the room members and likes tables.
+
+    Arguments:
+      - user:     User (possibly anonymous) to get the states of
+      - room_ids: ids of Rooms to get the states in
+    Return:
+      dictionary mapping each room id to a dictionary with keys:
+      - is_member: (Boolean) is the user a room member?
+      - liked:     (Boolean) does the user like the room?
+    """
+    states = dict((room_id, {'is_member': False, 'liked': False})
+                  for room_id in room_ids)
+    if not states or not user.is_authenticated():
+        return states
+
+    members_table = RoomMembership._meta.db_table
+    likes_table = RoomLike._meta.db_table
+
+    ids = list(states)
+    placeholders = ', '.join(['%s'] * len(ids))
+    cursor = connection.cursor()
+    cursor.execute("""
+        SELECT room_id, 'is_member' FROM """ + members_table + """
+        WHERE user_id = %s AND room_id IN (""" + placeholders + """)
+        UNION ALL
+        SELECT room_id, 'liked' FROM """ + likes_table + """
+        WHERE user_id = %s AND room_id IN (""" + placeholders + """)
+        """, [user.pk] + ids + [user.pk] + ids)
+
+    for room_id, state in cursor.fetchall():
+        states[room_id][state] = True
+    return states
+
+
+def get_room_or_404(name):
+    """
+    Get a room by its name, ignoring case. This is the lookup every view of a
+    single room should use, as a `name__iexact` filter compiles to
+    `UPPER(name) = UPPER(%s)` which can't use any index on `muc_room`.
+
+    XMPP room names are lowercase so the room is looked up by the lowercased
+    name, which uses the `i_muc_room_name_host` index. Rooms named with any
+    uppercase characters (e.g. created outside of ejabberd) are found with
+    the `lower(name)` expression index.
+
+    The id of each room found is cached for ROOM_LOOKUP_CACHE_SECONDS, so
+    repeat lookups of a room are primary key lookups.
+
+    Arguments:
+      - name: room name
+    Return:
+      Room object
+    Raises:
+      Http404 if there's no room with the name
+    """
+    name = name.lower()
+    key = u'room-id:%s' % name
+    room_id = cache.get(key)
+    if room_id is not None:
+        try:
+            return Room.objects.get(pk=room_id)
+        except Room.DoesNotExist:
+            # room was deleted, maybe to be replaced by a room of the same name
+            cache.delete(key)
+
+    rooms = list(Room.objects.filter(name=name)[:1]) or \
+        list(Room.objects.extra(where=['lower(name) = %s'], params=[name])[:1])
+    if not rooms:
+        raise Http404('No room named %s' % name)
+
+    cache.set(key, rooms[0].pk, settings.ROOM_LOOKUP_CACHE_SECONDS)
+    return rooms[0]
@@ -2,15 +2,23 @@ from rest_framework import mixins, generics, permissions, parsers, status
 from rest_framework.response import Response
 
 from blabbit.apps.rest import generics as custom_generics
+from blabbit.apps.rest.mixins import CompiledListMixin, KeysetPaginationMixin
 
-from blabbit.apps.conversation.models import Room, RoomFlag
+from blabbit.apps.conversation.models import Room, RoomFlag, RoomMembership
 from blabbit.apps.conversation.serializers import RoomSerializer, \
-    RoomFlagSerializer
+    RoomFlagSerializer, CompiledRoomSerializer
 from blabbit.apps.conversation.permissions import IsOwnerOrReadOnly
+from blabbit.apps.conversation.mixins import RoomUserStateMixin, \
+    RoomLookupMixin
+from blabbit.apps.conversation.utils import get_map_tiles, \
+    get_tile_clusters, get_tile_room_ids, get_room_or_404
 
 from blabbit.apps.account.models import User
 from blabbit.apps.account.serializers import UserPublicOnlySerializer
 from blabbit.apps.account.permissions import IsDetailOwner
+from blabbit.apps.account.utils import get_user_or_404
+from blabbit.apps.media.parsers import ImageMultiPartParser
+from blabbit.apps.rest.parsers import MessagePackParser
 
 from django.shortcuts import get_object_or_404
 from django.conf import settings
@@ -19,7 +27,7 @@ from datetime import timedelta
 
 # Create your views here.
 
-class RoomList(generics.ListAPIView):
+class RoomList(CompiledListMixin, RoomUserStateMixin, generics.ListAPIView):
     """
     list all rooms
     
@@ -38,10 +46,14 @@ class RoomList(generics.ListAPIView):
     `name`             | (unique) name of room object         | _string_
     `subject`          | room's subject                       | _string_
     `is_owner`         | is current requester the room owner? | _boolean_
+    `is_member`        | is current requester a room member?  | _boolean_
+    `liked`            | does current requester like the room? | _boolean_
     `photo_thumbnail`  | URL of room's thumbnail-sized photo  | _string_
+    `photo_renditions` | URLs of room's scaled photos, by rendition (`thumbnail_1x`, `thumbnail_2x`, `thumbnail_3x`, `preview`) then format (`jpeg`, `webp`) | _object_
     `photo`            | URL of room's full-sized photo       | _string_
     `location`         | room's associated longitude/latitude | _GEO object_
     `likes_count`      | count of likes room has received     | _integer_
+    `members_count`    | count of room's members              | _integer_
     `created_at`       | room's creation date/time            | _date/time_
     `last_modified`    | last modified date of room object    | _date/time_
 
@@ -71,6 +83,7 @@ class RoomList(generics.ListAPIView):
     """
     permission_classes = (permissions.AllowAny,)
     serializer_class = RoomSerializer
+    compiled_serializer_class = CompiledRoomSerializer
     
     def get_queryset(self):
         """
@@ -82,7 +95,110 @@ class RoomList(generics.ListAPIView):
         return Room.objects.all().filter(created_at__gte=earliest_date)    
     
 
-class RoomDetail(custom_generics.RetrieveUpdateDestroyAPIView):
+class RoomMap(RoomUserStateMixin, generics.GenericAPIView):
+    """
+    Live rooms in a map viewport, clustered when zoomed out.
+    
+    ## Reading
+    ### Permissions
+    * Anyone can read this endpoint.
+    
+    ### Fields
+    Parameter    | Description                                    | Type
+    ------------ | ---------------------------------------------- | ----------
+    `bbox`       | viewport as `min_lng,min_lat,max_lng,max_lat`  | _string_
+    `zoom`       | map zoom level, from 0 to `ROOM_MAP_MAX_ZOOM`  | _integer_
+    
+    ### Response
+    The world is split into a grid of 2<sup>`zoom`</sup> map tiles around, and
+    the rooms in every tile touched by the viewport are returned. So results
+    can include rooms just outside the viewport.
+    
+    Name         | Description                                  | Type
+    ------------ | -------------------------------------------- | ----------
+    `zoom`       | map zoom level                               | _integer_
+    `clusters`   | room clusters, below `ROOM_MAP_CLUSTER_MAX_ZOOM` | _array_
+    `rooms`      | [Room objects](/api/v1/rooms/), at or above `ROOM_MAP_CLUSTER_MAX_ZOOM` | _array_
+    
+    Each cluster is of the format:
+    
+        {
+            "count": 12,
+            "location": {
+                "type": "Point",
+                "coordinates": [-123.0208, 44.0464]
+            }
+        }
+    
+    where `location` is the centroid of the cluster's rooms. At most 
+    `ROOM_MAP_MAX_ROOMS` of the newest rooms are returned per tile.
+    
+    Results are cached for `ROOM_MAP_CACHE_SECONDS`.
+    
+    
+    ## Publishing
+    You can't write using this endpoint
+    
+    
+    ## Deleting
+    You can't delete using this endpoint
+    
+    
+    ## Updating
+    You can't update using this endpoint
+    
+    """
+    permission_classes = (permissions.AllowAny,)
+    serializer_class = RoomSerializer
+    
+    def get(self, request, format=None):
+        try:
+            bbox = [float(value) for value in 
+                    request.QUERY_PARAMS['bbox'].split(',')]
+            min_lng, min_lat, max_lng, max_lat = bbox
+            zoom = int(request.QUERY_PARAMS['zoom'])
+        except (KeyError, ValueError):
+            return Response({
+                    'detail':'Provide a numeric bbox of min_lng,min_lat,'
+                    'max_lng,max_lat and an integer zoom'
+                    }, status=status.HTTP_400_BAD_REQUEST)
+        
+        if not (-180 <= min_lng <= max_lng <= 180 and 
+                -90 <= min_lat <= max_lat <= 90 and 
+                0 <= zoom <= settings.ROOM_MAP_MAX_ZOOM):
+            return Response({
+                    'detail':'Bounding box or zoom out of range'
+                    }, status=status.HTTP_400_BAD_REQUEST)
+        
+        tiles = get_map_tiles(min_lng, min_lat, max_lng, max_lat, zoom)
+        if len(tiles) > settings.ROOM_MAP_MAX_TILES:
+            return Response({
+                    'detail':'Bounding box too large for zoom level'
+                    }, status=status.HTTP_400_BAD_REQUEST)
+        
+        clusters = []
+        rooms = []
+        if zoom < settings.ROOM_MAP_CLUSTER_MAX_ZOOM:
+            for x, y in tiles:
+                clusters.extend(get_tile_clusters(x, y, zoom))
+        
+        else:
+            room_ids = []
+            for x, y in tiles:
+                room_ids.extend(get_tile_room_ids(x, y, zoom))
+            # rooms could have expired since their tile was cached
+            earliest_date = timezone.now() - timedelta(
+                seconds=settings.ROOM_EXPIRY_TIME_SECONDS)
+            queryset = Room.objects.filter(
+                pk__in=room_ids, created_at__gte=earliest_date
+                ).order_by('-created_at')
+            rooms = self.get_serializer(queryset, many=True).data
+        
+        return Response({'zoom':zoom, 'clusters':clusters, 'rooms':rooms})
+
+
+class RoomDetail(RoomLookupMixin, 
+                 custom_generics.RetrieveUpdateDestroyAPIView):
     """
     Retrieve or update a room instance
     
@@ -100,10 +216,14 @@ class RoomDetail(custom_generics.RetrieveUpdateDestroyAPIView):
     `name`             | (unique) name of room object         | _string_
     `subject`          | room's subject                       | _string_
     `is_owner`         | is current requester the room owner? | _boolean_
+    `is_member`        | is current requester a room member?  | _boolean_
+    `liked`            | does current requester like the room? | _boolean_
     `photo_thumbnail`  | URL of room's thumbnail-sized photo  | _string_
+    `photo_renditions` | URLs of room's scaled photos, by rendition (`thumbnail_1x`, `thumbnail_2x`, `thumbnail_3x`, `preview`) then format (`jpeg`, `webp`) | _object_
     `photo`            | URL of room's full-sized photo       | _string_
     `location`         | room's associated longitude/latitude | _GEO object_
     `likes_count`      | count of likes room has received     | _integer_
+    `members_count`    | count of room's members              | _integer_
     `created_at`       | room's creation date/time            | _date/time_
     `last_modified`    | last modified date of room object    | _date/time_
     
@@ -147,7 +267,7 @@ class RoomDetail(custom_generics.RetrieveUpdateDestroyAPIView):
     ------------ | ------------------------------ | ---------- 
     `subject`    | new subject for the  room      | _string_
     `location`   | new location for the room      | _string_
-    `photo`     | new photo for the room. This will be scaled to generate `photo_thumbnail` | _string_
+    `photo`     | new photo for the room. This will be scaled to generate `photo_thumbnail` and `photo_renditions` in the background, which are empty until then | _string_
     
     ### Response
     If update is successful, a room object containing public data,
@@ -157,6 +277,7 @@ class RoomDetail(custom_generics.RetrieveUpdateDestroyAPIView):
     ## Endpoints
     Name                    | Description                       
     ----------------------- | ----------------------------------------
+    `members/`              | List room members
     `members/<username>/`   | Add/remove authenticated user as a room member
     `likes/<username>/`     | Add/remove authenticated user as a room liker
     `flag/`                 | Flag a room for moderator review
@@ -164,15 +285,15 @@ class RoomDetail(custom_generics.RetrieveUpdateDestroyAPIView):
     ##
     """
     
-    parser_classes = (parsers.JSONParser, parsers.MultiPartParser,)
+    parser_classes = (parsers.JSONParser, MessagePackParser, 
+                      ImageMultiPartParser,)
     permission_classes = (permissions.IsAuthenticatedOrReadOnly,
                           IsOwnerOrReadOnly,)
     queryset = Room.objects.all()
     serializer_class = RoomSerializer
     
-    # lookup by 'name' not the 'pk' but allow for case-insensitive lookups
-    lookup_field = 'name__iexact'
-    lookup_url_kwarg = 'name'
+    # RoomLookupMixin looks the room up by its case-insensitive 'name' URL
+    # keyword argument, not the 'pk'
     
     def post_save(self, obj, created=False):
         """
@@ -182,8 +303,97 @@ class RoomDetail(custom_generics.RetrieveUpdateDestroyAPIView):
         """
         if (self.request.user.is_authenticated()) and (obj.owner is None):
             obj.owner = self.request.user
-            obj.members.add(self.request.user)
             obj.save()
+            obj.add_member(self.request.user)
+    
+    
+class RoomMemberList(KeysetPaginationMixin, generics.GenericAPIView):
+    """
+    List the members of a room, in the order they joined.
+    
+    ## Reading
+    ### Permissions
+    * Anyone can read this endpoint.
+    
+    ### Fields
+    Parameter | Description                                           | Type
+    --------- | ----------------------------------------------------- | -------
+    `cursor`  | position in the list of members. Use the `next` link rather than setting this | _string_
+    
+    ### Response
+    Reading this endpoint returns:
+    
+        {
+            "count": 2041,
+            "next": "<url of next page>",
+            "results": [<user objects>]
+        }
+    
+    `count` is the number of room members and `results` is a page of 
+    [User objects](/api/v1/users/) containing each member's public data only.
+    `next` is a link to the members following the last member in `results`,
+    or _null_ if there are no more members.
+    
+    
+    ## Publishing
+    You can't write using this endpoint
+    
+    
+    ## Deleting
+    You can't delete using this endpoint
+    
+    
+    ## Updating
+    You can't update using this endpoint
+    
+    """
+    permission_classes = (permissions.AllowAny,)
+    serializer_class = UserPublicOnlySerializer
+    
+    def get(self, request, name, format=None):
+        """
+        List a page of members in order of membership id. Rather than an 
+        offset, the next page starts after the membership id of the last
+        member listed, which is read off the (room_id, id) index of the members
+        table.
+        """
+        room = get_room_or_404(name)
+        
+        memberships, next_url = self.get_keyset_page(
+            RoomMembership.objects.filter(room=room).select_related('user')
+            .order_by('id'))
+        
+        serializer = self.get_serializer(
+            [membership.user for membership in memberships], many=True)
+        return Response({
+                'count': self.get_member_count(room),
+                'next': next_url,
+                'results': serializer.data
+                })
+    
+    def get_member_count(self, room):
+        """
+        Get the number of members of a room. This is the room's denormalized
+        members_count so nothing is counted.
+        
+        Arguments:
+          - room: Room to count members of
+        Return:
+          (int) number of members
+        """
+        return room.members_count
+    
+    def get_cursor_key(self, membership):
+        """
+        Members are listed in order of membership id
+        """
+        return (membership.id,)
+    
+    def filter_after(self, memberships, key):
+        """
+        Filter memberships to those after a membership id
+        """
+        return memberships.filter(id__gt=key[0])
     
     
 class RoomMemberDetail(generics.GenericAPIView):
@@ -231,32 +441,28 @@ class RoomMemberDetail(generics.GenericAPIView):
     lookup_url_kwarg = 'username'
         
     def get(self, request, name, username, format=None):
-        room = get_object_or_404(Room, name__iexact=name)
+        room = get_room_or_404(name)
         # IsDetailOwner checks for existence of the user.
         
-        is_room_member = False
-        try:
-            user = room.members.get(username__iexact=username)
-            is_room_member = True
-        except User.DoesNotExist:
-            pass
+        user = get_user_or_404(username, request)
+        is_room_member = room.members.filter(pk=user.pk).exists()
 
         return Response({
                 'detail':is_room_member
                 })
     
     def post(self, request, name, username, format=None):
-        room = get_object_or_404(Room, name__iexact=name)
-        user = get_object_or_404(User, username__iexact=username)
-        room.members.add(user)
+        room = get_room_or_404(name)
+        user = get_user_or_404(username, request)
+        room.add_member(user)
         return Response({
                 'detail':True
                 })
     
     def delete(self, request, name, username, format=None):
-        room = get_object_or_404(Room, name__iexact=name)
-        user = get_object_or_404(User, username__iexact=username)
-        room.members.remove(user)
+        room = get_room_or_404(name)
+        user = get_user_or_404(username, request)
+        room.remove_member(user)
         return Response({
                 'detail':True
                 })
@@ -307,40 +513,34 @@ class RoomLikeDetail(generics.GenericAPIView):
     lookup_url_kwarg = 'username'
         
     def get(self, request, name, username, format=None):
-        room = get_object_or_404(Room, name__iexact=name)
+        room = get_room_or_404(name)
         # IsDetailOwner checks for existence of the user.
-        likes_room = False
-        try:
-            user = room.likes.get(username__iexact=username)
-            likes_room = True
-        except User.DoesNotExist:
-            pass
+        user = get_user_or_404(username, request)
+        likes_room = room.likes.filter(pk=user.pk).exists()
 
         return Response({
                 'detail':likes_room
                 })
     
     def post(self, request, name, username, format=None):
-        room = get_object_or_404(Room, name__iexact=name)
-        user = get_object_or_404(User, username__iexact=username)
-        room.likes.add(user)
-        room.save() # force an update of likes_count room attribute
+        room = get_room_or_404(name)
+        user = get_user_or_404(username, request)
+        room.add_like(user)
         return Response({
                 'detail':True
                 })
     
     def delete(self, request, name, username, format=None):
-        room = get_object_or_404(Room, name__iexact=name)
-        user = get_object_or_404(User, username__iexact=username)
-        room.likes.remove(user)
-        room.save() # force an update of likes_count room attribute
+        room = get_room_or_404(name)
+        user = get_user_or_404(username, request)
+        room.remove_like(user)
         return Response({
                 'detail':True
                 })
     
 
 
-class RoomFlagDetail(generics.GenericAPIView):
+class RoomFlagDetail(RoomLookupMixin, generics.GenericAPIView):
     """
     Flag a room for moderator review and
         
@@ -373,9 +573,8 @@ class RoomFlagDetail(generics.GenericAPIView):
     queryset = Room.objects.all()
     serializer_class = RoomFlagSerializer
     
-    # lookup by 'name' not the 'pk' but allow for case-insensitive lookups
-    lookup_field = 'name__iexact'
-    lookup_url_kwarg = 'name'
+    # RoomLookupMixin looks the room up by its case-insensitive 'name' URL
+    # keyword argument, not the 'pk'
         
     def post(self, request, name, format=None):
         room = self.get_object()
@@ -0,0 +1,289 @@
+"""
+Description:
+  Precomputed leaderboards of rooms.
+
+  A leaderboard keeps the ids of the top live rooms by some score in a sorted
+  in-memory list, so listing them doesn't sort (or count) the `muc_room` table
+  on every request. The list is:
+  - refreshed from the database every `refresh_seconds`, and mirrored in
+    Django's cache so every server process shares one refresh.
+  - updated in between refreshes as rooms are saved (e.g. liked) or deleted
+    in this process. These updates are only made to this process' list, as
+    writing the whole list back to the cache would have concurrent processes
+    overwrite each other's updates. Other processes see them at their next
+    refresh.
+
+  Rooms expire while on a leaderboard, so expired rooms are dropped when the
+  leaderboard is read.
+
+Table Of Contents:
+  - Leaderboard:           top rooms by a score
+  - LeaderboardObjectList: lazy, sliceable list of a leaderboard's rooms
+  - popular_rooms:         leaderboard of rooms by likes
+  - update_popular_rooms:  post_save signal receiver for popular_rooms
+  - remove_popular_room:   post_delete signal receiver for popular_rooms
+"""
+
+from django.conf import settings
+from django.core.cache import cache
+from django.utils import timezone
+from datetime import timedelta
+
+from blabbit.apps.conversation.models import Room
+
+import bisect
+import threading
+import time
+
+
+class Leaderboard(object):
+    """
+    The top `size` live rooms by descending score (and then descending id).
+
+    Entries are kept as (-score, -id, created_at) tuples in ascending order so
+    they can be kept sorted with `bisect`.
+    """
+
+    def __init__(self, name, score_field, size, refresh_seconds):
+        """
+        Arguments:
+          - name:            name of leaderboard, used in its cache key
+          - score_field:     name of Room field rooms are ranked by
+          - size:            max number of rooms on the leaderboard
+          - refresh_seconds: max time (in seconds) between refreshes from the
+                             database
+        """
+        self.name = name
+        self.score_field = score_field
+        self.size = size
+        self.refresh_seconds = refresh_seconds
+        self.cache_key = 'leaderboard:%s' % name
+
+        self.entries = []
+        self.keys = {}
+        # time when entries were last refreshed from the database, and when
+        # this process last loaded them
+        self.refreshed_at = None
+        self.loaded_at = None
+        self.lock = threading.Lock()
+
+    def get_room_ids(self):
+        """
+        Get the ids of the live rooms on the leaderboard, in order.
+
+        Return:
+          List of room ids
+        """
+        with self.lock:
+            now = time.time()
+            if self.loaded_at is None or \
+                    now - self.loaded_at >= self.refresh_seconds:
+                self.load(now)
+            entries = self.entries
+
+        earliest_date = timezone.now() - timedelta(
+            seconds=settings.ROOM_EXPIRY_TIME_SECONDS)
+        return [-room_id for score, room_id, created_at in entries
+                if created_at >= earliest_date]
+
+    def load(self, now):
+        """
+        Load the leaderboard from the cache if it's been refreshed recently
+        enough, and otherwise refresh it from the database. The lock has to be
+        held when calling this.
+
+        Arguments:
+          - now: current time as seconds since the epoch
+        Return:
+          None
+        """
+        snapshot = cache.get(self.cache_key)
+        if snapshot is not None and \
+                now - snapshot['refreshed_at'] < self.refresh_seconds:
+            self.set_entries(snapshot['entries'], snapshot['refreshed_at'])
+        else:
+            self.refresh(now)
+        self.loaded_at = now
+
+    def refresh(self, now):
+        """
+        Refresh the leaderboard from the database with one query, and mirror
+        it in the cache. The lock has to be held when calling this.
+
+        Arguments:
+          - now: current time as seconds since the epoch
+        Return:
+          None
+        """
+        earliest_date = timezone.now() - timedelta(
+            seconds=settings.ROOM_EXPIRY_TIME_SECONDS)
+        rows = Room.objects.filter(created_at__gte=earliest_date)\
+            .order_by('-' + self.score_field, '-id')\
+            .values_list(self.score_field, 'id', 'created_at')[:self.size]
+
+        self.set_entries([(-score, -room_id, created_at)
+                          for score, room_id, created_at in rows], now)
+        self.save()
+
+    def set_entries(self, entries, refreshed_at):
+        """
+        Replace the leaderboard's entries. The lock has to be held when calling
+        this.
+
+        Arguments:
+          - entries:      sorted list of (-score, -id, created_at) tuples
+          - refreshed_at: time when entries were refreshed from the database
+        Return:
+          None
+        """
+        self.entries = entries
+        self.keys = dict((entry[1], entry) for entry in entries)
+        self.refreshed_at = refreshed_at
+
+    def save(self):
+        """
+        Mirror the leaderboard in the cache. The lock has to be held when
+        calling this.
+        """
+        cache.set(self.cache_key,
+                  {'entries': self.entries, 'refreshed_at': self.refreshed_at},
+                  self.refresh_seconds * 10)
+
+    def update(self, room_id, score, created_at):
+        """
+        Move a room to its place on this process' leaderboard for its new
+        score. A room that falls off the end of a full leaderboard is dropped
+        until the next refresh finds the room that should take its place.
+
+        Arguments:
+          - room_id:    id of the Room
+          - score:      Room's new score
+          - created_at: Room's creation date/time
+        Return:
+          None
+        """
+        with self.lock:
+            if self.loaded_at is None:
+                # nothing to update, the first read will refresh
+                return
+
+            # copy on write as readers iterate over the entries unlocked
+            entries = list(self.entries)
+            keys = dict(self.keys)
+            old_entry = keys.pop(-room_id, None)
+            if old_entry is not None:
+                del entries[bisect.bisect_left(entries, old_entry)]
+
+            entry = (-score, -room_id, created_at)
+            if len(entries) < self.size or entry < entries[-1]:
+                bisect.insort(entries, entry)
+                keys[-room_id] = entry
+                if len(entries) > self.size:
+                    del keys[entries.pop()[1]]
+            elif old_entry is None:
+                # room isn't and wasn't on the leaderboard
+                return
+
+            self.entries = entries
+            self.keys = keys
+
+    def remove(self, room_id):
+        """
+        Remove a room from this process' leaderboard.
+
+        Arguments:
+          - room_id: id of the Room
+        Return:
+          None
+        """
+        with self.lock:
+            old_entry = self.keys.get(-room_id)
+            if old_entry is None:
+                return
+
+            entries = list(self.entries)
+            del entries[bisect.bisect_left(entries, old_entry)]
+            self.set_entries(entries, self.refreshed_at)
+
+
+class LeaderboardObjectList(object):
+    """
+    A lazy, sliceable list of the rooms on a leaderboard.
+
+    Django's Paginator only ever calls `count()` and slices the object list for
+    the requested page, so only the current page's rooms are loaded from the
+    database, in one bulk query.
+    """
+
+    def __init__(self, room_ids):
+        """
+        Arguments:
+          - room_ids: ids of rooms on the leaderboard, in order
+        """
+        self.room_ids = room_ids
+
+    def count(self):
+        return len(self.room_ids)
+
+    def __len__(self):
+        return self.count()
+
+    def __iter__(self):
+        return iter(self[:])
+
+    def __getitem__(self, k):
+        """
+        Get a slice of the leaderboard's rooms.
+
+        Arguments:
+          - k: slice of the leaderboard to get rooms of, or index of a single
+               room.
+        Return:
+          List of Room objects for the slice, or a single Room object if `k`
+          is an index.
+        """
+        if not isinstance(k, slice):
+            rooms = self[k:k+1]
+            if not rooms:
+                raise IndexError("leaderboard index out of range")
+            return rooms[0]
+
+        room_ids = self.room_ids[k]
+        rooms = Room.objects.in_bulk(room_ids)
+        # rooms deleted since the leaderboard was refreshed are dropped
+        return [rooms[room_id] for room_id in room_ids if room_id in rooms]
+
+
+popular_rooms = Leaderboard('popular', 'likes_count',
+                            settings.EXPLORE_POPULAR_LEADERBOARD_SIZE,
+                            settings.EXPLORE_POPULAR_REFRESH_SECONDS)
+
+
+def update_popular_rooms(sender, instance, **kwargs):
+    """
+    Update a room's place on the popular rooms leaderboard whenever it's saved,
+    which is when its likes_count is updated.
+
+    Arguments:
+      - sender:   Room class
+      - instance: Room being saved
+      - kwargs:   all other signal arguments
+    Return:
+      None
+    """
+    popular_rooms.update(instance.pk, instance.likes_count,
+                         instance.created_at)
+
+
+def remove_popular_room(sender, instance, **kwargs):
+    """
+    Remove a room from the popular rooms leaderboard when it's deleted.
+
+    Arguments:
+      - sender:   Room class
+      - instance: Room being deleted
+      - kwargs:   all other signal arguments
+    Return:
+      None
+    """
+    popular_rooms.remove(instance.pk)
@@ -1,3 +1,12 @@
 from django.db import models
+from django.db.models.signals import post_save, post_delete
+
+from blabbit.apps.conversation.models import Room
+from blabbit.apps.explore.leaderboard import update_popular_rooms, \
+    remove_popular_room
 
 # Create your models here.
+
+# keep the popular rooms leaderboard up to date as rooms are liked and deleted
+post_save.connect(update_popular_rooms, sender=Room)
+post_delete.connect(remove_popular_room, sender=Room)
@@ -0,0 +1,20 @@
+"""
+Provides a way of serializing the explore app's views of room model instances
+into representations such as json.
+"""
+
+from rest_framework import serializers
+from blabbit.apps.conversation.serializers import RoomSerializer
+
+
+class NearbyRoomSerializer(RoomSerializer):
+    """
+    Serializer to be used for listing rooms near a location. This expects
+    each room to be annotated with its `distance` from the location.
+    """
+    
+    # distance (in meters) of room from the location being explored
+    distance = serializers.Field()
+    
+    class Meta(RoomSerializer.Meta):
+        fields = RoomSerializer.Meta.fields + ('distance',)
@@ -10,6 +10,14 @@ urlpatterns = patterns('',
                        url(r'^explore/popular/$',
                            views.PopularRoomsList.as_view(), 
                            name='explore-popular-list'),
+                       
+                       url(r'^explore/nearby/$',
+                           views.NearbyRoomsList.as_view(), 
+                           name='explore-nearby-list'),
+                       
+                       url(r'^explore/trending/$',
+                           views.TrendingRoomsList.as_view(), 
+                           name='explore-trending-list'),
                        )
 
 urlpatterns = format_suffix_patterns(urlpatterns)
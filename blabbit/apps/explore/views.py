@@ -1,10 +1,16 @@
-from rest_framework import generics, permissions
+from rest_framework import generics, permissions, status
 from rest_framework.decorators import api_view
 from rest_framework.response import Response
 from rest_framework.reverse import reverse
 
 from blabbit.apps.conversation.models import Room
-from blabbit.apps.conversation.serializers import RoomSerializer
+from blabbit.apps.conversation.serializers import RoomSerializer, \
+    CompiledRoomSerializer
+from blabbit.apps.conversation.mixins import RoomUserStateMixin
+from blabbit.apps.explore.serializers import NearbyRoomSerializer
+from blabbit.apps.rest.mixins import CompiledListMixin, KeysetPaginationMixin
+from blabbit.apps.explore.leaderboard import popular_rooms, \
+    LeaderboardObjectList
 
 from django.conf import settings
 from django.utils import timezone
@@ -17,10 +23,15 @@ def explore_root(request, format=None):
     return Response({
             'popular rooms': reverse('explore-popular-list', 
                                      request=request, format=format),
+            'nearby rooms': reverse('explore-nearby-list', 
+                                    request=request, format=format),
+            'trending rooms': reverse('explore-trending-list', 
+                                      request=request, format=format),
             })
 
 
-class PopularRoomsList(generics.ListAPIView):
+class PopularRoomsList(CompiledListMixin, RoomUserStateMixin, 
+                       generics.ListAPIView):
     """
     List of popular rooms.
         
@@ -31,6 +42,10 @@ class PopularRoomsList(generics.ListAPIView):
     ### Fields
     Reading this endpoint returns a list of [Room objects](/api/v1/rooms/) 
     containing each room's public data only.
+    
+    Rooms are listed by descending likes. Only the top 
+    `EXPLORE_POPULAR_LEADERBOARD_SIZE` rooms are listed, and the ranking can be
+    up to `EXPLORE_POPULAR_REFRESH_SECONDS` out of date.
              
     
     ## Publishing
@@ -47,15 +62,183 @@ class PopularRoomsList(generics.ListAPIView):
     """
     permission_classes = (permissions.AllowAny,)
     serializer_class = RoomSerializer
+    compiled_serializer_class = CompiledRoomSerializer
     
     def get_queryset(self):
         """
         This view should return the list of all rooms sorted by descending likes
-        while excluding expired rooms
+        while excluding expired rooms. These are read off the precomputed
+        popular rooms leaderboard, and only the page of rooms being listed is
+        loaded from the database.
+        """
+        return LeaderboardObjectList(popular_rooms.get_room_ids())
+
+
+class TrendingRoomsList(RoomUserStateMixin, generics.ListAPIView):
+    """
+    List of trending rooms, i.e. rooms with the most recent activity.
+        
+    ## Reading
+    ### Permissions
+    * Anyone can read this endpoint.
+    
+    ### Fields
+    Reading this endpoint returns a list of [Room objects](/api/v1/rooms/) 
+    containing each room's public data only.
+    
+    Rooms are ranked by a trending score that adds up the room's creation, 
+    likes and new members, each decaying in weight with a half-life of 
+    `TRENDING_HALF_LIFE_SECONDS`. So a burst of recent likes ranks a room above
+    an older room with more likes.
+    
+    The list isn't paginated: only the top `EXPLORE_TRENDING_LIMIT` rooms are
+    listed.
+             
+    
+    ## Publishing
+    You can't write using this endpoint
+    
+    
+    ## Deleting
+    You can't delete using this endpoint
+    
+    
+    ## Updating
+    You can't update using this endpoint
+    
+    """
+    permission_classes = (permissions.AllowAny,)
+    serializer_class = RoomSerializer
+    paginate_by = None
+    
+    def get_queryset(self):
+        """
+        This view should return the top trending rooms while excluding expired
+        rooms. The ordering is read off the `trending_score` index.
         """
         earliest_date = timezone.now() - timedelta(
             seconds=settings.ROOM_EXPIRY_TIME_SECONDS)
         return Room.objects.all().filter(created_at__gte=earliest_date)\
-            .order_by('-likes_count')
-        
+            .order_by('-trending_score')[:settings.EXPLORE_TRENDING_LIMIT]
 
+
+class NearbyRoomsList(KeysetPaginationMixin, RoomUserStateMixin,
+                      generics.ListAPIView):
+    """
+    List of rooms near a location, closest first.
+        
+    ## Reading
+    ### Permissions
+    * Anyone can read this endpoint.
+    
+    ### Fields
+    Parameter | Description                                           | Type
+    --------- | ----------------------------------------------------- | -------
+    `lat`     | latitude of location. This field is required          | _float_
+    `lng`     | longitude of location. This field is required         | _float_
+    `radius`  | max distance (in meters) of rooms from location. Optional | _float_
+    `cursor`  | position in the list of rooms. Use the `next` link rather than setting this | _string_
+    
+    ### Response
+    Reading this endpoint returns a list of [Room objects](/api/v1/rooms/) 
+    containing each room's public data only, with an extra field:
+    
+    Name               | Description                          | Type
+    ------------------ | ------------------------------------ | ---------- 
+    `distance`         | distance (in meters) from location   | _float_
+    
+    The list is paginated by distance: `next` is a link to the rooms following
+    the last room in `results`, or _null_ if there are no more rooms.
+             
+    
+    ## Publishing
+    You can't write using this endpoint
+    
+    
+    ## Deleting
+    You can't delete using this endpoint
+    
+    
+    ## Updating
+    You can't update using this endpoint
+    
+    """
+    permission_classes = (permissions.AllowAny,)
+    serializer_class = NearbyRoomSerializer
+    # rooms are listed by (distance, id)
+    cursor_types = (float, int)
+    
+    # SQL expression of a room's distance from the location being explored.
+    # On a geography column the `<->` operator is a KNN distance that's ordered
+    # using the column's GiST spatial index.
+    distance_sql = '"muc_room"."location" <-> ST_GeogFromText(%s)'
+    # SQL condition of a room being within a radius of the location. This also
+    # uses the spatial index.
+    within_radius_sql = \
+        'ST_DWithin("muc_room"."location", ST_GeogFromText(%s), %s)'
+    
+    def list(self, request, *args, **kwargs):
+        """
+        List a page of rooms within the radius of the location, in order of
+        distance and then id. Rather than an offset, the next page starts after
+        the (distance, id) of the last room listed.
+        """
+        try:
+            lat = float(request.QUERY_PARAMS['lat'])
+            lng = float(request.QUERY_PARAMS['lng'])
+            radius = float(request.QUERY_PARAMS.get(
+                    'radius', settings.EXPLORE_NEARBY_DEFAULT_RADIUS))
+        except (KeyError, ValueError):
+            return Response({
+                    'detail':'Provide a numeric lat, lng and optional radius'
+                    }, status=status.HTTP_400_BAD_REQUEST)
+        
+        if not (-90 <= lat <= 90 and -180 <= lng <= 180 and radius >= 0):
+            return Response({
+                    'detail':'Location or radius out of range'
+                    }, status=status.HTTP_400_BAD_REQUEST)
+        
+        radius = min(radius, settings.EXPLORE_NEARBY_MAX_RADIUS)
+        point = 'SRID=4326;POINT(%r %r)' % (lng, lat)
+        
+        queryset = self.get_queryset().extra(
+            select={'distance': self.distance_sql},
+            select_params=[point],
+            where=[self.within_radius_sql],
+            params=[point, radius],
+            order_by=['distance', 'id'])
+        
+        # the location is needed to filter rooms after the cursor
+        self.point = point
+        rooms, next_url = self.get_keyset_page(queryset)
+        
+        serializer = self.get_serializer(rooms, many=True)
+        return Response({
+                'next': next_url,
+                'results': serializer.data
+                })
+    
+    def get_queryset(self):
+        """
+        This view should return the list of all rooms with a location while
+        excluding expired rooms
+        """
+        earliest_date = timezone.now() - timedelta(
+            seconds=settings.ROOM_EXPIRY_TIME_SECONDS)
+        return Room.objects.all().filter(created_at__gte=earliest_date,
+                                         location__isnull=False)
+    
+    def get_cursor_key(self, room):
+        """
+        Rooms are listed in order of distance (in meters) and then id
+        """
+        return (room.distance, room.pk)
+    
+    def filter_after(self, queryset, key):
+        """
+        Filter rooms to those after a distance and id
+        """
+        distance, pk = key
+        return queryset.extra(
+            where=['(%s, "muc_room"."id") > (%%s, %%s)' % self.distance_sql],
+            params=[self.point, distance, pk])
@@ -0,0 +1,13 @@
+from django.contrib import admin
+from blabbit.apps.media.models import ImageBlob
+
+class ImageBlobAdmin(admin.ModelAdmin):
+    """
+    Representation of ImageBlob model in admin interface. Reference counts are
+    kept by room and user saves, so they're read-only here
+    """
+    list_display = ('name', 'references', 'created_at',)
+    readonly_fields = ('name', 'references', 'created_at',)
+    search_fields = ('name',)
+
+admin.site.register(ImageBlob, ImageBlobAdmin)
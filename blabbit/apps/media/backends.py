@@ -0,0 +1,151 @@
+"""
+Description:
+  imagekit cache file backends.
+
+  With imagekit's `Simple` backend, thumbnails are generated as soon as their
+  source image is saved, i.e. within the request that uploads the image. The
+  `ThreadPool` backend instead hands generation to a pool of worker threads
+  so the upload returns right away.
+
+  While a thumbnail is being generated its imagekit state (kept in Django's
+  cache so it's seen by every server process) is `generating`, so the
+  thumbnail doesn't exist as far as models are concerned and they report an
+  empty thumbnail URL until it's ready.
+
+  Images are stored by their content (see `blabbit.apps.media.blobs`), so a
+  deleted image can be stored again under the same name, and its thumbnail
+  would get the same name and state. So when an image's files are deleted the
+  thumbnail's state is forgotten, and when an image is stored its thumbnail is
+  generated whatever its state.
+
+Table Of Contents:
+  - get_worker_pool:      get this process' pool of media worker threads
+  - forget_state:         forget the state of a cache file
+  - regenerate_cachefile: generate a cache file whatever its state
+  - ThreadPool:           cache file backend that generates files on a thread
+                          pool
+"""
+
+from django.conf import settings
+
+from imagekit.cachefiles import ImageCacheFile
+from imagekit.cachefiles.backends import BaseAsync, CacheFileState
+
+from blabbit.apps.media.urlcache import cache_urls, THUMBNAIL
+
+from multiprocessing import pool
+import copy
+import logging
+import threading
+
+logger = logging.getLogger(__name__)
+
+# this process' pool of worker threads. It's created on first use so it's
+# created in each server process rather than in a parent process before forking
+_pool = None
+_pool_lock = threading.Lock()
+
+
+def get_worker_pool():
+    """
+    Get this process' pool of MEDIA_THUMBNAIL_WORKERS worker threads, shared by
+    all background image processing.
+
+    Return:
+      multiprocessing.pool.ThreadPool object
+    """
+    global _pool
+    with _pool_lock:
+        if _pool is None:
+            _pool = pool.ThreadPool(settings.MEDIA_THUMBNAIL_WORKERS)
+        return _pool
+
+
+def forget_state(file):
+    """
+    Forget the state of a cache file, e.g. once it's deleted, so it isn't
+    taken to exist.
+
+    Arguments:
+      - file: ImageCacheFile, e.g. a model's thumbnail
+    Return:
+      None
+    """
+    backend = file.cachefile_backend
+    backend.cache.delete(backend.get_key(file))
+
+
+def regenerate_cachefile(file):
+    """
+    Generate a cache file (in the background with the `ThreadPool` backend)
+    whatever its state, e.g. a thumbnail left marked as existing by an earlier
+    copy of its source. Asynchronous backends skip files that are being
+    generated or exist even when forced, so the state is forgotten first.
+
+    Arguments:
+      - file: ImageCacheFile, e.g. a model's thumbnail
+    Return:
+      None
+    """
+    forget_state(file)
+    file.generate(force=True)
+
+
+class ThreadPool(BaseAsync):
+    """
+    A cache file backend that generates files on a pool of
+    MEDIA_THUMBNAIL_WORKERS threads in each server process.
+
+    Queued files are lost if the process exits, in which case their state
+    expires from the cache and they're generated again the next time they're
+    required.
+    """
+
+    def schedule_generation(self, file, force=False):
+        """
+        Queue a file for generation and mark it as being generated.
+
+        The source file saved in the request (such as an uploaded file) is
+        closed once the request is done, so the worker reads the source back
+        from storage instead.
+
+        Arguments:
+          - file:  ImageCacheFile to generate
+          - force: generate the file even if it already exists?
+        Return:
+          None
+        """
+        source = file.generator.source
+        generator = copy.copy(file.generator)
+        generator.source = source.__class__(source.instance, source.field,
+                                            source.name)
+        cachefile = ImageCacheFile(generator, name=file.name,
+                                   storage=file.storage,
+                                   cachefile_backend=self,
+                                   cachefile_strategy=file.cachefile_strategy)
+
+        self.set_state(file, CacheFileState.GENERATING)
+        get_worker_pool().apply_async(self.generate_in_worker,
+                                    (cachefile, force))
+
+    def generate_in_worker(self, file, force):
+        """
+        Generate a file. This runs on the worker threads.
+
+        Arguments:
+          - file:  ImageCacheFile to generate
+          - force: generate the file even if it already exists?
+        Return:
+          None
+        """
+        try:
+            # the file is marked as being generated so force generation
+            self.set_state(file, CacheFileState.DOES_NOT_EXIST)
+            self.generate_now(file, force=force)
+        except Exception:
+            logger.exception('Failed to generate %s', file.name)
+            self.set_state(file, CacheFileState.DOES_NOT_EXIST)
+        else:
+            # so serializing the source's model doesn't go through imagekit
+            cache_urls(THUMBNAIL, file.generator.source.name,
+                       file.storage.url(file.name))
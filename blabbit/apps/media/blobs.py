@@ -0,0 +1,127 @@
+"""
+Description:
+  Content-addressed storage of room photos and user avatars.
+
+  Images are stored under the SHA-1 hash of their content, so identical images
+  (such as a re-uploaded avatar or a reposted room photo) share one file, one
+  thumbnail and one set of renditions. The references to each file are counted
+  by an `ImageBlob`:
+    - storing an image that's already stored only counts another reference, so
+      it neither writes to storage nor generates thumbnails,
+    - and releasing an image only deletes its files when its last reference
+      goes.
+  Both hold a lock on the image's ImageBlob while they touch storage, so an
+  image can't be deleted while it's being stored again.
+
+Table Of Contents:
+  - get_content_path: get the storage path of an uploaded image from its content
+  - acquire_image:    store an uploaded image, or reference its stored copy
+  - release_image:    release a reference to a stored image
+"""
+
+from django.db import transaction, IntegrityError
+from django.db.models import F
+
+from blabbit.apps.media.models import ImageBlob
+
+from contextlib import contextmanager
+import hashlib
+import os
+
+
+def get_content_path(fieldfile, root):
+    """
+    Get the storage path of an uploaded image from the hash of its content.
+    The hash is split into a directory and a file name so that directories
+    don't hold all images.
+
+    Arguments:
+      - fieldfile: FieldFile of the uploaded image
+      - root:      root folder of the path, e.g. 'img/r/'
+    Return:
+      (str) path of the image, e.g. 'img/r/3f/7868...23001b.jpg'
+    """
+    sha1 = hashlib.sha1()
+    for chunk in fieldfile.file.chunks():
+        sha1.update(chunk)
+    fieldfile.file.seek(0)
+
+    digest = sha1.hexdigest()
+    extension = os.path.splitext(fieldfile.name)[1].lower()
+    return os.path.join(root, digest[:2], digest[2:] + extension)
+
+
+def acquire_image(fieldfile):
+    """
+    Store an uploaded image under its content path, or if it's already stored
+    count another reference to it. Either way the FieldFile is left pointing at
+    the stored image, so saving its model doesn't write it to storage again.
+
+    Arguments:
+      - fieldfile: uncommitted FieldFile of the uploaded image. The content
+                   path is given by its field's `upload_to`.
+    Return:
+      (bool) True if this is the image's first reference, so its thumbnail and
+      renditions need generating, False if it was already stored
+    """
+    name = fieldfile.field.generate_filename(fieldfile.instance,
+                                             fieldfile.name)
+    with transaction.atomic():
+        # this locks the image's blob, if it has one, until the transaction
+        # is done
+        updated = ImageBlob.objects.filter(name=name).update(
+            references=F('references') + 1)
+        if updated:
+            created = False
+        else:
+            try:
+                with transaction.atomic():
+                    ImageBlob.objects.create(name=name)
+            except IntegrityError:
+                # the same image was stored concurrently. Wait for that to be
+                # done, then reference it
+                ImageBlob.objects.filter(name=name).update(
+                    references=F('references') + 1)
+                created = False
+            else:
+                # the file can exist without a blob if it was stored before
+                # blobs were recorded, or by a save that was rolled back. Its
+                # generated files can't be trusted either way
+                created = True
+                if not fieldfile.storage.exists(name):
+                    name = fieldfile.storage.save(name, fieldfile.file)
+
+    fieldfile.name = name
+    fieldfile._committed = True
+    return created
+
+
+@contextmanager
+def release_image(fieldfile):
+    """
+    Release a reference to a stored image. This is a context manager that
+    gives whether the released reference was the last one, in which case the
+    image's files should be deleted in its block, e.g.
+        with release_image(room.photo) as last_reference:
+            if last_reference:
+                room.photo.delete()
+
+    Arguments:
+      - fieldfile: FieldFile of the stored image
+    Return:
+      (bool) True if the image has no more references, i.e. its files can be
+      deleted
+    """
+    with transaction.atomic():
+        blobs = list(ImageBlob.objects.select_for_update().filter(
+                name=fieldfile.name))
+        if not blobs:
+            # images stored before blobs were recorded have one reference
+            yield True
+        elif blobs[0].references > 1:
+            ImageBlob.objects.filter(pk=blobs[0].pk).update(
+                references=F('references') - 1)
+            yield False
+        else:
+            blobs[0].delete()
+            yield True
@@ -0,0 +1,170 @@
+"""
+Description:
+  Ingestion of uploaded images, i.e. preparing room photos and user avatars for
+  storage.
+
+  Uploads are usually camera-resolution photos carrying EXIF metadata (which
+  can include where the photo was taken), but they are never displayed larger
+  than a phone screen. So before an upload is stored it is:
+    - checked to not have more than MEDIA_MAX_IMAGE_PIXELS pixels, from its
+      header alone so oversized images are never decoded,
+    - decoded, with JPEGs decoded at a reduced scale when they are much larger
+      than MEDIA_MAX_IMAGE_DIMENSION so memory use stays bounded,
+    - scaled down to fit within MEDIA_MAX_IMAGE_DIMENSION,
+    - rotated/flipped upright according to its EXIF orientation,
+    - and re-encoded without its metadata, except for its color profile.
+
+  The re-encoded image is spooled to disk once it's larger than
+  FILE_UPLOAD_MAX_MEMORY_SIZE. If an upload doesn't need scaling, rotating or
+  stripping and re-encoding doesn't make it smaller, the upload is kept as is.
+
+Table Of Contents:
+  - ingest_image: prepare an uploaded image for storage
+"""
+
+from django.conf import settings
+from django.core.files import File
+from django.utils.translation import ugettext_lazy as _
+
+from rest_framework import serializers
+from PIL import Image
+
+import logging
+import os
+import tempfile
+
+logger = logging.getLogger(__name__)
+
+# EXIF tag of an image's orientation
+EXIF_ORIENTATION_TAG = 0x0112
+
+# transpositions that make an image upright, keyed by its EXIF orientation
+ORIENTATION_TRANSPOSITIONS = {
+    2: (Image.FLIP_LEFT_RIGHT,),
+    3: (Image.ROTATE_180,),
+    4: (Image.FLIP_TOP_BOTTOM,),
+    5: (Image.ROTATE_90, Image.FLIP_TOP_BOTTOM),
+    6: (Image.ROTATE_270,),
+    7: (Image.ROTATE_270, Image.FLIP_TOP_BOTTOM),
+    8: (Image.ROTATE_90,),
+    }
+
+# format ingested images are saved in, by format of the upload. Uploads in
+# other formats are saved as PNG if they're transparent, or else as JPEG.
+INGESTED_FORMATS = {
+    'JPEG': 'JPEG',
+    'PNG':  'PNG',
+    }
+
+# file extension and PIL save options of each format ingested images are saved
+# in
+FORMAT_OPTIONS = {
+    'JPEG': ('jpg', {'quality': 90, 'optimize': True, 'progressive': True}),
+    'PNG':  ('png', {'optimize': True}),
+    }
+
+
+def get_orientation(img):
+    """
+    Get an image's EXIF orientation.
+
+    Arguments:
+      - img: PIL Image object
+    Return:
+      (int) EXIF orientation, or None if the image doesn't have one
+    """
+    try:
+        exif = img._getexif()
+    except Exception:
+        # not a JPEG, or malformed EXIF data
+        return None
+    return exif.get(EXIF_ORIENTATION_TAG) if exif else None
+
+
+def ingest_image(imgfile):
+    """
+    Prepare an uploaded image for storage by scaling it down, making it upright
+    and stripping its metadata.
+
+    Arguments:
+      - imgfile: uploaded image file
+    Return:
+      File object of the ingested image, which may be `imgfile` itself
+    Raises:
+      serializers.ValidationError if the image is too large or can't be
+      decoded
+    """
+    max_dimension = settings.MEDIA_MAX_IMAGE_DIMENSION
+
+    imgfile.seek(0)
+    try:
+        # this only reads the image's header
+        img = Image.open(imgfile)
+    except Exception:
+        raise serializers.ValidationError(
+            _('Upload a valid image. The file you uploaded was either not an '
+              'image or a corrupted image.'))
+
+    width, height = img.size
+    if width * height > settings.MEDIA_MAX_IMAGE_PIXELS:
+        raise serializers.ValidationError(
+            _('Ensure this image has at most %(max)d megapixels (it has '
+              '%(pixels)d).') % {
+                'max': settings.MEDIA_MAX_IMAGE_PIXELS // 1000000,
+                'pixels': width * height // 1000000})
+
+    upload_format = img.format
+    orientation = get_orientation(img)
+    has_metadata = bool(set(img.info) - set(['icc_profile', 'transparency',
+                                             'dpi', 'jfif', 'jfif_version',
+                                             'jfif_unit', 'jfif_density',
+                                             'progressive', 'progression',
+                                             'adobe', 'adobe_transform']))
+    needs_scaling = max(width, height) > max_dimension
+    icc_profile = img.info.get('icc_profile')
+
+    try:
+        img.draft(img.mode, (max_dimension, max_dimension))
+        img.load()
+    except Exception:
+        raise serializers.ValidationError(
+            _('Upload a valid image. The file you uploaded was either not an '
+              'image or a corrupted image.'))
+
+    if needs_scaling:
+        img.thumbnail((max_dimension, max_dimension), Image.ANTIALIAS)
+    for transposition in ORIENTATION_TRANSPOSITIONS.get(orientation, ()):
+        img = img.transpose(transposition)
+
+    has_alpha = (img.mode in ('RGBA', 'LA') or
+                 (img.mode == 'P' and 'transparency' in img.info))
+    ingested_format = INGESTED_FORMATS.get(upload_format,
+                                           'PNG' if has_alpha else 'JPEG')
+    extension, options = FORMAT_OPTIONS[ingested_format]
+    if ingested_format == 'JPEG' and img.mode not in ('RGB', 'L', 'CMYK'):
+        img = img.convert('RGB')
+    if icc_profile:
+        options = dict(options, icc_profile=icc_profile)
+
+    ingested = tempfile.SpooledTemporaryFile(
+        max_size=settings.FILE_UPLOAD_MAX_MEMORY_SIZE)
+    img.save(ingested, ingested_format, **options)
+    ingested_size = ingested.tell()
+
+    if (not needs_scaling and orientation in (None, 1) and not has_metadata and
+        upload_format == ingested_format and ingested_size >= imgfile.size):
+        ingested.close()
+        imgfile.seek(0)
+        logger.info('Ingested %s unchanged (%d bytes)',
+                    imgfile.name, imgfile.size)
+        return imgfile
+
+    ingested.seek(0)
+    name = '%s.%s' % (os.path.splitext(os.path.basename(imgfile.name))[0],
+                      extension)
+    logger.info('Ingested %s: %d -> %d bytes (%d bytes saved)',
+                imgfile.name, imgfile.size, ingested_size,
+                imgfile.size - ingested_size)
+    ingested_file = File(ingested, name=name)
+    ingested_file.size = ingested_size
+    return ingested_file
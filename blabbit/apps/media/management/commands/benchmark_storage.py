@@ -0,0 +1,73 @@
+"""
+Description:
+  Management command module for measuring the latency of storage operations
+  against the default storage, e.g. S3, an S3-compatible stand-in or the local
+  filesystem.
+
+  Files are written under a `benchmark/` folder and all deleted at the end.
+"""
+
+from django.core.files.base import ContentFile
+from django.core.files.storage import default_storage
+from django.core.management.base import BaseCommand
+
+from blabbit.apps.media.storage import get_latency_stats, \
+    reset_latency_stats, delete_files
+
+from optparse import make_option
+import os
+import time
+
+
+class Command(BaseCommand):
+    help = 'Measure the latency of operations on the default storage'
+    option_list = BaseCommand.option_list + (
+        make_option('--files', type='int', dest='files', default=20,
+                    help='Number of files to save [default: 20]'),
+        make_option('--size', type='int', dest='size', default=200 * 1024,
+                    help='Size of each file in bytes [default: 204800]'),
+        make_option('--large-size', type='int', dest='large_size',
+                    default=20 * 1024 * 1024,
+                    help='Size in bytes of one extra large file, e.g. to '
+                    'try multipart uploads [default: 20971520, 0 to skip]'),
+        )
+
+    def handle(self, *args, **options):
+        """
+        Save, check, read back and then delete files in one batch, and report
+        the latency of each storage operation.
+
+        Arguments:   *args, **options
+        Return:      None
+        """
+        reset_latency_stats()
+        prefix = 'benchmark/%d' % int(time.time())
+
+        sizes = [options['size']] * options['files']
+        if options['large_size']:
+            sizes.append(options['large_size'])
+
+        names = []
+        start = time.time()
+        try:
+            for (i, size) in enumerate(sizes):
+                name = default_storage.save('%s/%d.bin' % (prefix, i),
+                                            ContentFile(os.urandom(size)))
+                names.append(name)
+                default_storage.exists(name)
+                stored = default_storage.open(name)
+                stored.read()
+                stored.close()
+        finally:
+            delete_files(default_storage, names)
+        elapsed = time.time() - start
+
+        self.stdout.write('%s: %d files in %.2f s' %
+                          (default_storage.__class__.__name__, len(names),
+                           elapsed))
+        stats = get_latency_stats()
+        for operation in sorted(stats):
+            self.stdout.write(
+                '%-12s count %4d  mean %8.2f ms  max %8.2f ms' %
+                (operation, stats[operation]['count'],
+                 stats[operation]['mean_ms'], stats[operation]['max_ms']))
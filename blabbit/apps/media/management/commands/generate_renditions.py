@@ -0,0 +1,85 @@
+"""
+Description:
+  Management command module for generating the renditions of stored images
+  that don't have them, e.g. images stored before renditions (or a rendition
+  or format) were added, or whose rendition state was lost from the cache.
+
+  Looking up rendition URLs never generates renditions, so this is run after
+  deploying such a change and whenever the cache is flushed.
+"""
+
+from django.core.management.base import BaseCommand
+from django.db.models import get_models, ImageField
+from django.db.models.fields.files import FieldFile
+
+from imagekit.cachefiles.backends import CacheFileState
+
+from blabbit.apps.media.renditions import get_rendition_state, \
+    find_renditions, update_renditions, FAILED
+
+from optparse import make_option
+
+
+class Command(BaseCommand):
+    help = 'Generate the renditions of stored images that are missing them'
+    option_list = BaseCommand.option_list + (
+        make_option('--force', action='store_true', dest='force',
+                    default=False,
+                    help='Regenerate the renditions of every image, even '
+                    'those that exist or recently failed'),
+        )
+
+    def handle(self, *args, **options):
+        """
+        Generate, one image at a time, the renditions of the images of every
+        model's ImageFields whose renditions aren't known to exist and can't
+        be found in storage.
+
+        Arguments:   *args, **options
+        Return:      None
+        """
+        force = options['force']
+        counts = dict.fromkeys(('existing', 'found', 'skipped', 'generated',
+                                'failed'), 0)
+
+        for model in get_models():
+            for field in model._meta.fields:
+                if not isinstance(field, ImageField):
+                    continue
+
+                names = model._default_manager.exclude(
+                    **{field.name: ''}).values_list(
+                    field.name, flat=True).distinct()
+                for name in names.iterator():
+                    source = FieldFile(None, field, name)
+                    counts[self.process(source, force)] += 1
+
+        self.stdout.write(
+            '%(generated)d generated, %(failed)d failed, %(found)d found in '
+            'storage, %(existing)d already generated and %(skipped)d skipped '
+            '(being generated or failed recently)' % counts)
+
+    def process(self, source, force):
+        """
+        Generate an image's renditions if they're needed.
+
+        Arguments:
+          - source: FieldFile of the image
+          - force:  regenerate the renditions even if they exist?
+        Return:
+          (str) what was done: 'existing', 'found', 'skipped', 'generated' or
+          'failed'
+        """
+        if not force:
+            state = get_rendition_state(source)
+            if state == CacheFileState.EXISTS:
+                return 'existing'
+            elif state in (CacheFileState.GENERATING, FAILED):
+                return 'skipped'
+            elif find_renditions(source):
+                return 'found'
+
+        if update_renditions(source.storage, source.name):
+            return 'generated'
+        self.stderr.write('Failed to generate renditions of %s' % source.name)
+        return 'failed'
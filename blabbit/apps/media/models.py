@@ -0,0 +1,21 @@
+from django.db import models
+from django.utils import timezone
+
+# Create your models here.
+
+class ImageBlob(models.Model):
+    """
+    An image file in storage, named by the hash of its content, and the number
+    of room photos and user avatars that reference it.
+
+    Identical uploads share one file (along with its thumbnail and renditions),
+    which is only deleted when its last reference goes. Images stored before
+    they were named by content have no ImageBlob and are each referenced once.
+    """
+    # storage name of the image file
+    name = models.CharField(max_length=100, unique=True)
+    references = models.PositiveIntegerField(default=1)
+    created_at = models.DateTimeField(default=timezone.now, editable=False)
+
+    def __unicode__(self):
+        return self.name
@@ -0,0 +1,34 @@
+"""
+Description:
+  rest_framework parsers for requests with image uploads.
+
+Table Of Contents:
+  - ImageMultiPartParser: multipart parser that checks image uploads as they
+                          stream in
+"""
+
+from rest_framework import parsers
+from rest_framework.exceptions import ParseError
+
+from blabbit.apps.media.uploadhandler import ImageUploadHandler, \
+    UploadRejected
+
+
+class ImageMultiPartParser(parsers.MultiPartParser):
+    """
+    Parser for multipart form data whose files must be images.
+
+    Files are received with `ImageUploadHandler`, so uploads that are too large
+    or aren't images are rejected with a parse error (400) without being
+    received in full.
+    """
+
+    def parse(self, stream, media_type=None, parser_context=None):
+        request = parser_context['request']
+        request._request.upload_handlers = [
+            ImageUploadHandler(request._request)]
+        try:
+            return super(ImageMultiPartParser, self).parse(
+                stream, media_type, parser_context)
+        except UploadRejected as exc:
+            raise ParseError(exc.args[0])
@@ -0,0 +1,294 @@
+"""
+Description:
+  Renditions of uploaded images, i.e. scaled copies of an image in the sizes and
+  formats clients display it in, so they never have to download the original.
+
+  The renditions of an image are listed (largest first) in MEDIA_RENDITIONS and
+  each is saved in every format of MEDIA_RENDITION_FORMATS that PIL can write.
+  All of an image's renditions are generated together on the media worker
+  threads:
+    - the source is decoded once, and JPEG sources are decoded at a reduced
+      scale when they are much larger than the largest rendition,
+    - each rendition is scaled down from the previous (larger) one rather than
+      from the source,
+    - and each rendition is encoded in every format.
+
+  Renditions are saved next to the source's imagekit thumbnails with names
+  derived from the source's name, so their URLs can be built without touching
+  storage. Whether they have been generated is kept in imagekit's cache, and
+  until they have been an image has no rendition URLs. Once they have been,
+  their URLs are kept in `blabbit.apps.media.urlcache`.
+
+  Looking up an image's rendition URLs never touches storage or queues
+  generation. Renditions are generated when an image is stored, and the
+  `generate_renditions` management command generates those of images stored
+  before renditions (or a rendition or format) were added, or whose state was
+  lost from the cache. Failures are remembered for
+  MEDIA_RENDITION_FAILURE_TIMEOUT seconds so they aren't retried on every run.
+
+Table Of Contents:
+  - get_rendition_formats: get the formats renditions are saved in
+  - get_rendition_name:    get the storage name of a rendition of an image
+  - get_rendition_urls:    get the URLs of an image's renditions
+  - get_rendition_state:   get the state of an image's renditions
+  - find_renditions:       check storage for an image's renditions
+  - schedule_renditions:   queue generation of an image's renditions
+  - update_renditions:     generate an image's renditions and record the outcome
+  - generate_renditions:   generate an image's renditions
+  - delete_renditions:     delete an image's renditions from storage
+"""
+
+from django.conf import settings
+from django.core.cache import get_cache
+from django.core.cache.backends.base import DEFAULT_TIMEOUT
+from django.core.files.base import ContentFile
+
+from imagekit.cachefiles.backends import CacheFileState
+from imagekit.processors import SmartResize, ResizeToFit, Adjust
+from imagekit.utils import open_image, process_image, sanitize_cache_key
+from PIL import Image
+
+from blabbit.apps.media.backends import get_worker_pool
+from blabbit.apps.media.storage import delete_files
+from blabbit.apps.media.urlcache import get_cached_urls, cache_urls, \
+    RENDITIONS
+
+import logging
+import os
+
+logger = logging.getLogger(__name__)
+
+# state of renditions that failed to generate, alongside imagekit's
+# CacheFileState values
+FAILED = 'failed'
+
+
+def get_rendition_formats():
+    """
+    Get the formats renditions are saved in, i.e. those formats of
+    MEDIA_RENDITION_FORMATS that PIL can write.
+
+    Arguments:
+      None
+    Return:
+      list of (PIL format, file extension, PIL save options) tuples
+    """
+    Image.init()
+    return [rendition_format for rendition_format in
+            settings.MEDIA_RENDITION_FORMATS
+            if rendition_format[0] in Image.SAVE]
+
+
+def get_rendition_name(source_name, rendition, extension):
+    """
+    Get the storage name of a rendition of an image.
+
+    Arguments:
+      - source_name: storage name of the image
+      - rendition:   name of the rendition
+      - extension:   file extension of the rendition's format
+    Return:
+      (str) storage name of the rendition
+    """
+    return '%s/%s/%s.%s' % (settings.IMAGEKIT_CACHEFILE_DIR,
+                            os.path.splitext(source_name)[0],
+                            rendition, extension)
+
+
+def _get_cache():
+    return get_cache(settings.IMAGEKIT_CACHE_BACKEND)
+
+
+def _get_state_key(source_name):
+    return sanitize_cache_key('%srenditions-%s-state' %
+                              (settings.IMAGEKIT_CACHE_PREFIX, source_name))
+
+
+def _set_state(source_name, state):
+    if state == CacheFileState.EXISTS:
+        # generated renditions only go with their source, so this never
+        # expires (unlike the cache's default timeout)
+        timeout = None
+    elif state == FAILED:
+        timeout = settings.MEDIA_RENDITION_FAILURE_TIMEOUT
+    else:
+        # renditions being generated are lost if the process exits, so let
+        # that expire
+        timeout = DEFAULT_TIMEOUT
+    _get_cache().set(_get_state_key(source_name), state, timeout)
+
+
+def get_rendition_state(source):
+    """
+    Get the state of an image's renditions, as recorded in the cache.
+
+    Arguments:
+      - source: FieldFile of the image
+    Return:
+      CacheFileState.EXISTS, CacheFileState.GENERATING or FAILED, or None if
+      the state isn't known
+    """
+    return _get_cache().get(_get_state_key(source.name))
+
+
+def find_renditions(source):
+    """
+    Check storage for an image's renditions, and record that they exist if
+    they're found. The smallest rendition is saved last so it only exists once
+    all renditions exist.
+
+    Arguments:
+      - source: FieldFile of the image
+    Return:
+      (bool) True if the renditions exist
+    """
+    rendition = settings.MEDIA_RENDITIONS[-1][0]
+    extension = get_rendition_formats()[-1][1]
+    if not source.storage.exists(
+        get_rendition_name(source.name, rendition, extension)):
+        return False
+
+    _set_state(source.name, CacheFileState.EXISTS)
+    return True
+
+
+def get_rendition_urls(source):
+    """
+    Get the URLs of an image's renditions. This only reads the cache: images
+    whose renditions aren't known to exist have none.
+
+    Arguments:
+      - source: FieldFile of the image
+    Return:
+      dictionary mapping each rendition's name to a dictionary of its URL in
+      each format (keyed by lowercase format name), e.g.
+        {'thumbnail_1x': {'jpeg': '...', 'webp': '...'}, ...}
+      This is empty if the image has no renditions yet.
+    """
+    if not source:
+        return {}
+
+    urls = get_cached_urls(RENDITIONS, source.name)
+    if urls is not None:
+        return urls
+
+    if get_rendition_state(source) != CacheFileState.EXISTS:
+        return {}
+
+    return _cache_rendition_urls(source.storage, source.name)
+
+
+def _cache_rendition_urls(storage, source_name):
+    """
+    Build the URLs of an image's generated renditions and cache them.
+    """
+    formats = get_rendition_formats()
+    urls = dict(
+        (rendition[0],
+         dict((pil_format.lower(), storage.url(
+                        get_rendition_name(source_name, rendition[0],
+                                           extension)))
+              for (pil_format, extension, options) in formats))
+        for rendition in settings.MEDIA_RENDITIONS)
+    cache_urls(RENDITIONS, source_name, urls)
+    return urls
+
+
+def schedule_renditions(source):
+    """
+    Queue generation of an image's renditions on the media worker threads.
+
+    Arguments:
+      - source: FieldFile of the image
+    Return:
+      None
+    """
+    _set_state(source.name, CacheFileState.GENERATING)
+    get_worker_pool().apply_async(update_renditions,
+                                  (source.storage, source.name))
+
+
+def update_renditions(storage, source_name):
+    """
+    Generate an image's renditions and record whether that worked, so their
+    URLs are listed or the failure isn't retried for a while.
+
+    Arguments:
+      - storage:     storage the image and its renditions are saved in
+      - source_name: storage name of the image
+    Return:
+      (bool) True if the renditions were generated
+    """
+    try:
+        generate_renditions(storage, source_name)
+    except Exception:
+        logger.exception('Failed to generate renditions of %s', source_name)
+        _set_state(source_name, FAILED)
+        return False
+
+    _set_state(source_name, CacheFileState.EXISTS)
+    _cache_rendition_urls(storage, source_name)
+    return True
+
+
+def generate_renditions(storage, source_name):
+    """
+    Generate an image's renditions, replacing any existing ones.
+
+    Arguments:
+      - storage:     storage the image and its renditions are saved in
+      - source_name: storage name of the image
+    Return:
+      None
+    """
+    formats = get_rendition_formats()
+    largest = settings.MEDIA_RENDITIONS[0]
+
+    source = storage.open(source_name)
+    try:
+        img = open_image(source)
+        # let the JPEG decoder scale the image down (by up to 8x) while
+        # decoding as long as it stays larger than the largest rendition
+        img.draft(img.mode, (largest[1], largest[2]))
+        img.load()
+    finally:
+        source.close()
+
+    for (rendition, width, height, crop) in settings.MEDIA_RENDITIONS:
+        if crop:
+            img = SmartResize(width=width, height=height).process(img)
+        else:
+            img = ResizeToFit(width=width, height=height,
+                              upscale=False).process(img)
+
+        # the adjusted image is only saved, so later renditions are still
+        # scaled from the unadjusted one
+        processors = [Adjust(contrast=1.2, sharpness=1.1)] if crop else []
+        for (pil_format, extension, options) in formats:
+            name = get_rendition_name(source_name, rendition, extension)
+            content = process_image(img, processors=processors,
+                                    format=pil_format, options=options)
+            if storage.exists(name):
+                storage.delete(name)
+            storage.save(name, ContentFile(content.read()))
+
+
+def delete_renditions(source, other_names=()):
+    """
+    Delete an image's renditions from storage, in one batch along with any
+    other files of the image (such as its thumbnail).
+
+    Arguments:
+      - source:      FieldFile of the image
+      - other_names: storage names of other files to delete with the
+                     renditions
+    Return:
+      None
+    """
+    names = list(other_names)
+    for rendition in settings.MEDIA_RENDITIONS:
+        for (pil_format, extension, options) in get_rendition_formats():
+            names.append(
+                get_rendition_name(source.name, rendition[0], extension))
+    delete_files(source.storage, names)
+    _get_cache().delete(_get_state_key(source.name))
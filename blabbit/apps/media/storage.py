@@ -0,0 +1,299 @@
+"""
+Description:
+  File storage backends for uploaded images and their thumbnails and
+  renditions.
+
+  Both backends:
+    - record the latency of each storage operation in this process, see
+      `get_latency_stats`,
+    - and have a `delete_many` method that deletes files concurrently on a
+      pool of MEDIA_STORAGE_WORKERS threads, which `delete_files` uses when
+      it's available.
+
+  `PooledS3BotoStorage` is used in production. Compared with django-storages'
+  S3BotoStorage it:
+    - shares one S3 connection, and so one pool of persistent HTTP connections,
+      among all storage instances and threads of a process rather than opening
+      one per storage instance,
+    - uploads files larger than MEDIA_STORAGE_MULTIPART_THRESHOLD as multipart
+      uploads whose parts are uploaded concurrently,
+    - deletes files in batches of up to 1000 with S3's multi-object delete,
+    - and can be pointed at an S3-compatible stand-in (such as a local fake S3
+      server) with the AWS_S3_HOST, AWS_S3_PORT and AWS_S3_USE_SSL settings.
+
+  `FileSystemStorage` stores files under MEDIA_ROOT, for development and for
+  trying storage changes without S3.
+
+Table Of Contents:
+  - get_latency_stats:   get latency statistics of storage operations
+  - reset_latency_stats: discard latency statistics of storage operations
+  - delete_files:        delete files from a storage, in one batch if possible
+  - FileSystemStorage:   local filesystem storage
+  - PooledS3BotoStorage: Amazon S3 storage
+"""
+
+from django.conf import settings
+from django.core.files import storage
+
+from storages.backends.s3boto import S3BotoStorage
+
+from contextlib import contextmanager
+from io import BytesIO
+from multiprocessing import pool
+import logging
+import threading
+import time
+
+logger = logging.getLogger(__name__)
+
+# max number of keys S3 deletes in a multi-object delete request
+MAX_DELETE_BATCH_SIZE = 1000
+
+# operation -> [count, total seconds, max seconds] of this process' storage
+# operations
+_latencies = {}
+_latencies_lock = threading.Lock()
+
+# this process' pool of storage I/O threads. It's separate from the media
+# worker pool so storage I/O started by workers can't wait on itself.
+_io_pool = None
+_io_pool_lock = threading.Lock()
+
+
+def get_io_pool():
+    """
+    Get this process' pool of MEDIA_STORAGE_WORKERS storage I/O threads.
+
+    Return:
+      multiprocessing.pool.ThreadPool object
+    """
+    global _io_pool
+    with _io_pool_lock:
+        if _io_pool is None:
+            _io_pool = pool.ThreadPool(settings.MEDIA_STORAGE_WORKERS)
+        return _io_pool
+
+
+@contextmanager
+def timed(operation):
+    """
+    Record the latency of a storage operation run in this context.
+    """
+    start = time.time()
+    try:
+        yield
+    finally:
+        seconds = time.time() - start
+        with _latencies_lock:
+            latency = _latencies.setdefault(operation, [0, 0.0, 0.0])
+            latency[0] += 1
+            latency[1] += seconds
+            latency[2] = max(latency[2], seconds)
+
+
+def get_latency_stats():
+    """
+    Get latency statistics of the storage operations of this process.
+
+    Arguments:
+      None
+    Return:
+      dictionary mapping each operation (e.g. 'save') to a dictionary with its
+      'count', and 'mean_ms' and 'max_ms' latency in milliseconds
+    """
+    with _latencies_lock:
+        return dict((operation, {'count': count,
+                                 'mean_ms': 1000 * total / count,
+                                 'max_ms': 1000 * maximum})
+                    for (operation, (count, total, maximum))
+                    in _latencies.items())
+
+
+def reset_latency_stats():
+    """
+    Discard latency statistics of the storage operations of this process.
+
+    Arguments:
+      None
+    Return:
+      None
+    """
+    with _latencies_lock:
+        _latencies.clear()
+
+
+def delete_files(file_storage, names):
+    """
+    Delete files from a storage, in one batch if the storage supports it.
+
+    Arguments:
+      - file_storage: Storage object
+      - names:        storage names of files to delete
+    Return:
+      None
+    """
+    if hasattr(file_storage, 'delete_many'):
+        file_storage.delete_many(names)
+    else:
+        for name in names:
+            file_storage.delete(name)
+
+
+def _wait_for_all(results):
+    """
+    Wait for all asynchronous results, then raise the first error if any
+    failed.
+    """
+    error = None
+    for result in results:
+        try:
+            result.get()
+        except Exception as e:
+            logger.exception('Storage operation failed')
+            error = error or e
+    if error is not None:
+        raise error
+
+
+class TimedStorageMixin(object):
+    """
+    Storage mixin that records operation latencies and deletes files
+    concurrently.
+    """
+
+    def _open(self, name, mode='rb'):
+        with timed('open'):
+            return super(TimedStorageMixin, self)._open(name, mode)
+
+    def _save(self, name, content):
+        with timed('save'):
+            return super(TimedStorageMixin, self)._save(name, content)
+
+    def delete(self, name):
+        with timed('delete'):
+            super(TimedStorageMixin, self).delete(name)
+
+    def exists(self, name):
+        with timed('exists'):
+            return super(TimedStorageMixin, self).exists(name)
+
+    def delete_many(self, names):
+        """
+        Delete files concurrently, returning once all are deleted.
+
+        Arguments:
+          - names: storage names of files to delete
+        Return:
+          None
+        """
+        if not names:
+            return
+        with timed('delete_many'):
+            self._delete_many(list(names))
+
+    def _delete_many(self, names):
+        _wait_for_all([get_io_pool().apply_async(self.delete, (name,))
+                       for name in names])
+
+
+class FileSystemStorage(TimedStorageMixin, storage.FileSystemStorage):
+    """
+    Local filesystem storage with operation latencies and concurrent deletes.
+    """
+    pass
+
+
+class PooledS3BotoStorage(TimedStorageMixin, S3BotoStorage):
+    """
+    Amazon S3 storage sharing one connection pool per process, with concurrent
+    multipart uploads and batched deletes.
+    """
+    host = getattr(settings, 'AWS_S3_HOST', None)
+    port = getattr(settings, 'AWS_S3_PORT', None)
+    use_ssl = getattr(settings, 'AWS_S3_USE_SSL', True)
+    multipart_threshold = settings.MEDIA_STORAGE_MULTIPART_THRESHOLD
+    multipart_chunk_size = settings.MEDIA_STORAGE_MULTIPART_CHUNK_SIZE
+
+    # (access key, host, port, use_ssl) -> S3Connection shared by this
+    # process' storages
+    _connections = {}
+    _connections_lock = threading.Lock()
+
+    @property
+    def connection(self):
+        """
+        The S3 connection of this process for this storage's credentials and
+        host. boto keeps a thread-safe pool of persistent HTTP connections per
+        S3 connection, so all threads share those.
+        """
+        if self._connection is None:
+            key = (self.access_key, self.host, self.port, self.use_ssl)
+            with self._connections_lock:
+                if key not in self._connections:
+                    kwargs = {'is_secure': self.use_ssl}
+                    if self.host:
+                        kwargs['host'] = self.host
+                    if self.port:
+                        kwargs['port'] = self.port
+                    self._connections[key] = self.connection_class(
+                        self.access_key, self.secret_key,
+                        calling_format=self.calling_format, **kwargs)
+                self._connection = self._connections[key]
+        return self._connection
+
+    def _save_content(self, key, content, headers):
+        """
+        Upload a file's content, as a concurrent multipart upload if it's
+        larger than MEDIA_STORAGE_MULTIPART_THRESHOLD.
+        """
+        if content.size <= self.multipart_threshold:
+            super(PooledS3BotoStorage, self)._save_content(key, content,
+                                                           headers)
+            return
+
+        kwargs = {}
+        if self.encryption:
+            kwargs['encrypt_key'] = self.encryption
+        upload = self.bucket.initiate_multipart_upload(
+            key.name, headers=headers, policy=self.default_acl,
+            reduced_redundancy=self.reduced_redundancy, **kwargs)
+        try:
+            # parts are read one at a time, and at most MEDIA_STORAGE_WORKERS
+            # of them are held in memory while they're uploaded
+            content.seek(0)
+            pending = []
+            part_number = 0
+            while True:
+                data = content.read(self.multipart_chunk_size)
+                if not data:
+                    break
+                part_number += 1
+                pending.append(get_io_pool().apply_async(
+                        upload.upload_part_from_file,
+                        (BytesIO(data), part_number)))
+                if len(pending) >= settings.MEDIA_STORAGE_WORKERS:
+                    pending.pop(0).get()
+            _wait_for_all(pending)
+            upload.complete_upload()
+        except Exception:
+            upload.cancel_upload()
+            raise
+
+    def _delete_many(self, names):
+        """
+        Delete files in batches of up to 1000 keys, sending batches
+        concurrently.
+        """
+        keys = [self._encode_name(self._normalize_name(self._clean_name(name)))
+                for name in names]
+        _wait_for_all([
+                get_io_pool().apply_async(self._delete_batch,
+                                          (keys[i:i + MAX_DELETE_BATCH_SIZE],))
+                for i in range(0, len(keys), MAX_DELETE_BATCH_SIZE)])
+
+    def _delete_batch(self, keys):
+        result = self.bucket.delete_keys(keys, quiet=True)
+        if result.errors:
+            raise IOError('Failed to delete %s' % ', '.join(
+                    '%s (%s)' % (error.key, error.message)
+                    for error in result.errors))
@@ -0,0 +1,116 @@
+"""
+Description:
+  Upload handlers for image uploads.
+
+  Django's default upload handlers buffer uploads of up to 2.5MB in memory and
+  only let the serializers check an upload's size and type once all of it has
+  been received. `ImageUploadHandler` instead checks uploads while they are
+  being received and spools them straight to disk, so a request can't make a
+  worker hold a large upload in memory or receive more than an image's worth of
+  data:
+    - a request whose body is larger than MAX_IMAGE_SIZE (plus some room for
+      other form fields) is rejected before any of it is read,
+    - an upload is rejected as soon as more than MAX_IMAGE_SIZE bytes of it are
+      received,
+    - and an upload is rejected as soon as its first bytes show it isn't a
+      JPEG, PNG or GIF image.
+
+Table Of Contents:
+  - UploadRejected:     exception raised when an upload is rejected
+  - ImageUploadHandler: upload handler that checks image uploads as they stream
+"""
+
+from django.conf import settings
+from django.core.files.uploadhandler import TemporaryFileUploadHandler, \
+    UploadFileException
+from django.utils.translation import ugettext_lazy as _
+
+from blabbit.utils import human_readable_size
+
+# bytes of a request body allowed on top of an image for other form fields and
+# multipart boundaries and headers
+MAX_FORM_OVERHEAD = 64 * 1024
+
+# file signatures (i.e. "magic numbers") of accepted image formats
+IMAGE_SIGNATURES = (
+    b'\xff\xd8\xff',                 # JPEG
+    b'\x89PNG\r\n\x1a\n',            # PNG
+    b'GIF87a',                       # GIF
+    b'GIF89a',                       # GIF
+    )
+
+# number of bytes of an upload needed to recognize its signature
+SIGNATURE_LENGTH = max(len(signature) for signature in IMAGE_SIGNATURES)
+
+
+class UploadRejected(UploadFileException):
+    """
+    Raised by `ImageUploadHandler` when it rejects an upload, ending the
+    request's parsing.
+    """
+    pass
+
+
+class ImageUploadHandler(TemporaryFileUploadHandler):
+    """
+    Upload handler that streams image uploads to temporary files on disk,
+    rejecting uploads that are too large or aren't images as soon as that's
+    known.
+    """
+
+    def handle_raw_input(self, input_data, META, content_length, boundary,
+                         encoding=None):
+        """
+        Reject requests that are too large to be an image upload before any of
+        them is read.
+        """
+        if content_length > settings.MAX_IMAGE_SIZE + MAX_FORM_OVERHEAD:
+            raise UploadRejected(
+                _("Ensure this file's size is at most %s (it is %s).")
+                % (human_readable_size(settings.MAX_IMAGE_SIZE),
+                   human_readable_size(content_length)))
+
+    def new_file(self, *args, **kwargs):
+        super(ImageUploadHandler, self).new_file(*args, **kwargs)
+        self.signature = b''
+
+    def receive_data_chunk(self, raw_data, start):
+        """
+        Reject the upload once it's too large or its signature isn't an image's
+        """
+        received = start + len(raw_data)
+        if received > settings.MAX_IMAGE_SIZE:
+            self.reject(
+                _("Ensure this file's size is at most %s (it is at least %s).")
+                % (human_readable_size(settings.MAX_IMAGE_SIZE),
+                   human_readable_size(received)))
+
+        if len(self.signature) < SIGNATURE_LENGTH:
+            self.signature += raw_data[:SIGNATURE_LENGTH - len(self.signature)]
+            if len(self.signature) == SIGNATURE_LENGTH:
+                self.check_signature()
+
+        return super(ImageUploadHandler, self).receive_data_chunk(raw_data,
+                                                                  start)
+
+    def file_complete(self, file_size):
+        # uploads too short to fill a signature haven't been checked yet
+        if len(self.signature) < SIGNATURE_LENGTH:
+            self.check_signature()
+        return super(ImageUploadHandler, self).file_complete(file_size)
+
+    def check_signature(self):
+        """
+        Reject the upload if it doesn't start with an image signature.
+        """
+        if not any(self.signature.startswith(signature)
+                   for signature in IMAGE_SIGNATURES):
+            self.reject(_('Upload a valid image. The file you uploaded was '
+                          'either not an image or a corrupted image.'))
+
+    def reject(self, message):
+        """
+        Delete the upload's temporary file and reject the upload.
+        """
+        self.file.close()
+        raise UploadRejected(message)
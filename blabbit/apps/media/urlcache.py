@@ -0,0 +1,134 @@
+"""
+Description:
+  A cache of the URLs of images' thumbnails and renditions.
+
+  Getting a thumbnail's URL through imagekit means building its spec, hashing
+  the spec to get the thumbnail's name, checking the thumbnail's state in the
+  cache (or storage) and then asking storage for the URL. Serializing a page of
+  rooms or users did this for every row. Images are stored by their content
+  (see `blabbit.apps.media.blobs`), so an image's name always gives the same
+  thumbnail and renditions at the same URLs, which makes the URLs safe to
+  cache until the image's files are deleted.
+
+  URLs are kept in imagekit's cache (IMAGEKIT_CACHE_BACKEND) next to the
+  states of the files they're for, so they're shared by all server processes
+  and discarding an image's URLs when its files are deleted takes effect in
+  every process. They expire after MEDIA_URL_CACHE_TIMEOUT seconds, which
+  bounds how long a URL lost to a missed discard can live. The URLs of a page
+  of images can be fetched with one cache request, see `get_many_cached_urls`.
+
+  URLs are cached when their files are generated and the first time they're
+  looked up otherwise. Images without generated files aren't cached, so
+  they're looked up again until their files exist.
+
+Table Of Contents:
+  - get_thumbnail_url:    get the URL of an image's thumbnail
+  - get_cached_urls:      get cached URLs of an image's generated files
+  - get_many_cached_urls: get cached URLs of the generated files of images
+  - cache_urls:           cache URLs of an image's generated files
+  - discard_urls:         discard cached URLs of an image's files
+"""
+
+from django.conf import settings
+from django.core.cache import get_cache
+
+from imagekit.utils import sanitize_cache_key
+
+# kind of cached URL of an image's thumbnail. Each image field has one
+# thumbnail spec.
+THUMBNAIL = 'thumbnail'
+
+# kind of cached URLs of an image's renditions
+RENDITIONS = 'renditions'
+
+
+def _get_cache():
+    return get_cache(settings.IMAGEKIT_CACHE_BACKEND)
+
+
+def _get_key(kind, source_name):
+    return sanitize_cache_key('%surls-%s-%s' % (
+            settings.IMAGEKIT_CACHE_PREFIX, kind, source_name))
+
+
+def get_cached_urls(kind, source_name):
+    """
+    Get cached URLs of an image's generated files.
+
+    Arguments:
+      - kind:        kind of files, e.g. THUMBNAIL
+      - source_name: storage name of the image
+    Return:
+      cached URL(s), or None if they aren't cached
+    """
+    return _get_cache().get(_get_key(kind, source_name))
+
+
+def get_many_cached_urls(kind, source_names):
+    """
+    Get cached URLs of the generated files of images, with one cache request.
+
+    Arguments:
+      - kind:         kind of files, e.g. THUMBNAIL
+      - source_names: storage names of the images
+    Return:
+      dictionary mapping the name of each image whose URLs are cached to its
+      cached URL(s)
+    """
+    keys = dict((_get_key(kind, source_name), source_name)
+                for source_name in source_names)
+    if not keys:
+        return {}
+    return dict((keys[key], urls) for (key, urls) in
+                _get_cache().get_many(list(keys)).items())
+
+
+def cache_urls(kind, source_name, urls):
+    """
+    Cache URLs of an image's generated files.
+
+    Arguments:
+      - kind:        kind of files, e.g. THUMBNAIL
+      - source_name: storage name of the image
+      - urls:        URL(s) of the files
+    Return:
+      None
+    """
+    _get_cache().set(_get_key(kind, source_name), urls,
+                     settings.MEDIA_URL_CACHE_TIMEOUT)
+
+
+def discard_urls(source_name):
+    """
+    Discard cached URLs of an image's files, e.g. when they're deleted.
+
+    Arguments:
+      - source_name: storage name of the image
+    Return:
+      None
+    """
+    _get_cache().delete_many([_get_key(kind, source_name)
+                              for kind in (THUMBNAIL, RENDITIONS)])
+
+
+def get_thumbnail_url(instance, attname, source):
+    """
+    Get the URL of an image's thumbnail.
+
+    Arguments:
+      - instance: model instance with the image
+      - attname:  name of the instance's ImageSpecField for the thumbnail
+      - source:   FieldFile of the image
+    Return:
+      (str) URL of thumbnail, or an empty string if there isn't a thumbnail
+    """
+    if not source:
+        return ''
+
+    url = get_cached_urls(THUMBNAIL, source.name)
+    if url is None:
+        thumbnail = getattr(instance, attname)
+        url = thumbnail.url if thumbnail else ''
+        if url:
+            cache_urls(THUMBNAIL, source.name, url)
+    return url
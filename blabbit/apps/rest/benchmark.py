@@ -0,0 +1,104 @@
+"""
+Description:
+  Helpers shared by the management commands that benchmark serializing and
+  rendering pages of the API, so each command only has to say what it times.
+
+Table Of Contents:
+  - benchmark_options:     get the --rows and --repeat options of a command
+  - get_benchmark_request: get an API request to serialize pages for
+  - time_calls:            time repeated calls of a function
+  - format_times:          format the times of a page's calls
+  - format_speedup:        format the speedup of one set of calls over another
+"""
+
+from django.contrib.auth.models import AnonymousUser
+from django.test.client import RequestFactory
+
+from optparse import make_option
+import time
+
+
+def benchmark_options(rows, repeat, objects='objects'):
+    """
+    Get the --rows and --repeat options of a benchmark command.
+
+    Arguments:
+      - rows:    default number of objects per page
+      - repeat:  default number of times each page is timed
+      - objects: what's on a page, for the help text
+    Return:
+      tuple of optparse options
+    """
+    return (
+        make_option('--rows', type='int', dest='rows', default=rows,
+                    help='Number of %s per page [default: %d]' %
+                    (objects, rows)),
+        make_option('--repeat', type='int', dest='repeat', default=repeat,
+                    help='Number of times each page is timed [default: %d]' %
+                    repeat),
+        )
+
+
+def get_benchmark_request(user=None, path='/api/v1/rooms/'):
+    """
+    Get an API request to serialize pages for, as a view would.
+
+    Arguments:
+      - user: user making the request, anonymous if this is None
+      - path: path of the request
+    Return:
+      HttpRequest object
+    """
+    request = RequestFactory().get(path)
+    request.user = user if user is not None else AnonymousUser()
+    return request
+
+
+def time_calls(func, repeat, before=None):
+    """
+    Time repeated calls of a function.
+
+    Arguments:
+      - func:   function to time, called without arguments
+      - repeat: number of calls
+      - before: function called (untimed) before each call, e.g. to clear a
+                cache, or None
+    Return:
+      list of the seconds each call took
+    """
+    times = []
+    for i in range(repeat):
+        if before is not None:
+            before()
+        start = time.time()
+        func()
+        times.append(time.time() - start)
+    return times
+
+
+def format_times(times):
+    """
+    Format the times of a page's calls.
+
+    Arguments:
+      - times: seconds each call took
+    Return:
+      (str) mean and minimum milliseconds per page
+    """
+    return 'mean %.2f ms, min %.2f ms per page' % (
+        1000 * sum(times) / len(times), 1000 * min(times))
+
+
+def format_speedup(baseline_times, times):
+    """
+    Format the speedup of one set of calls over another.
+
+    Arguments:
+      - baseline_times: seconds each call being improved on took
+      - times:          seconds each improved call took
+    Return:
+      (str) ratio of the mean times
+    """
+    baseline_mean = sum(baseline_times) / len(baseline_times)
+    mean = sum(times) / len(times)
+    return 'speedup (mean): %.1fx' % (baseline_mean / max(mean, 1e-9))
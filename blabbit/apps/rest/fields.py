@@ -0,0 +1,30 @@
+"""
+Customize rest_framework hyperlinked fields to build URLs from cached URL
+templates (see `blabbit.apps.rest.reverse`)
+"""
+from django.core.urlresolvers import NoReverseMatch
+from rest_framework import serializers
+
+from blabbit.apps.rest.reverse import reverse_lookup
+
+
+class HyperlinkedIdentityField(serializers.HyperlinkedIdentityField):
+    """
+    HyperlinkedIdentityField that substitutes each object's lookup value into
+    its view's URL template rather than reversing the view for every object.
+    """
+
+    def get_url(self, obj, view_name, request, format):
+        lookup_value = getattr(obj, self.lookup_field, None)
+
+        # Handle unsaved object case
+        if lookup_value is None:
+            return None
+
+        try:
+            return reverse_lookup(view_name, self.lookup_field, lookup_value,
+                                  request=request, format=format)
+        except NoReverseMatch:
+            # let rest_framework try its other lookups
+            return super(HyperlinkedIdentityField, self).get_url(
+                obj, view_name, request, format)
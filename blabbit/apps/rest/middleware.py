@@ -0,0 +1,239 @@
+"""
+Description:
+  Gzip compression of API responses.
+
+  Pages of rooms and users are mostly repeated keys and URLs, so they compress
+  to a fraction of their size. `CompressionMiddleware` gzips responses to
+  requests under API_COMPRESSION_PATH_PREFIX from clients that accept it:
+    - responses smaller than API_COMPRESSION_MIN_SIZE aren't compressed, as
+      the bytes saved aren't worth the time,
+    - responses that are already compressed (they have a Content-Encoding or
+      are of a compressed type such as an image) aren't compressed again,
+    - responses that don't get smaller are sent uncompressed,
+    - and streaming responses are compressed chunk by chunk as they're sent,
+      so large bodies are never held in memory.
+  The compression level (1 is fastest, 9 is smallest) is API_COMPRESSION_LEVEL.
+
+  The compression ratio and time of each endpoint are recorded in this
+  process, see `get_compression_stats`, so the level and minimum size can be
+  tuned to trade bandwidth against CPU. The time is the CPU time of the
+  compressing thread where that can be measured, and otherwise wall clock
+  time, which also counts time the thread spent waiting for the CPU. Which
+  one is recorded is given by CLOCK.
+
+Table Of Contents:
+  - get_compression_stats:   get compression statistics of API endpoints
+  - reset_compression_stats: discard compression statistics of API endpoints
+  - compress_string:         gzip a string
+  - CompressionMiddleware:   middleware that gzips API responses
+"""
+
+from django.conf import settings
+from django.utils.cache import patch_vary_headers
+
+import re
+import sys
+import threading
+import time
+import zlib
+
+try:
+    import resource
+except ImportError:
+    # not available on Windows
+    resource = None
+
+# content types of responses that are already compressed
+COMPRESSED_CONTENT_TYPES = ('image/', 'audio/', 'video/', 'application/zip',
+                            'application/gzip', 'application/x-gzip')
+
+re_accepts_gzip = re.compile(r'\bgzip\b')
+
+# who of getrusage() for the calling thread. Python 2 doesn't define it, but
+# Linux has it
+RUSAGE_THREAD = getattr(resource, 'RUSAGE_THREAD',
+                        1 if sys.platform.startswith('linux') else None)
+
+
+def _get_thread_time():
+    usage = resource.getrusage(RUSAGE_THREAD)
+    return usage.ru_utime + usage.ru_stime
+
+
+# clock compression is timed with, and what it measures: 'thread_cpu' (CPU
+# time of the current thread) or 'wall' (wall clock time)
+if hasattr(time, 'thread_time'):
+    _clock, CLOCK = time.thread_time, 'thread_cpu'
+elif resource is not None and RUSAGE_THREAD is not None:
+    _clock, CLOCK = _get_thread_time, 'thread_cpu'
+else:
+    _clock, CLOCK = time.time, 'wall'
+
+# endpoint -> [responses, compressed responses, bytes in, bytes out, seconds]
+# of this process' compressed API responses
+_stats = {}
+_stats_lock = threading.Lock()
+
+
+def _record(endpoint, compressed, bytes_in, bytes_out, seconds):
+    """
+    Record the compression of an endpoint's response.
+    """
+    with _stats_lock:
+        stats = _stats.setdefault(endpoint, [0, 0, 0, 0, 0.0])
+        stats[0] += 1
+        stats[1] += 1 if compressed else 0
+        stats[2] += bytes_in
+        stats[3] += bytes_out
+        stats[4] += seconds
+
+
+def get_compression_stats():
+    """
+    Get compression statistics of the API endpoints of this process.
+
+    Arguments:
+      None
+    Return:
+      dictionary mapping each endpoint's view name to a dictionary with:
+      - responses:   number of responses that were compressed (or that didn't
+                     get smaller so were sent uncompressed)
+      - compressed:  number of responses sent compressed
+      - bytes_in:    total size of responses before compression
+      - bytes_out:   total size of responses as sent
+      - ratio:       bytes_out / bytes_in
+      - mean_ms:     mean time spent compressing a response, in milliseconds
+      - clock:       what the time is, see CLOCK
+    """
+    with _stats_lock:
+        return dict(
+            (endpoint, {'responses': responses,
+                        'compressed': compressed,
+                        'bytes_in': bytes_in,
+                        'bytes_out': bytes_out,
+                        'ratio': float(bytes_out) / max(bytes_in, 1),
+                        'mean_ms': 1000 * seconds / responses,
+                        'clock': CLOCK})
+            for (endpoint, (responses, compressed, bytes_in, bytes_out,
+                            seconds)) in _stats.items())
+
+
+def reset_compression_stats():
+    """
+    Discard compression statistics of the API endpoints of this process.
+
+    Arguments:
+      None
+    Return:
+      None
+    """
+    with _stats_lock:
+        _stats.clear()
+
+
+def _get_compressor(level):
+    # wbits of 16 + MAX_WBITS gives a gzip header and trailer
+    return zlib.compressobj(level, zlib.DEFLATED, 16 + zlib.MAX_WBITS)
+
+
+def compress_string(s, level):
+    """
+    Gzip a string.
+
+    Arguments:
+      - s:     (bytes) string to compress
+      - level: compression level, from 1 (fastest) to 9 (smallest)
+    Return:
+      (bytes) gzipped string
+    """
+    compressor = _get_compressor(level)
+    return compressor.compress(s) + compressor.flush()
+
+
+class CompressionMiddleware(object):
+    """
+    Middleware that gzips API responses for clients that accept it.
+    This should be the first middleware so it sees responses last.
+    """
+
+    def process_response(self, request, response):
+        if not request.path.startswith(settings.API_COMPRESSION_PATH_PREFIX):
+            return response
+
+        # don't compress responses that are already compressed
+        if response.has_header('Content-Encoding'):
+            return response
+        content_type = response.get('Content-Type', '').lower()
+        if content_type.startswith(COMPRESSED_CONTENT_TYPES):
+            return response
+
+        # it's not worth compressing small responses
+        if (not response.streaming and
+            len(response.content) < settings.API_COMPRESSION_MIN_SIZE):
+            return response
+
+        patch_vary_headers(response, ('Accept-Encoding',))
+
+        if not re_accepts_gzip.search(
+            request.META.get('HTTP_ACCEPT_ENCODING', '')):
+            return response
+
+        endpoint = self.get_endpoint(request)
+        level = settings.API_COMPRESSION_LEVEL
+        if response.streaming:
+            # the length of the compressed content isn't known until it's
+            # all been sent
+            response.streaming_content = self.compress_sequence(
+                response.streaming_content, level, endpoint)
+            del response['Content-Length']
+        else:
+            start = _clock()
+            compressed = compress_string(response.content, level)
+            seconds = _clock() - start
+
+            if len(compressed) >= len(response.content):
+                _record(endpoint, False, len(response.content),
+                        len(response.content), seconds)
+                return response
+
+            _record(endpoint, True, len(response.content), len(compressed),
+                    seconds)
+            response.content = compressed
+            response['Content-Length'] = str(len(response.content))
+
+        if response.has_header('ETag'):
+            response['ETag'] = re.sub('"$', ';gzip"', response['ETag'])
+        response['Content-Encoding'] = 'gzip'
+        return response
+
+    def get_endpoint(self, request):
+        """
+        Get the name of the endpoint a request was for, i.e. the view name of
+        its URL.
+        """
+        match = getattr(request, 'resolver_match', None)
+        return match.view_name if match is not None else 'unresolved'
+
+    def compress_sequence(self, sequence, level, endpoint):
+        """
+        Gzip the chunks of a streaming response as they're sent. Each chunk is
+        flushed so clients get it without waiting for the next one.
+        """
+        compressor = _get_compressor(level)
+        bytes_in = bytes_out = 0
+        seconds = 0.0
+        for chunk in sequence:
+            bytes_in += len(chunk)
+            start = _clock()
+            data = compressor.compress(chunk) + \
+                compressor.flush(zlib.Z_SYNC_FLUSH)
+            seconds += _clock() - start
+            bytes_out += len(data)
+            yield data
+
+        start = _clock()
+        data = compressor.flush()
+        seconds += _clock() - start
+        bytes_out += len(data)
+        yield data
+        _record(endpoint, True, bytes_in, bytes_out, seconds)
@@ -1,5 +1,12 @@
 from rest_framework import mixins, status
+from rest_framework.exceptions import ParseError
 from rest_framework.response import Response
+from rest_framework.templatetags.rest_framework import replace_query_param
+
+from django.db.models.query import QuerySet
+from django.http import Http404
+
+import base64
 
 
 class UpdateModelMixin(mixins.UpdateModelMixin):
@@ -40,3 +47,126 @@ class UpdateModelMixin(mixins.UpdateModelMixin):
         self.object = serializer.save(force_update=True)
         self.post_save(self.object, created=False)
         return Response(serializer.data, status=status.HTTP_200_OK)
+
+
+class CompiledListMixin(object):
+    """
+    Mixin for read-only list views that serializes with a precompiled
+    serializer (see `blabbit.apps.rest.serializers`) rather than the view's
+    `serializer_class`, which it still uses for everything else.
+    
+    Querysets are listed as rows of the precompiled serializer's columns, so
+    no model instances are built. Other object lists (such as a leaderboard or
+    search results) are listed as is.
+    """
+    compiled_serializer_class = None
+    
+    def get_compiled_serializer(self):
+        """
+        Get the precompiled serializer for this request.
+        """
+        return self.compiled_serializer_class(self.get_serializer_context())
+    
+    def list(self, request, *args, **kwargs):
+        """
+        List the page of objects, or all objects if the view isn't paginated,
+        with the same output as rest_framework's ListModelMixin.
+        """
+        self.object_list = self.filter_queryset(self.get_queryset())
+        if isinstance(self.object_list, QuerySet):
+            self.object_list = self.object_list.values(
+                *self.compiled_serializer_class.columns)
+        
+        if not self.allow_empty and not self.object_list:
+            class_name = self.__class__.__name__
+            raise Http404(self.empty_error % {'class_name': class_name})
+        
+        # the page has to be fetched before the serializer is created, as
+        # paginating can add to the serializer context
+        page = self.paginate_queryset(self.object_list)
+        serializer = self.get_compiled_serializer()
+        if page is not None:
+            return Response(serializer.paginate(page))
+        return Response(serializer.serialize(self.object_list))
+
+
+class KeysetPaginationMixin(object):
+    """
+    Mixin for list views paginated by keyset rather than by page number: the
+    next page starts after the sort key of the last object listed, so every
+    page is read off an index no matter how deep into the list it is.
+    
+    The position in the list is passed as an opaque `cursor` query parameter,
+    and each page links to the next with its cursor.
+    
+    Views set `cursor_types`, the type of each part of their sort key, and
+    define:
+      - get_cursor_key(obj):         get the sort key of a listed object
+      - filter_after(queryset, key): filter a queryset to the objects after a
+                                     sort key
+    """
+    cursor_query_param = 'cursor'
+    cursor_types = (int,)
+    
+    def get_keyset_page(self, queryset):
+        """
+        Get the requested page of objects.
+        
+        Arguments:
+          - queryset: QuerySet of all objects in the order of their sort key
+        Return:
+          tuple of the list of objects in the page and the URL of the next
+          page, or None if there are no more objects
+        Raises:
+          ParseError if the cursor is invalid
+        """
+        request = self.request
+        cursor = request.QUERY_PARAMS.get(self.cursor_query_param)
+        if cursor:
+            try:
+                key = self.decode_cursor(cursor)
+            except (TypeError, ValueError):
+                raise ParseError('Invalid cursor')
+            queryset = self.filter_after(queryset, key)
+        
+        # get one more object than the page size to know if there's a next page
+        page_size = self.get_paginate_by()
+        objects = list(queryset[:page_size + 1])
+        
+        next_url = None
+        if len(objects) > page_size:
+            objects = objects[:page_size]
+            next_url = replace_query_param(
+                request.build_absolute_uri(), self.cursor_query_param,
+                self.encode_cursor(self.get_cursor_key(objects[-1])))
+        return objects, next_url
+    
+    def encode_cursor(self, key):
+        """
+        Encode a position in the list as an opaque string
+        
+        Arguments:
+          - key: sort key tuple of last listed object
+        Return:
+          (str) cursor
+        """
+        return base64.urlsafe_b64encode(':'.join(
+                repr(value) if isinstance(value, float) else '%d' % value
+                for value in key).encode())
+    
+    def decode_cursor(self, cursor):
+        """
+        Decode a cursor created by `encode_cursor`
+        
+        Arguments:
+          - cursor: cursor string
+        Return:
+          sort key tuple
+        Raises:
+          TypeError or ValueError if the cursor is invalid
+        """
+        values = base64.urlsafe_b64decode(str(cursor)).decode().split(':')
+        if len(values) != len(self.cursor_types):
+            raise ValueError('Cursor has %d values' % len(values))
+        return tuple(cursor_type(value) for (cursor_type, value)
+                     in zip(self.cursor_types, values))
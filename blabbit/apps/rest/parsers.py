@@ -0,0 +1,47 @@
+"""
+Parsers of request data in formats beyond rest_framework's own
+"""
+from django.utils import six
+from rest_framework.exceptions import ParseError
+from rest_framework.parsers import BaseParser
+
+from blabbit.apps.rest.renderers import TIMESTAMP_EXT_TYPE, POINT_EXT_TYPE, \
+    decode_timestamp, decode_point
+
+import msgpack
+
+
+def decode_ext(code, data):
+    """
+    Decode the MessagePack extension types MessagePackRenderer renders.
+    Other extension types are left as ExtType objects.
+    """
+    if code == TIMESTAMP_EXT_TYPE:
+        return decode_timestamp(data)
+    elif code == POINT_EXT_TYPE:
+        return decode_point(data)
+    return msgpack.ExtType(code, data)
+
+
+class MessagePackParser(BaseParser):
+    """
+    Parses MessagePack-serialized data. Timestamps are parsed to datetimes
+    and points to GeoJSON, which the serializers' fields take as they take the
+    JSON equivalents.
+    """
+
+    media_type = 'application/x-msgpack'
+
+    def parse(self, stream, media_type=None, parser_context=None):
+        """
+        Returns a 2-tuple of `(data, files)`.
+
+        `data` will be an object which is the parsed content of the response.
+        `files` will always be `None`.
+        """
+        try:
+            return msgpack.unpackb(stream.read(), ext_hook=decode_ext,
+                                   raw=False)
+        except Exception as exc:
+            raise ParseError('MessagePack parse error - %s' %
+                             six.text_type(exc))
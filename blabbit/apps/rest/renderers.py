@@ -0,0 +1,265 @@
+"""
+Description:
+  MessagePack rendering of API data, a compact binary alternative to JSON for
+  the mobile clients. Clients ask for it with an `Accept: application/x-msgpack`
+  header or a `.msgpack` format suffix.
+
+  Data is rendered as JSON would be, except for two compact encodings:
+    - timestamps, i.e. datetimes and the formatted date/times of
+      TIMESTAMP_FIELDS, are MessagePack's timestamp extension type (-1) with
+      seconds and nanoseconds since the epoch in UTC,
+    - and GeoJSON points, such as room locations, are the POINT_EXT_TYPE
+      extension type with the point's longitude and latitude as two big-endian
+      doubles.
+  `blabbit.apps.rest.parsers.MessagePackParser` decodes both back to what JSON
+  clients send.
+
+Table Of Contents:
+  - encode_timestamp:        encode a datetime as a MessagePack timestamp
+  - encode_timestamp_string: encode a formatted date/time as a timestamp
+  - decode_timestamp:        decode a MessagePack timestamp to a datetime
+  - is_point:                check if a dictionary is a GeoJSON point
+  - encode_point:            encode a GeoJSON point as a MessagePack extension
+  - decode_point:            decode a MessagePack point extension to GeoJSON
+  - MessagePackRenderer:     renderer of MessagePack
+"""
+
+from django.db.models.query import QuerySet
+from django.utils import six, timezone
+from django.utils.encoding import force_text
+from django.utils.functional import Promise
+
+from rest_framework.renderers import BaseRenderer
+
+import msgpack
+
+import calendar
+import datetime
+import decimal
+import re
+import struct
+
+# MessagePack's extension type of timestamps
+TIMESTAMP_EXT_TYPE = -1
+
+# application extension type of GeoJSON points
+POINT_EXT_TYPE = 1
+
+# fields whose formatted date/times are rendered as timestamps
+TIMESTAMP_FIELDS = ('created_at', 'last_modified')
+
+# date/times as rest_framework's DateTimeField formats them
+DATETIME_RE = re.compile(r'^(\d{4})-(\d\d)-(\d\d)T(\d\d):(\d\d):(\d\d)'
+                         r'(?:\.(\d{1,6}))?(?:Z|([+-])(\d\d):(\d\d))$')
+
+EPOCH = datetime.datetime(1970, 1, 1, tzinfo=timezone.utc)
+
+
+def _pack_timestamp(seconds, nanoseconds):
+    """
+    Pack seconds and nanoseconds since the epoch in the smallest of the
+    timestamp extension's 32, 64 and 96-bit formats.
+    """
+    if seconds >> 34 == 0:
+        if nanoseconds == 0 and seconds >> 32 == 0:
+            # fixext 4
+            return b'\xd6\xff' + struct.pack('>I', seconds)
+        # fixext 8
+        return b'\xd7\xff' + struct.pack('>Q', nanoseconds << 34 | seconds)
+    # ext 8 with 12 bytes of data
+    return b'\xc7\x0c\xff' + struct.pack('>Iq', nanoseconds, seconds)
+
+
+def encode_timestamp(value):
+    """
+    Encode a datetime as a MessagePack timestamp. Naive datetimes are taken to
+    be in the default time zone.
+
+    Arguments:
+      - value: datetime object
+    Return:
+      (bytes) packed timestamp
+    """
+    if timezone.is_naive(value):
+        value = timezone.make_aware(value, timezone.get_default_timezone())
+    seconds = calendar.timegm(value.utctimetuple())
+    return _pack_timestamp(seconds, value.microsecond * 1000)
+
+
+def encode_timestamp_string(value):
+    """
+    Encode a formatted date/time as a MessagePack timestamp.
+
+    Arguments:
+      - value: date/time formatted as ISO 8601 with a UTC offset
+    Return:
+      (bytes) packed timestamp, or None if the value isn't such a date/time
+    """
+    match = DATETIME_RE.match(value)
+    if match is None:
+        return None
+
+    (year, month, day, hour, minute, second, fraction,
+     sign, offset_hours, offset_minutes) = match.groups()
+    seconds = calendar.timegm((int(year), int(month), int(day), int(hour),
+                               int(minute), int(second)))
+    if sign:
+        offset = int(offset_hours) * 3600 + int(offset_minutes) * 60
+        seconds -= offset if sign == '+' else -offset
+    nanoseconds = int((fraction or '').ljust(9, '0'))
+    return _pack_timestamp(seconds, nanoseconds)
+
+
+def decode_timestamp(data):
+    """
+    Decode the data of a MessagePack timestamp.
+
+    Arguments:
+      - data: (bytes) data of timestamp extension
+    Return:
+      timezone-aware datetime object in UTC
+    """
+    if len(data) == 4:
+        nanoseconds, seconds = 0, struct.unpack('>I', data)[0]
+    elif len(data) == 8:
+        data64 = struct.unpack('>Q', data)[0]
+        nanoseconds, seconds = data64 >> 34, data64 & 0x3ffffffff
+    elif len(data) == 12:
+        nanoseconds, seconds = struct.unpack('>Iq', data)
+    else:
+        raise ValueError('Invalid timestamp of %d bytes' % len(data))
+    return EPOCH + datetime.timedelta(seconds=seconds,
+                                      microseconds=nanoseconds // 1000)
+
+
+def is_point(value):
+    """
+    Check if a dictionary is a GeoJSON point, as GeometryField outputs it.
+    """
+    if len(value) != 2 or value.get('type') != 'Point':
+        return False
+    coordinates = value.get('coordinates')
+    return (isinstance(coordinates, (list, tuple)) and
+            len(coordinates) == 2 and
+            all(isinstance(coordinate, six.integer_types + (float,)) and
+                not isinstance(coordinate, bool)
+                for coordinate in coordinates))
+
+
+def encode_point(value):
+    """
+    Encode a GeoJSON point as a MessagePack extension.
+
+    Arguments:
+      - value: dictionary of GeoJSON point
+    Return:
+      (bytes) packed extension
+    """
+    # fixext 16
+    return (b'\xd8' + struct.pack('>b', POINT_EXT_TYPE) +
+            struct.pack('>dd', *value['coordinates']))
+
+
+def decode_point(data):
+    """
+    Decode the data of a MessagePack point extension.
+
+    Arguments:
+      - data: (bytes) data of point extension
+    Return:
+      dictionary of GeoJSON point
+    """
+    longitude, latitude = struct.unpack('>dd', data)
+    return {'type': 'Point', 'coordinates': [longitude, latitude]}
+
+
+class MessagePackRenderer(BaseRenderer):
+    """
+    Renderer which serializes to MessagePack, with compact timestamps and
+    GeoJSON points.
+    """
+
+    media_type = 'application/x-msgpack'
+    format = 'msgpack'
+    charset = None
+    render_style = 'binary'
+
+    def render(self, data, accepted_media_type=None, renderer_context=None):
+        """
+        Render `data` into MessagePack. The data is walked so that timestamps
+        and points are found without copying it, and each value is packed as
+        it's reached.
+        """
+        if data is None:
+            return bytes()
+
+        packer = msgpack.Packer(default=self.encode_default)
+        chunks = []
+        self.pack(packer, data, None, chunks.append)
+        return b''.join(chunks)
+
+    def pack(self, packer, data, key, write):
+        """
+        Pack a value.
+
+        Arguments:
+          - packer: msgpack Packer that returns what it packs
+          - data:   value to pack
+          - key:    key of the value if it's in a dictionary, otherwise None
+          - write:  function called with each packed chunk
+        Return:
+          None
+        """
+        if isinstance(data, dict):
+            if is_point(data):
+                write(encode_point(data))
+                return
+            write(packer.pack_map_header(len(data)))
+            for (k, v) in data.items():
+                write(packer.pack(k))
+                self.pack(packer, v, k, write)
+
+        elif isinstance(data, (list, tuple)):
+            write(packer.pack_array_header(len(data)))
+            for item in data:
+                self.pack(packer, item, None, write)
+
+        elif isinstance(data, datetime.datetime):
+            write(encode_timestamp(data))
+
+        elif key in TIMESTAMP_FIELDS and isinstance(data, six.string_types):
+            write(encode_timestamp_string(data) or packer.pack(data))
+
+        else:
+            write(packer.pack(data))
+
+    def encode_default(self, o):
+        """
+        Encode objects MessagePack can't, like rest_framework's JSONEncoder
+        does.
+        """
+        if isinstance(o, Promise):
+            return force_text(o)
+        elif isinstance(o, datetime.datetime):
+            r = o.isoformat()
+            if r.endswith('+00:00'):
+                r = r[:-6] + 'Z'
+            return r
+        elif isinstance(o, (datetime.date, datetime.time)):
+            return o.isoformat()
+        elif isinstance(o, datetime.timedelta):
+            return str(o.total_seconds())
+        elif isinstance(o, decimal.Decimal):
+            return str(o)
+        elif isinstance(o, QuerySet):
+            return list(o)
+        elif hasattr(o, 'tolist'):
+            return o.tolist()
+        elif hasattr(o, '__getitem__'):
+            try:
+                return dict(o)
+            except Exception:
+                pass
+        elif hasattr(o, '__iter__'):
+            return [i for i in o]
+        raise TypeError('%r is not MessagePack serializable' % (o,))
@@ -0,0 +1,118 @@
+"""
+Description:
+  Cheap construction of the absolute URLs serializers output for every object.
+
+  The URLs of objects' detail (and sub-collection) views only differ in the
+  object's lookup value, and absolute URIs of a request only differ in their
+  path. So rather than resolving every object's URL with `reverse()` and
+  building every absolute URI from the request:
+    - each view's URL is resolved once per process, with a placeholder for the
+      lookup value, into a template that objects' lookup values are quoted
+      into as `reverse()` would,
+    - and the scheme and host prefix of absolute URIs is built once per
+      request and kept on the request.
+
+  A lookup value is quoted into its template even if it doesn't match the
+  view's URL pattern, which `reverse()` would have refused. Lookup values of
+  rooms and users always match.
+
+Table Of Contents:
+  - get_absolute_uri_prefix: get the scheme and host prefix of a request's URIs
+  - build_absolute_uri:      get the absolute URI of a location
+  - reverse_lookup:          get the URL of an object's view by its lookup value
+"""
+
+from django.core.urlresolvers import reverse, get_script_prefix
+from django.utils.encoding import iri_to_uri
+from django.utils.http import urlquote
+
+import threading
+
+# placeholder reversed in place of lookup values. It only has characters that
+# lookup URL patterns accept and that aren't quoted.
+LOOKUP_PLACEHOLDER = 'LOOKUPVALUE0'
+
+# (script prefix, view name, lookup field, format) -> (path before lookup
+# value, path after lookup value)
+_templates = {}
+_templates_lock = threading.Lock()
+
+
+def get_absolute_uri_prefix(request):
+    """
+    Get the scheme and host prefix of a request's absolute URIs, e.g.
+    'https://blabb.it'. This is built once per request.
+
+    Arguments:
+      - request: Request object representing current request
+    Return:
+      (str) absolute URI prefix
+    """
+    try:
+        return request._absolute_uri_prefix
+    except AttributeError:
+        request._absolute_uri_prefix = iri_to_uri('%s://%s' % (
+                'https' if request.is_secure() else 'http',
+                request.get_host()))
+        return request._absolute_uri_prefix
+
+
+def build_absolute_uri(request, location):
+    """
+    Get the absolute URI of a location, as `request.build_absolute_uri` does
+    but without building the request's URI prefix each time.
+
+    Arguments:
+      - request:  Request object representing current request
+      - location: URL, or absolute path
+    Return:
+      (str) absolute URI
+    """
+    if location.startswith('/') and not location.startswith('//'):
+        return get_absolute_uri_prefix(request) + iri_to_uri(location)
+    return request.build_absolute_uri(location)
+
+
+def _get_template(view_name, lookup_field, format):
+    """
+    Get the URL template of a view that's looked up by one keyword argument,
+    resolving it if this process hasn't yet.
+    """
+    key = (get_script_prefix(), view_name, lookup_field, format)
+    template = _templates.get(key)
+    if template is None:
+        kwargs = {lookup_field: LOOKUP_PLACEHOLDER}
+        if format is not None:
+            kwargs['format'] = format
+        # raises NoReverseMatch if the view can't be reversed
+        prefix, suffix = reverse(view_name, kwargs=kwargs).split(
+            LOOKUP_PLACEHOLDER)
+        template = (iri_to_uri(prefix), iri_to_uri(suffix))
+        with _templates_lock:
+            _templates[key] = template
+    return template
+
+
+def reverse_lookup(view_name, lookup_field, lookup_value, request=None,
+                   format=None):
+    """
+    Get the URL of an object's view, as rest_framework's `reverse` would with
+    `kwargs={lookup_field: lookup_value}`.
+
+    Arguments:
+      - view_name:    name of the view
+      - lookup_field: the view's URL keyword argument
+      - lookup_value: the object's value of the keyword argument
+      - request:      Request object representing current request. If given
+                      the URL is absolute.
+      - format:       format suffix of the URL
+    Return:
+      (str) URL of view
+    Raises:
+      NoReverseMatch if the view can't be reversed
+    """
+    prefix, suffix = _get_template(view_name, lookup_field, format)
+    url = prefix + urlquote(lookup_value) + suffix
+    if request is not None:
+        url = get_absolute_uri_prefix(request) + url
+    return url
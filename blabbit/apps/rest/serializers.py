@@ -0,0 +1,288 @@
+"""
+Description:
+  Precompiled serializers for read-only list endpoints.
+
+  Serializing a page of 100 objects with a rest_framework ModelSerializer walks
+  every field of every object through `field_to_native`, resolves each
+  object's URL with `reverse()` and builds every absolute URI from the request.
+  A precompiled serializer produces exactly the same output for a fixed set of
+  fields with far less work:
+    - the getter of each field is looked up once per serializer, and each row
+      is turned into a SortedDict in field order with one call per field,
+    - rows are plain dictionaries, e.g. from `QuerySet.values(*columns)`, so
+      listing a queryset doesn't build model instances. Model instances (such
+      as those of search results) are read into rows of the same columns,
+    - URLs are built from prefixes computed once per request or process
+      (see `blabbit.apps.rest.reverse`), including the links to the previous
+      and next pages,
+    - and the cached thumbnail and rendition URLs of a page's images are
+      fetched with one cache request per kind of URL.
+
+  Precompiled serializers are only for output. Views use them by mixing in
+  `blabbit.apps.rest.mixins.CompiledListMixin`.
+
+Table Of Contents:
+  - format_datetime:    format a date/time the way rest_framework does
+  - CompiledSerializer: base class of precompiled read-only serializers
+"""
+
+from django.db.models.fields.files import FieldFile, FileField
+from django.utils.datastructures import SortedDict
+
+from rest_framework import ISO_8601
+from rest_framework.settings import api_settings
+from rest_framework.templatetags.rest_framework import replace_query_param
+
+from blabbit.apps.media.urlcache import get_many_cached_urls, \
+    get_thumbnail_url, THUMBNAIL, RENDITIONS
+from blabbit.apps.media.renditions import get_rendition_urls
+from blabbit.apps.rest.reverse import build_absolute_uri, reverse_lookup
+
+import operator
+
+
+def format_datetime(value):
+    """
+    Format a date/time the way rest_framework's DateTimeField does with the
+    DATETIME_FORMAT setting.
+
+    Arguments:
+      - value: datetime object, or None
+    Return:
+      (str) formatted date/time, or None
+    """
+    datetime_format = api_settings.DATETIME_FORMAT
+    if value is None or datetime_format is None:
+        return value
+
+    if datetime_format.lower() == ISO_8601:
+        ret = value.isoformat()
+        if ret.endswith('+00:00'):
+            ret = ret[:-6] + 'Z'
+        return ret
+    return value.strftime(datetime_format)
+
+
+class CompiledSerializer(object):
+    """
+    Base class of precompiled serializers, which serialize rows of a model's
+    columns to the output of a rest_framework serializer of the model.
+
+    Subclasses set:
+      - model:         model being serialized
+      - columns:       names of the model fields each row has. This is what's
+                       fetched with `QuerySet.values()`.
+      - fields:        names of output fields, in order
+      - view_name:     name of the objects' detail view, for the `url` field
+      - lookup_field:  column that's the detail view's URL keyword argument
+
+    and define a `get_<field>(row)` method for each output field that isn't a
+    column output as is.
+    """
+    model = None
+    columns = ()
+    fields = ()
+    view_name = None
+    lookup_field = 'id'
+
+    def __init__(self, context):
+        """
+        Arguments:
+          - context: serializer context of the view, with the 'request' and
+                     the 'format' suffix
+        """
+        self.context = context
+        self.request = context['request']
+        self.format = context.get('format')
+
+        # compile the model field of each column, and the attribute it's read
+        # from on model instances
+        self.model_fields = dict((column, self.model._meta.get_field(column))
+                                 for column in self.columns)
+        self.attnames = [(column, self.model_fields[column].attname)
+                         for column in self.columns]
+        self.image_columns = [column for column in self.columns if
+                              isinstance(self.model_fields[column], FileField)]
+
+        # (kind, image name) -> cached URL(s) of the images being serialized
+        self.cached_urls = {}
+
+        # compile the getter of each field
+        self.getters = [(name, getattr(self, 'get_' + name, None) or
+                         operator.itemgetter(name))
+                        for name in self.fields]
+
+    def get_url(self, row):
+        """
+        get URL of the row's object, from its detail view's URL template
+        """
+        return reverse_lookup(self.view_name, self.lookup_field,
+                              row[self.lookup_field], request=self.request,
+                              format=self.format)
+
+    def get_image_url(self, row, column):
+        """
+        Get the absolute URL of a row's image, as the custom ImageField of
+        `blabbit.apps.conversation.fields` outputs it.
+
+        Arguments:
+          - row:    row with the image
+          - column: image column
+        Return:
+          (str) URL of the image, or an empty string if there isn't an image
+        """
+        name = row[column]
+        if not name:
+            return name
+        storage = self.model_fields[column].storage
+        return build_absolute_uri(self.request, storage.url(name))
+
+    def get_image_thumbnail_url(self, row, column, spec_name):
+        """
+        Get the URL of the thumbnail of a row's image. A model instance is
+        only built for images whose thumbnail URL wasn't cached.
+
+        Arguments:
+          - row:       row with the image
+          - column:    image column
+          - spec_name: name of the model's ImageSpecField for the thumbnail
+        Return:
+          (str) URL of thumbnail, or an empty string if there isn't a thumbnail
+        """
+        name = row[column]
+        if not name:
+            return ''
+
+        url = self.cached_urls.get((THUMBNAIL, name))
+        if url is None:
+            instance = self.model(**{'id': row['id'], column: name})
+            url = get_thumbnail_url(instance, spec_name,
+                                    getattr(instance, column))
+        return url
+
+    def get_image_renditions(self, row, column):
+        """
+        Get the URLs of the renditions of a row's image.
+
+        Arguments:
+          - row:    row with the image
+          - column: image column
+        Return:
+          dictionary of rendition URLs, see `get_rendition_urls`
+        """
+        name = row[column]
+        urls = self.cached_urls.get((RENDITIONS, name)) if name else None
+        if urls is None:
+            urls = get_rendition_urls(
+                FieldFile(None, self.model_fields[column], name))
+        return urls
+
+    def get_row(self, obj):
+        """
+        Read a model instance into a row of the serializer's columns, as
+        `QuerySet.values()` would have fetched it.
+
+        Arguments:
+          - obj: model instance
+        Return:
+          dictionary mapping each column to its value
+        """
+        row = {}
+        for (column, attname) in self.attnames:
+            value = getattr(obj, attname)
+            if isinstance(value, FieldFile):
+                value = value.name
+            row[column] = value
+        return row
+
+    def get_rows(self, objects):
+        """
+        Get the rows of some objects.
+
+        Arguments:
+          - objects: iterable of rows or model instances
+        Return:
+          list of rows
+        """
+        return [obj if isinstance(obj, dict) else self.get_row(obj)
+                for obj in objects]
+
+    def get_cached_urls(self, rows):
+        """
+        Get the cached thumbnail and rendition URLs of the rows' images.
+
+        Arguments:
+          - rows: list of rows about to be serialized
+        Return:
+          dictionary mapping (kind of URL, image name) to cached URL(s)
+        """
+        names = set(row[column] for row in rows
+                    for column in self.image_columns if row[column])
+        cached_urls = {}
+        for kind in (THUMBNAIL, RENDITIONS):
+            for (name, urls) in get_many_cached_urls(kind, names).items():
+                cached_urls[(kind, name)] = urls
+        return cached_urls
+
+    def prepare(self, rows):
+        """
+        Get anything needed to serialize some rows that's best fetched for all
+        rows at once. This default implementation does nothing.
+
+        Arguments:
+          - rows: list of rows about to be serialized
+        Return:
+          None
+        """
+        pass
+
+    def to_native(self, row):
+        """
+        Serialize a row.
+
+        Arguments:
+          - row: dictionary mapping each column to its value
+        Return:
+          SortedDict mapping each field to its output
+        """
+        return SortedDict([(name, getter(row))
+                           for (name, getter) in self.getters])
+
+    def serialize(self, objects):
+        """
+        Serialize a list of objects.
+
+        Arguments:
+          - objects: iterable of rows or model instances
+        Return:
+          list of serialized objects
+        """
+        rows = self.get_rows(objects)
+        self.cached_urls = self.get_cached_urls(rows)
+        self.prepare(rows)
+        to_native = self.to_native
+        return [to_native(row) for row in rows]
+
+    def paginate(self, page):
+        """
+        Serialize a page of objects the way rest_framework's
+        PaginationSerializer does.
+
+        Arguments:
+          - page: Page of rows or model instances
+        Return:
+          SortedDict with the 'count' of objects, links to the 'next' and
+          'previous' pages and the page's serialized objects as 'results'
+        """
+        url = self.request.build_absolute_uri()
+        next_url = previous_url = None
+        if page.has_next():
+            next_url = replace_query_param(url, 'page',
+                                           page.next_page_number())
+        if page.has_previous():
+            previous_url = replace_query_param(url, 'page',
+                                               page.previous_page_number())
+        return SortedDict([('count', page.paginator.count),
+                           ('next', next_url),
+                           ('previous', previous_url),
+                           ('results', self.serialize(page.object_list))])
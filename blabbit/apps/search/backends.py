@@ -0,0 +1,77 @@
+"""
+Haystack search backends customized for Blabbit.
+
+These wrap haystack's backends so that every write to the search index
+invalidates the cached search results, and so that each object has a single
+document in the index.
+"""
+
+from haystack.backends.whoosh_backend import WhooshEngine, WhooshSearchBackend
+from haystack.constants import ID
+from whoosh.writing import AsyncWriter
+
+from blabbit.apps.search.cache import invalidate_search_results
+
+
+class WhooshCacheInvalidatingSearchBackend(WhooshSearchBackend):
+    """
+    Whoosh search backend that invalidates cached search results whenever the
+    index is updated, has documents removed or is cleared.
+    """
+
+    def update(self, index, iterable, commit=True):
+        """
+        Index objects, replacing any documents they already have.
+
+        haystack's Whoosh backend relies on `update_document`, which only
+        replaces the documents of an object if the index's stored schema marks
+        the `id` field as unique. An index whose schema doesn't (e.g. one
+        created before haystack did) gets another document for an object every
+        time it's updated. So each object's documents are deleted by its `id`
+        before its new document is added, in the same writer, and searches
+        never have duplicate hits to drop. Run `rebuild_index` once to remove
+        the duplicates of an existing index.
+        """
+        if not self.setup_complete:
+            self.setup()
+
+        self.index = self.index.refresh()
+        writer = AsyncWriter(self.index)
+
+        for obj in iterable:
+            doc = index.full_prepare(obj)
+            # Whoosh only takes unicode
+            for key in doc:
+                doc[key] = self._from_python(doc[key])
+            # document boosts aren't supported by Whoosh
+            doc.pop('boost', None)
+
+            try:
+                writer.delete_by_term(ID, doc[ID])
+                writer.add_document(**doc)
+            except Exception:
+                if not self.silently_fail:
+                    raise
+                self.log.error(u"Failed to index %s" % doc[ID],
+                               exc_info=True)
+
+        if len(iterable) > 0:
+            writer.commit()
+        invalidate_search_results()
+
+    def remove(self, *args, **kwargs):
+        super(WhooshCacheInvalidatingSearchBackend, self).remove(*args,
+                                                                 **kwargs)
+        invalidate_search_results()
+
+    def clear(self, *args, **kwargs):
+        super(WhooshCacheInvalidatingSearchBackend, self).clear(*args,
+                                                                **kwargs)
+        invalidate_search_results()
+
+
+class WhooshCacheInvalidatingEngine(WhooshEngine):
+    """
+    Whoosh engine to use in HAYSTACK_CONNECTIONS
+    """
+    backend = WhooshCacheInvalidatingSearchBackend
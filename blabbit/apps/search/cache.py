@@ -0,0 +1,192 @@
+"""
+Description:
+  Process-local cache of search results.
+
+  Search traffic is heavily skewed towards a few trending prefixes, so the
+  results of a search (page of objects and hit count) are cached keyed by the
+  normalized query, the searched model and the page's offsets.
+
+  Eviction is a hybrid of LRU and LFU (a segmented LRU):
+  - new entries go into a "probation" segment,
+  - an entry that's hit again gets promoted to a "protected" segment,
+  - both segments are kept in LRU order, protected entries that overflow their
+    segment get demoted back to probation, and evictions always come from
+    probation first.
+  So a burst of one-off queries can't flush out the popular ones.
+
+  Cached entries are invalidated when the search indexer writes. This is done
+  by bumping a generation number that's part of every cache key and stored in
+  Django's cache framework so that, with a shared cache backend, index updates
+  from other processes (such as the `update_index` cron job) are seen too.
+
+Table Of Contents:
+  - SearchResultCache:          LRU/LFU hybrid cache with per-entry timeouts
+  - search_result_cache:        the process' search result cache
+  - get_search_cache_key:       build a cache key for a search
+  - invalidate_search_results:  invalidate all cached search results
+"""
+
+from collections import OrderedDict
+import threading
+import time
+
+from django.conf import settings
+from django.core.cache import cache
+
+# key of the search results generation number in Django's cache
+GENERATION_CACHE_KEY = 'search:generation'
+
+
+class SearchResultCache(object):
+    """
+    Thread-safe segmented LRU cache where every entry has its own timeout.
+    """
+
+    def __init__(self, max_entries, protected_ratio=0.8):
+        """
+        Arguments:
+          - max_entries:     maximum number of cached entries
+          - protected_ratio: fraction of entries that can be in the protected
+                             segment, i.e. entries that have been hit at least
+                             once since being cached.
+        """
+        self.max_entries = max_entries
+        self.max_protected = int(max_entries * protected_ratio)
+        self._probation = OrderedDict()
+        self._protected = OrderedDict()
+        self._lock = threading.Lock()
+        self.reset_stats()
+
+    def reset_stats(self):
+        """
+        Reset the cache's statistics counters
+        """
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+        self.expirations = 0
+        self.invalidations = 0
+
+    def get(self, key, default=None):
+        """
+        Get a cached value. A hit promotes the entry to the protected segment
+        and makes it the most recently used.
+
+        Arguments:
+          - key:     key of cached value
+          - default: value to return on a cache miss
+        Return:
+          Cached value if found and not expired, otherwise `default`
+        """
+        with self._lock:
+            entry = self._protected.pop(key, None)
+            if entry is None:
+                entry = self._probation.pop(key, None)
+
+            if entry is None:
+                self.misses += 1
+                return default
+
+            expires, value = entry
+            if expires <= time.time():
+                self.expirations += 1
+                self.misses += 1
+                return default
+
+            self._protected[key] = entry
+            if len(self._protected) > self.max_protected:
+                demoted_key, demoted = self._protected.popitem(last=False)
+                self._probation[demoted_key] = demoted
+
+            self.hits += 1
+            return value
+
+    def set(self, key, value, timeout):
+        """
+        Cache a value, evicting the least valuable entries if the cache is full.
+
+        Arguments:
+          - key:     key of value to cache
+          - value:   value to be cached
+          - timeout: number of seconds the value is valid for
+        Return:
+          None
+        """
+        if timeout <= 0:
+            return
+
+        with self._lock:
+            self._protected.pop(key, None)
+            self._probation.pop(key, None)
+            self._probation[key] = (time.time() + timeout, value)
+
+            while len(self._probation) + len(self._protected) > \
+                    self.max_entries:
+                segment = self._probation or self._protected
+                segment.popitem(last=False)
+                self.evictions += 1
+
+    def clear(self):
+        """
+        Drop all cached entries.
+        """
+        with self._lock:
+            self._probation.clear()
+            self._protected.clear()
+            self.invalidations += 1
+
+    def stats(self):
+        """
+        Get the cache's statistics
+
+        Return:
+          Dictionary of cache statistics
+        """
+        with self._lock:
+            lookups = self.hits + self.misses
+            return {
+                'entries': len(self._probation) + len(self._protected),
+                'protected_entries': len(self._protected),
+                'max_entries': self.max_entries,
+                'hits': self.hits,
+                'misses': self.misses,
+                'hit_ratio': (float(self.hits) / lookups) if lookups else 0.0,
+                'evictions': self.evictions,
+                'expirations': self.expirations,
+                'invalidations': self.invalidations,
+                }
+
+
+search_result_cache = SearchResultCache(settings.SEARCH_RESULT_CACHE_SIZE)
+
+
+def get_search_cache_key(model, query, *parts):
+    """
+    Build a cache key for a search on a given model.
+
+    Arguments:
+      - model: model class being searched
+      - query: search query string. This gets normalized so that searches that
+               differ only in letter case or whitespace share cache entries.
+      - parts: any other values that identify the cached search results, such
+               as page offsets.
+    Return:
+      Hashable cache key
+    """
+    generation = cache.get(GENERATION_CACHE_KEY, 0)
+    normalized_query = u' '.join(query.lower().split())
+    return (generation, model._meta.app_label, model._meta.model_name,
+            normalized_query) + parts
+
+
+def invalidate_search_results():
+    """
+    Invalidate all cached search results. Should be called whenever the search
+    index is written to.
+    """
+    try:
+        cache.incr(GENERATION_CACHE_KEY)
+    except ValueError:
+        # generation number isn't in the cache yet
+        cache.set(GENERATION_CACHE_KEY, 1, None)
+    search_result_cache.clear()
@@ -0,0 +1,92 @@
+"""
+Description:
+  Full-text and trigram search done by PostgreSQL.
+
+  This is an alternative to the haystack (Whoosh) index, which lives on each
+  web node's filesystem and so is inconsistent across nodes and takes a global
+  file lock on writes. Searching the database means every node shares one
+  index that's always up to date and scales with the database.
+
+  A model's searched text columns are matched in two ways:
+  - a `simple` (i.e. unstemmed) text search with prefix matching on every
+    query term. This behaves like the haystack EdgeNgram index.
+  - a `pg_trgm` similarity match on each column to catch misspellings.
+
+  Both are backed by GIN indexes created in each app's custom SQL
+  (see `account/sql/user.sql` and `conversation/sql/room.sql`). The text search
+  vector expression built here must match the indexed expression exactly for
+  the index to be used.
+
+Table Of Contents:
+  - get_search_vector: SQL expression of a table's text search vector
+  - postgres_search:   search a QuerySet's text columns
+"""
+
+import re
+
+from django.db import connection
+
+# text search configuration. 'simple' doesn't stem or drop stop words which
+# suits usernames and short room subjects.
+SEARCH_CONFIG = 'simple'
+
+
+def get_search_vector(table, columns):
+    """
+    Get the SQL expression of the text search vector over some columns.
+
+    Arguments:
+      - table:   name of the database table
+      - columns: names of text columns in the table
+    Return:
+      (str) SQL expression
+    """
+    qn = connection.ops.quote_name
+    document = " || ' ' || ".join(
+        "coalesce(%s.%s, '')" % (qn(table), qn(column)) for column in columns)
+    return "to_tsvector('%s', %s)" % (SEARCH_CONFIG, document)
+
+
+def postgres_search(queryset, fields, query):
+    """
+    Search a QuerySet's text fields, ordering results by descending relevance.
+
+    Arguments:
+      - queryset: QuerySet of the model being searched
+      - fields:   names of the model's text fields to be searched
+      - query:    search query string
+    Return:
+      QuerySet of matching objects
+    """
+    terms = re.findall(r'\w+', query, re.UNICODE)
+    if not terms:
+        return queryset.none()
+
+    qn = connection.ops.quote_name
+    opts = queryset.model._meta
+    table = opts.db_table
+    columns = [opts.get_field(field).column for field in fields]
+    qualified_columns = ['%s.%s' % (qn(table), qn(column))
+                         for column in columns]
+
+    # every term has to match the start of a word
+    tsquery = u' & '.join(u'%s:*' % term for term in terms)
+    trigram_query = u' '.join(terms)
+
+    vector = get_search_vector(table, columns)
+    text_match = "%s @@ to_tsquery('%s', %%s)" % (vector, SEARCH_CONFIG)
+    text_rank = "ts_rank(%s, to_tsquery('%s', %%s))" % (vector, SEARCH_CONFIG)
+    # `%` is pg_trgm's similarity operator, escaped for the DB-API
+    trigram_matches = ["%s %%%% %%s" % column for column in qualified_columns]
+    trigram_rank = "greatest(%s)" % ", ".join(
+        "similarity(%s, %%s)" % column for column in qualified_columns)
+
+    where = "(%s OR %s)" % (text_match, " OR ".join(trigram_matches))
+    rank = "%s + %s" % (text_rank, trigram_rank)
+
+    return queryset.extra(
+        select={'search_rank': rank},
+        select_params=[tsquery] + [trigram_query] * len(columns),
+        where=[where],
+        params=[tsquery] + [trigram_query] * len(columns),
+        order_by=['-search_rank'])
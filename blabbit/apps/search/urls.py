@@ -13,6 +13,10 @@ urlpatterns = patterns('',
                        url(r'^search/rooms/$',
                            views.RoomSearchResultList.as_view(), 
                            name='room-search-list'),
+                       
+                       url(r'^search/cache/$',
+                           views.SearchCacheStats.as_view(), 
+                           name='search-cache-stats'),
                        )
 
 urlpatterns = format_suffix_patterns(urlpatterns)
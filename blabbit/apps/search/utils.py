@@ -0,0 +1,190 @@
+"""
+Description:
+  Utility functions and classes that come in handy for the search app
+
+Table Of Contents:
+  - get_search_pool:                get this process' pool of search threads
+  - SearchResultObjectList:         lazy, sliceable list of a search's model
+                                    objects
+  - DatabaseSearchResultObjectList: SearchResultObjectList for searches done
+                                    by the database
+"""
+
+from django.conf import settings
+
+from haystack.query import EmptySearchQuerySet
+
+from multiprocessing import pool
+import threading
+
+# this process' pool of search threads. It's created on first use so it's
+# created in each server process rather than in a parent process before forking
+_pool = None
+_pool_lock = threading.Lock()
+
+
+def get_search_pool():
+    """
+    Get this process' pool of SEARCH_ALL_WORKERS search threads, shared by all
+    searches for everything.
+
+    Return:
+      multiprocessing.pool.ThreadPool object
+    """
+    global _pool
+    with _pool_lock:
+        if _pool is None:
+            _pool = pool.ThreadPool(settings.SEARCH_ALL_WORKERS)
+        return _pool
+
+
+
+class SearchResultObjectList(object):
+    """
+    A lazy, sliceable list of the model objects behind a SearchQuerySet.
+
+    Django's Paginator only ever calls `count()` and slices the object list for
+    the requested page, so wrapping the SearchQuerySet in this class means:
+    - the search engine does the pagination: the hit count is answered by the
+      engine and each page's primary keys are fetched with a single query
+      limited to the page's offsets, without loading any stored fields,
+    - only the current page's objects are loaded from the database, in one bulk
+      query,
+    - memory use and latency don't grow with the number of hits.
+
+    Each object has a single document in the index (see
+    `blabbit.apps.search.backends`), so the engine's hits need no
+    deduplicating. Objects that were deleted after being indexed are dropped
+    from the page they're on.
+
+    If given a cache, the hit count and each slice of objects are cached so
+    repeated searches don't hit the search engine or the database at all.
+    """
+
+    def __init__(self, results, model=None, cache=None, cache_key=None,
+                 get_cache_timeout=None):
+        """
+        Arguments:
+          - results:           SearchQuerySet with the results of a search query
+          - model:             model of the objects being searched
+          - cache:             optional SearchResultCache for the results
+          - cache_key:         key identifying this search in the cache. Each
+                               cached value's key is this key extended with
+                               what's being cached.
+          - get_cache_timeout: function that takes a list of model objects and
+                               returns how long (in seconds) they can be cached
+                               for. The hit count is cached for as long as an
+                               empty list of objects would be.
+        """
+        self.results = results
+        self.model = model
+        self.cache = cache
+        self.cache_key = cache_key
+        self.get_cache_timeout = get_cache_timeout
+
+    def count(self):
+        """
+        Get the number of search hits.
+
+        Return:
+          (int) number of search hits
+        """
+        if self.cache is None:
+            return self.get_count()
+
+        key = self.cache_key + ('count',)
+        count = self.cache.get(key)
+        if count is None:
+            count = self.get_count()
+            self.cache.set(key, count, self.get_cache_timeout([]))
+        return count
+
+    def __len__(self):
+        return self.count()
+
+    def __iter__(self):
+        return iter(self[:])
+
+    def __getitem__(self, k):
+        """
+        Get a slice of the search results' objects.
+
+        Arguments:
+          - k: slice of the search results to get objects of, or index of a
+               single search result.
+        Return:
+          List of model objects for the slice, or a single model object if `k`
+          is an index.
+        """
+        if not isinstance(k, slice):
+            objects = self[k:k+1]
+            if not objects:
+                raise IndexError("search result index out of range")
+            return objects[0]
+
+        if self.cache is None:
+            return self.get_objects(k)
+
+        key = self.cache_key + ('slice', k.start, k.stop, k.step)
+        objects = self.cache.get(key)
+        if objects is None:
+            objects = self.get_objects(k)
+            self.cache.set(key, objects, self.get_cache_timeout(objects))
+        # hand out a copy so callers can't modify the cached list
+        return list(objects)
+
+    def get_count(self):
+        """
+        Get the number of search hits, uncached. This is answered by the search
+        engine.
+        """
+        return self.results.count()
+
+    def get_objects(self, k):
+        """
+        Get the model objects of a slice of the search results, while dropping
+        objects that no longer exist.
+
+        Arguments:
+          - k: slice of the search results
+        Return:
+          List of model objects in the same order as the search results
+        """
+        # a clone of an empty SearchQuerySet would no longer be empty, so it
+        # isn't queried
+        if isinstance(self.results, EmptySearchQuerySet):
+            return []
+
+        # only the slice's primary keys are fetched, and the index stores
+        # them as strings
+        to_python = self.model._meta.pk.to_python
+        pks = [to_python(pk) for pk in
+               self.results.values_list('pk', flat=True)[k]]
+        objects = self.model._default_manager.in_bulk(pks)
+        return [objects[pk] for pk in pks if pk in objects]
+
+
+class DatabaseSearchResultObjectList(SearchResultObjectList):
+    """
+    A SearchResultObjectList for searches done by the database, i.e. where the
+    search results are a QuerySet of the model objects.
+
+    The database does the pagination (with LIMIT/OFFSET).
+    """
+
+    def get_count(self):
+        """
+        Get the number of rows matched by the search's QuerySet.
+        """
+        return self.results.count()
+
+    def get_objects(self, k):
+        """
+        Get the model objects of a slice of the search results' QuerySet.
+
+        Arguments:
+          - k: slice of the search results
+        Return:
+          List of model objects
+        """
+        return list(self.results[k])
@@ -7,21 +7,87 @@ from haystack.forms import SearchForm
 from haystack.query import EmptySearchQuerySet, SearchQuerySet 
 
 from blabbit.apps.account.models import User
-from blabbit.apps.account.serializers import UserPublicOnlySerializer
+from blabbit.apps.account.serializers import UserPublicOnlySerializer, \
+    CompiledUserPublicOnlySerializer
 
 from blabbit.apps.conversation.models import Room
-from blabbit.apps.conversation.serializers import RoomSerializer
+from blabbit.apps.conversation.serializers import RoomSerializer, \
+    CompiledRoomSerializer
+from blabbit.apps.conversation.mixins import RoomUserStateMixin
 
-from blabbit.utils import list_dedup
+from blabbit.apps.rest.mixins import CompiledListMixin
+
+from blabbit.apps.search.utils import SearchResultObjectList, \
+    DatabaseSearchResultObjectList, get_search_pool
+from blabbit.apps.search.postgres import postgres_search
+from blabbit.apps.search.cache import search_result_cache, \
+    get_search_cache_key
 
 from django.conf import settings
+from django.db import connection
 from django.utils import timezone
 from datetime import timedelta
+import logging
+import multiprocessing
+import time
+
+logger = logging.getLogger(__name__)
 
 # Create your views here.
 
 @api_view(('GET',))
 def search_root(request, format=None):
+    """
+    Search users and rooms at once, or list the search endpoints.
+    
+    ## Reading
+    ### Permissions
+    * Anyone can read this endpoint.
+    
+    ### Fields
+    Parameter     | Description                                  | Type
+    ------------- | -------------------------------------------- | ----------
+    `q`           | A UTF-8, URL-encoded search query            | _string_
+    `users_limit` | max number of users returned. Optional       | _integer_
+    `rooms_limit` | max number of rooms returned. Optional       | _integer_
+    
+    ### Response
+    Without a `q` parameter, reading this endpoint returns links to the search
+    endpoints of each type of object.
+    
+    With a `q` parameter, the user and room searches are run concurrently and
+    the results are grouped by type:
+    
+        {
+            "users": {"count": 2, "results": [<user objects>]},
+            "rooms": {"count": 41, "results": [<room objects>]},
+            "meta": {
+                "users": {"time": 0.012, "timed_out": false, "error": false},
+                "rooms": {"time": 0.031, "timed_out": false, "error": false}
+            }
+        }
+    
+    `time` is how long each search took in seconds. A search that doesn't
+    complete in time is reported with `timed_out` set, a `count` of _null_ and
+    no results. A search that fails is reported the same way but with `error`
+    set instead of `timed_out`.
+    
+    
+    ## Publishing
+    You can't write using this endpoint
+    
+    
+    ## Deleting
+    You can't delete using this endpoint
+    
+    
+    ## Updating
+    You can't update using this endpoint
+    
+    """
+    if request.QUERY_PARAMS.get('q'):
+        return search_all(request, format)
+    
     return Response({
             'search users': reverse('user-search-list', request=request, 
                                     format=format),
@@ -29,7 +95,155 @@ def search_root(request, format=None):
                                     format=format),
         })
 
-class SearchResultList(generics.ListAPIView):
+
+def search_all(request, format=None):
+    """
+    Run all searches for the request's query concurrently on this process'
+    pool of search threads. Searches that don't complete by
+    SEARCH_ALL_DEADLINE_SECONDS don't hold up the response, and their results
+    are ignored when they do complete.
+    
+    Arguments:
+      - request: Request object representing current request
+      - format:  format suffix of the request
+    Return:
+      Response with search results grouped by type
+    """
+    start = time.time()
+    deadline = start + settings.SEARCH_ALL_DEADLINE_SECONDS
+    search_pool = get_search_pool()
+    
+    searches = []
+    for search_type, view_class in SEARCH_ALL_TYPES:
+        # setup search views the way as_view() would
+        view = view_class()
+        view.request = request
+        view.args = ()
+        view.kwargs = {}
+        view.format_kwarg = format
+        limit = get_search_limit(request, search_type)
+        result = search_pool.apply_async(run_search, (view, limit, deadline))
+        searches.append((search_type, view, result))
+    
+    data = {'meta': {}}
+    for search_type, view, result in searches:
+        try:
+            outcome = result.get(max(deadline - time.time(), 0))
+        except multiprocessing.TimeoutError:
+            outcome = None
+        except Exception:
+            # the search thread has logged the failure
+            data[search_type] = {'count': None, 'results': []}
+            data['meta'][search_type] = {'time': time.time() - start,
+                                         'timed_out': False, 'error': True}
+            continue
+        
+        if outcome is None:
+            data[search_type] = {'count': None, 'results': []}
+            data['meta'][search_type] = {
+                'time': settings.SEARCH_ALL_DEADLINE_SECONDS,
+                'timed_out': True, 'error': False}
+            continue
+        
+        objects, count, elapsed = outcome
+        serializer = view.get_compiled_serializer()
+        data[search_type] = {'count': count, 
+                             'results': serializer.serialize(objects)}
+        data['meta'][search_type] = {'time': elapsed, 'timed_out': False,
+                                     'error': False}
+    
+    return Response(data)
+
+
+def get_search_limit(request, search_type):
+    """
+    Get the max number of results of a search type to return.
+    
+    Arguments:
+      - request:     Request object representing current request
+      - search_type: search type, such as 'users' or 'rooms'
+    Return:
+      (int) number of results, defaults to SEARCH_ALL_LIMIT and is capped at
+      SEARCH_ALL_MAX_LIMIT.
+    """
+    try:
+        limit = int(request.QUERY_PARAMS.get(search_type + '_limit'))
+    except (TypeError, ValueError):
+        limit = settings.SEARCH_ALL_LIMIT
+    return max(0, min(limit, settings.SEARCH_ALL_MAX_LIMIT))
+
+
+def run_search(view, limit, deadline):
+    """
+    Run a search view's search. This runs on the search threads.
+    
+    Arguments:
+      - view:     SearchResultList view to run the search of
+      - limit:    max number of result objects to get
+      - deadline: time by which the search must be done. A search still queued
+                  at this time is skipped, as no one is waiting on it.
+    Return:
+      tuple of the result objects, the hit count and the time (in seconds) the
+      search took, or None if the search was skipped
+    """
+    start = time.time()
+    if start >= deadline:
+        return None
+    
+    try:
+        results = view.get_queryset()
+        objects = results[:limit]
+        count = results.count()
+        return (objects, count, time.time() - start)
+    except Exception:
+        logger.exception('Search of %s failed', view.model.__name__)
+        raise
+    finally:
+        # this thread has its own database connection so close it
+        connection.close()
+
+
+class SearchCacheStats(generics.GenericAPIView):
+    """
+    Get statistics of this server process' search result cache.
+    
+    ## Reading
+    ### Permissions
+    * Only staff users can read this endpoint.
+    
+    ### Fields
+    Name                | Description                                | Type
+    ------------------- | ------------------------------------------ | ---------
+    `entries`           | number of cached entries                   | _integer_
+    `protected_entries` | number of entries that have been hit since being cached | _integer_
+    `max_entries`       | maximum number of cached entries           | _integer_
+    `hits`              | number of cache hits                       | _integer_
+    `misses`            | number of cache misses                     | _integer_
+    `hit_ratio`         | ratio of lookups that were hits            | _float_
+    `evictions`         | number of entries evicted to make room     | _integer_
+    `expirations`       | number of entries found to be expired      | _integer_
+    `invalidations`     | number of times the cache was invalidated by index writes | _integer_
+    
+    
+    ## Publishing
+    You can't write using this endpoint
+    
+    
+    ## Deleting
+    You can't delete using this endpoint
+    
+    
+    ## Updating
+    You can't update using this endpoint
+    
+    """
+    permission_classes = (permissions.IsAdminUser,)
+    
+    def get(self, request, format=None):
+        return Response(search_result_cache.stats())
+
+
+class SearchResultList(CompiledListMixin, generics.ListAPIView):
     """
     List results of search given any queryset limited to a specific model.
     
@@ -37,6 +251,8 @@ class SearchResultList(generics.ListAPIView):
     properties:
     * model
     * serializer_class
+    * compiled_serializer_class
+    * search_fields (only used when searching with the `postgres` backend)
     
     ## Reading
     ### Permissions
@@ -50,6 +266,9 @@ class SearchResultList(generics.ListAPIView):
     ### Response
     Reading this endpoint returns an array of user objects and room objects,
     each only containing public user data.
+    
+    Results are cached for a short while, so a new object can take up to
+    `SEARCH_RESULT_CACHE_TIMEOUT` seconds to show up after it's been indexed.
          
     
     ## Publishing
@@ -68,31 +287,82 @@ class SearchResultList(generics.ListAPIView):
     
     
     def get_queryset(self):
-        query = ''
-        results = []
+        """
+        Get a lazy list of the search results' objects. The paginator will only
+        fetch (and load the objects of) the requested page of results.
+        """
+        query = self.request.QUERY_PARAMS.get('q', u'')
         
-        if self.request.QUERY_PARAMS.get('q'):
+        if settings.SEARCH_BACKEND == 'postgres':
+            results = self.get_database_results(query)
+            result_list_class = DatabaseSearchResultObjectList
+        else:
+            results = self.get_haystack_results(query)
+            result_list_class = SearchResultObjectList
+        
+        return result_list_class(
+            results, model=self.model, cache=search_result_cache,
+            cache_key=get_search_cache_key(self.model, query),
+            get_cache_timeout=self.get_cache_timeout)
+    
+    def get_haystack_results(self, query):
+        """
+        Search the haystack index.
+        
+        Arguments:
+        - query: search query string
+        
+        Return:
+        SearchQuerySet of the filtered search results
+        """
+        results = EmptySearchQuerySet()
+        
+        if query:
             # limit searchqueryset to appropriate model
             searchqueryset = SearchQuerySet().models(self.model)
             # then perform a search on specific model.
             form = SearchForm(self.request.QUERY_PARAMS, 
-                              searchqueryset=searchqueryset, load_all=True)
+                              searchqueryset=searchqueryset)
             if form.is_valid():
-                query = form.cleaned_data['q']
                 results = form.search()
                 results = self.filter_results(results)
-                # for odd reasons there are duplicates in the haystack results.
-                results = list_dedup([r.object for r in results])
         
         return results
     
+    def get_database_results(self, query):
+        """
+        Search the model's `search_fields` with PostgreSQL full-text and
+        trigram search.
+        
+        Arguments:
+        - query: search query string
+        
+        Return:
+        QuerySet of the filtered search results
+        """
+        results = postgres_search(self.model.objects.all(), self.search_fields,
+                                  query)
+        return self.filter_results(results)
+    
+    def get_cache_timeout(self, objects):
+        """
+        Get the number of seconds a page of search results can be cached for.
+        This default implementation uses SEARCH_RESULT_CACHE_TIMEOUT.
+        
+        Arguments:
+        - objects: list of model objects in the page of search results
+        """
+        return settings.SEARCH_RESULT_CACHE_TIMEOUT
+    
     def filter_results(self, results):
         """
         Filter the serch results appropriate. 
         This default implementation does nothing but return the argument.
         
         Arguments:
-        - results: SearchQuerySet which contains the results of a search query
+        - results: SearchQuerySet (or QuerySet when searching with the 
+                   `postgres` backend) which contains the results of a search
+                   query
         """
         return results
 
@@ -130,9 +400,11 @@ class UserSearchResultList(SearchResultList):
     
     model = User
     serializer_class = UserPublicOnlySerializer
+    compiled_serializer_class = CompiledUserPublicOnlySerializer
+    search_fields = ('username', 'first_name')
 
 
-class RoomSearchResultList(SearchResultList):
+class RoomSearchResultList(RoomUserStateMixin, SearchResultList):
     """
     List results of search on rooms
     
@@ -165,6 +437,8 @@ class RoomSearchResultList(SearchResultList):
     
     model = Room
     serializer_class = RoomSerializer
+    compiled_serializer_class = CompiledRoomSerializer
+    search_fields = ('subject',)
     
     def filter_results(self, results):
         """
@@ -173,4 +447,22 @@ class RoomSearchResultList(SearchResultList):
         earliest_date = timezone.now() - timedelta(
             seconds=settings.ROOM_EXPIRY_TIME_SECONDS)
         return results.filter(created_at__gte=earliest_date)   
+    
+    def get_cache_timeout(self, objects):
+        """
+        Don't cache a page of rooms past the time its first room expires.
+        """
+        timeout = super(RoomSearchResultList, self).get_cache_timeout(objects)
+        if objects:
+            expiry_time = min(room.created_at for room in objects) + \
+                timedelta(seconds=settings.ROOM_EXPIRY_TIME_SECONDS)
+            time_to_expiry = expiry_time - timezone.now()
+            timeout = min(timeout, int(time_to_expiry.total_seconds()))
+        return timeout
+
 
+# search types in the response of a search for everything and their views
+SEARCH_ALL_TYPES = (
+    ('users', UserSearchResultList),
+    ('rooms', RoomSearchResultList),
+    )
@@ -61,9 +61,12 @@ INSTALLED_APPS = (
     'blabbit.apps.explore',
     'blabbit.apps.search',
     'blabbit.apps.feedback',
+    'blabbit.apps.media',
 )
 
 MIDDLEWARE_CLASSES = (
+    # first, so that it compresses API responses after all other middleware
+    'blabbit.apps.rest.middleware.CompressionMiddleware',
     'django.contrib.sessions.middleware.SessionMiddleware',
     'django.middleware.common.CommonMiddleware',
     'django.middleware.csrf.CsrfViewMiddleware',
@@ -159,10 +162,12 @@ TEMPLATE_DIRS = (
 #     to stderr. This handler uses the simple output format.
 #   + mail_admins, an AdminEmailHandler, which will email any ERROR (or higher)
 #     message to the site admins
-# - configures 1 logger:
-#   + django, which passes all messages at ERROR or higher to the mail_admins
-#     handlers when not in DEBUG mode. In debug mode this logger passes messages
-#     to the console handler.
+# - configures 3 loggers:
+#   + django and blabbit, which pass all messages at ERROR or higher to the
+#     mail_admins handlers when not in DEBUG mode. In debug mode these loggers
+#     pass messages to the console handler.
+#   + blabbit.apps.media, which also passes INFO messages (such as the bytes
+#     saved by ingesting each uploaded image) to the console handler.
 #
 
 LOGGING = {
@@ -192,6 +197,16 @@ LOGGING = {
             'level': 'ERROR',
             'propagate': True,
             },
+        'blabbit': {
+            'handlers': ['mail_admins'],
+            'level': 'ERROR',
+            'propagate': True,
+            },
+        'blabbit.apps.media': {
+            'handlers': ['console', 'mail_admins'],
+            'level': 'INFO',
+            'propagate': False,
+            },
         }
     }
 
@@ -204,7 +219,12 @@ if DEBUG:
 # ---------------------------------------------------------------------------- #
 # Amazon AWS storage settings
 # ---------------------------------------------------------------------------- #
-DEFAULT_FILE_STORAGE = 'storages.backends.s3boto.S3BotoStorage'
+# S3 storage sharing one connection pool per process, with concurrent
+# multipart uploads and batched deletes. To develop without S3 use
+# 'blabbit.apps.media.storage.FileSystemStorage' instead, or point this at an
+# S3-compatible stand-in with the AWS_S3_HOST, AWS_S3_PORT, AWS_S3_USE_SSL and
+# AWS_S3_CALLING_FORMAT (OrdinaryCallingFormat) settings.
+DEFAULT_FILE_STORAGE = 'blabbit.apps.media.storage.PooledS3BotoStorage'
 
 # Specify AWS S3 bucket to upload files to
 if DEBUG == True:
@@ -232,6 +252,12 @@ else:
 AUTH_USER_MODEL = 'account.User'
 # max image file size: 25MB (applies to both accounts and rooms)
 MAX_IMAGE_SIZE = 25 * 1024 * 1024
+# max number of pixels of uploaded images, and max width and height that they
+# are scaled down to before storage (applies to both accounts and rooms)
+MEDIA_MAX_IMAGE_PIXELS = 40 * 1000 * 1000 # 40 megapixels
+MEDIA_MAX_IMAGE_DIMENSION = 2048
+# time (in seconds) the id of a user looked up by username is cached for
+ACCOUNT_USERNAME_CACHE_SECONDS = 24 * 60 * 60 # 24 hours
 
 
 # ---------------------------------------------------------------------------- #
@@ -239,6 +265,39 @@ MAX_IMAGE_SIZE = 25 * 1024 * 1024
 # ---------------------------------------------------------------------------- #
 # expiry time of rooms (in seconds)
 ROOM_EXPIRY_TIME_SECONDS = 86400 # 24 hours
+# time (in seconds) the id of a room looked up by name is cached for
+ROOM_LOOKUP_CACHE_SECONDS = 24 * 60 * 60 # 24 hours
+# room map: max zoom level, and zoom level from which rooms aren't clustered
+ROOM_MAP_MAX_ZOOM = 20
+ROOM_MAP_CLUSTER_MAX_ZOOM = 15
+# room map clusters are formed on a grid of this many cells across each tile
+ROOM_MAP_CLUSTER_GRID = 8
+# max number of map tiles per request and of rooms listed per tile
+ROOM_MAP_MAX_TILES = 64
+ROOM_MAP_MAX_ROOMS = 100
+# time (in seconds) each map tile's clusters and rooms are cached for
+ROOM_MAP_CACHE_SECONDS = 30
+# trending scores: time (in seconds) for activity to lose half its weight, and
+# the weights of a room's creation, each like and each new member.
+# Run the `rebuild_trending_scores` management command after changing these.
+TRENDING_HALF_LIFE_SECONDS = 6 * 60 * 60 # 6 hours
+TRENDING_ROOM_WEIGHT = 1.0
+TRENDING_LIKE_WEIGHT = 1.0
+TRENDING_MEMBER_WEIGHT = 0.5
+
+
+# ---------------------------------------------------------------------------- #
+# `explore` settings
+# ---------------------------------------------------------------------------- #
+# default and max radius (in meters) of nearby rooms search
+EXPLORE_NEARBY_DEFAULT_RADIUS = 5000
+EXPLORE_NEARBY_MAX_RADIUS = 50000
+# number of rooms listed by popular rooms, and max time (in seconds) between
+# refreshes of the popular rooms leaderboard from the database
+EXPLORE_POPULAR_LEADERBOARD_SIZE = 500
+EXPLORE_POPULAR_REFRESH_SECONDS = 30
+# number of rooms listed by trending rooms
+EXPLORE_TRENDING_LIMIT = 50
 
 
 # ---------------------------------------------------------------------------- #
@@ -257,10 +316,47 @@ EJABBERD_AUTH_LOG = '/tmp/blabbit/ejabberd_auth.log'
 # ---------------------------------------------------------------------------- #
 # `imagekit` settings
 # ---------------------------------------------------------------------------- #
-# create appropriate thumbnails on source file save only
+# create appropriate thumbnails on source file save only, and do that on a
+# pool of worker threads rather than in the request saving the source file
 IMAGEKIT_DEFAULT_CACHEFILE_STRATEGY ='imagekit.cachefiles.strategies.Optimistic'
+IMAGEKIT_DEFAULT_CACHEFILE_BACKEND = 'blabbit.apps.media.backends.ThreadPool'
 IMAGEKIT_CACHEFILE_DIR = 'cache'
 IMAGEKIT_SPEC_CACHEFILE_NAMER ='imagekit.cachefiles.namers.source_name_as_path'
+# cache of the states of thumbnails and renditions, i.e. whether they've been
+# generated. This is the default cache even when DEBUG is on (imagekit would
+# use a dummy cache) as rendition URLs are only listed once their state is
+# known, and it must be shared by all server processes in production.
+IMAGEKIT_CACHE_BACKEND = 'default'
+# number of thumbnail worker threads per server process
+MEDIA_THUMBNAIL_WORKERS = 2
+# time (in seconds) the thumbnail and rendition URLs of an image are cached
+MEDIA_URL_CACHE_TIMEOUT = 24 * 60 * 60
+# number of storage I/O threads per server process, used for concurrent
+# multipart upload parts and deletes
+MEDIA_STORAGE_WORKERS = 4
+# files larger than this are uploaded to S3 in concurrent parts of this size
+# (S3 parts must be at least 5MB)
+MEDIA_STORAGE_MULTIPART_THRESHOLD = 8 * 1024 * 1024
+MEDIA_STORAGE_MULTIPART_CHUNK_SIZE = 5 * 1024 * 1024
+# renditions generated for room photos and user avatars, largest first, as
+# (name, width, height, crop) tuples. Renditions that aren't cropped are scaled
+# to fit within their width and height and are never scaled up.
+MEDIA_RENDITIONS = (
+    ('preview', 1280, 1280, False),
+    ('thumbnail_3x', 360, 360, True),
+    ('thumbnail_2x', 240, 240, True),
+    ('thumbnail_1x', 120, 120, True),
+    )
+# formats each rendition is saved in, as (PIL format, file extension, PIL save
+# options) tuples. Formats PIL can't write (such as WEBP when Pillow is built
+# without libwebp) are skipped.
+MEDIA_RENDITION_FORMATS = (
+    ('JPEG', 'jpg', {'quality': 85, 'optimize': True, 'progressive': True}),
+    ('WEBP', 'webp', {'quality': 80}),
+    )
+# time (in seconds) a failure to generate an image's renditions is remembered,
+# during which the generate_renditions command doesn't retry it
+MEDIA_RENDITION_FAILURE_TIMEOUT = 24 * 60 * 60
 
 
 # ---------------------------------------------------------------------------- #
@@ -268,12 +364,41 @@ IMAGEKIT_SPEC_CACHEFILE_NAMER ='imagekit.cachefiles.namers.source_name_as_path'
 # ---------------------------------------------------------------------------- #
 HAYSTACK_CONNECTIONS = {
     'default': {
-        'ENGINE': 'haystack.backends.whoosh_backend.WhooshEngine',
+        # Whoosh engine that invalidates cached search results on index writes
+        'ENGINE': 
+          'blabbit.apps.search.backends.WhooshCacheInvalidatingEngine',
         'PATH': os.path.join(os.path.dirname(__file__),'whoosh/blabbit_index'),
         'INCLUDE_SPELLING': True, # include spelling suggestions
         },
 }
 
+# ---------------------------------------------------------------------------- #
+# `search` settings
+# ---------------------------------------------------------------------------- #
+# backend used by the search endpoints:
+# - 'haystack': search the haystack index configured in HAYSTACK_CONNECTIONS.
+#   This is a Whoosh index on each web node's filesystem.
+# - 'postgres': search the database using full-text and trigram (pg_trgm)
+#   indexes so all web nodes share one consistent index.
+SEARCH_BACKEND = 'haystack'
+# max number of search result pages (and hit counts) cached by each process
+SEARCH_RESULT_CACHE_SIZE = 1000
+# max time (in seconds) search results are cached for. Room results are never
+# cached past their expiry time.
+# Index writes invalidate the cached results, but for this to apply across
+# processes (such as the `update_index` cron job) Django's cache must be shared.
+SEARCH_RESULT_CACHE_TIMEOUT = 60
+# default and max number of results per object type in a search for everything
+SEARCH_ALL_LIMIT = 10
+SEARCH_ALL_MAX_LIMIT = 50
+# time (in seconds) a search for everything waits on each type's search.
+# Searches that take longer are left out of the response.
+SEARCH_ALL_DEADLINE_SECONDS = 2.0
+# number of threads each process runs searches for everything on. Each thread
+# holds a database connection while it searches, and searches that are still
+# queued at their deadline are skipped.
+SEARCH_ALL_WORKERS = 4
+
 # ---------------------------------------------------------------------------- #
 # Email settings
 # ---------------------------------------------------------------------------- #
@@ -288,6 +413,13 @@ else:
 # Django REST framework settings
 # ---------------------------------------------------------------------------- #
 
+# gzip compression of API responses of at least API_COMPRESSION_MIN_SIZE bytes.
+# Levels go from 1 (fastest) to 9 (smallest). Check the ratio and time of
+# each endpoint at `/api/v1/compression/` when changing these.
+API_COMPRESSION_PATH_PREFIX = '/api/v1/'
+API_COMPRESSION_MIN_SIZE = 1024
+API_COMPRESSION_LEVEL = 6
+
 REST_FRAMEWORK = {
     # Use an expiring token-based authentication scheme.
     'DEFAULT_AUTHENTICATION_CLASSES':(
@@ -308,13 +440,16 @@ REST_FRAMEWORK = {
         'rest_framework.permissions.IsAuthenticatedOrReadOnly'
         ],
     
-    # Use JSON format
+    # Use JSON format, or MessagePack for clients that ask for it with the
+    # Accept/Content-Type header or a `.msgpack` format suffix
     'DEFAULT_PARSER_CLASSES': (
         'rest_framework.parsers.JSONParser',
+        'blabbit.apps.rest.parsers.MessagePackParser',
         ),
     
     'DEFAULT_RENDERER_CLASSES': [
         'rest_framework.renderers.JSONRenderer',
+        'blabbit.apps.rest.renderers.MessagePackRenderer',
         'rest_framework.renderers.BrowsableAPIRenderer'
         ],
     
@@ -4,6 +4,8 @@ from django.views.generic.base import TemplateView
 from django.contrib.gis import admin
 admin.autodiscover()
 
+from blabbit import views as blabbit_views
+
 # REST API URLS
 api_urlpatterns = patterns('',
                            url(r'^$', 'blabbit.views.api_root',
@@ -13,6 +15,9 @@ api_urlpatterns = patterns('',
                            url(r'', include('blabbit.apps.explore.urls')),
                            url(r'', include('blabbit.apps.search.urls')),
                            url(r'', include('blabbit.apps.feedback.urls')),
+                           url(r'^compression/$',
+                               blabbit_views.CompressionStats.as_view(),
+                               name='compression-stats'),
                            # login and logout views for the browseable API
                            url(r'^browse/',include('rest_framework.urls', 
                                                    namespace='rest_framework')),
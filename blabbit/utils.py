@@ -6,11 +6,14 @@ Table Of Contents:
   - slugify:         slugify any given string
   - get_upload_path: determine a unique upload path for a given file
   - list_dedup:      dedup a list and preserve order of elements
+  - get_table_columns: get the names of a database table's columns
 
 Author: 
   Nnoduka Eruchalu
 """
 
+from django.db import connection
+
 from datetime import datetime
 import os, re, unicodedata
 
@@ -66,6 +69,20 @@ def list_dedup(in_list):
     return [s for s in in_list if s not in seen and not seen.add(s)]
 
 
+def get_table_columns(table):
+    """
+    Description: Get the names of a database table's columns, such as to check
+                 if a column is missing from a database created before it was
+                 added.
+    
+    Arguments:   - table: name of database table
+    Return:      list of column names
+    """
+    cursor = connection.cursor()
+    return [column[0] for column in
+            connection.introspection.get_table_description(cursor, table)]
+
+
 def human_readable_size(num):
     """
     Description: Present a human readable size size from bytes.
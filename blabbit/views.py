@@ -1,7 +1,10 @@
+from rest_framework import generics, permissions
 from rest_framework.decorators import api_view
 from rest_framework.response import Response
 from rest_framework.reverse import reverse
 
+from blabbit.apps.rest.middleware import get_compression_stats
+
 @api_view(('GET',))
 def api_root(request, format=None):
     return Response({
@@ -12,3 +15,45 @@ def api_root(request, format=None):
             'explore':reverse('explore_root', request=request, format=format),
             'search': reverse('search_root', request=request, format=format),
             })
+
+
+class CompressionStats(generics.GenericAPIView):
+    """
+    Get statistics of this server process' compression of API responses, by
+    endpoint.
+    
+    ## Reading
+    ### Permissions
+    * Only staff users can read this endpoint.
+    
+    ### Fields
+    Reading this endpoint returns an object mapping each endpoint's view name
+    to its statistics:
+    
+    Name          | Description                                  | Type
+    ------------- | -------------------------------------------- | ---------
+    `responses`   | number of responses compression was tried on | _integer_
+    `compressed`  | number of responses sent compressed, the rest didn't get smaller | _integer_
+    `bytes_in`    | total size of responses before compression   | _integer_
+    `bytes_out`   | total size of responses as sent              | _integer_
+    `ratio`       | `bytes_out` / `bytes_in`                     | _float_
+    `mean_ms`     | mean time spent compressing a response, in milliseconds | _float_
+    `clock`       | what `mean_ms` measures: `thread_cpu` (CPU time of the compressing thread) or `wall` (wall clock time, where CPU time can't be measured) | _string_
+    
+    
+    ## Publishing
+    You can't write using this endpoint
+    
+    
+    ## Deleting
+    You can't delete using this endpoint
+    
+    
+    ## Updating
+    You can't update using this endpoint
+    
+    """
+    permission_classes = (permissions.IsAdminUser,)
+    
+    def get(self, request, format=None):
+        return Response(get_compression_stats())